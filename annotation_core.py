@@ -0,0 +1,197 @@
+"""
+The parts of the tool that do not need a window.
+
+The frame model, the conversion of frames to image relative ratios, fitting an
+image into the window and the default paths live here. This module only
+imports the standard library, so exporters, validators, benchmarks and worker
+processes can import it in milliseconds without starting PyGame. The other
+modules without PyGame are journal and background_writer for persistence,
+image_index for listing the images and frame_store for the frames of the
+displayed image. object_framing_tool is the PyGame window on top of them.
+"""
+
+IMAGES_PATH = "img/"    # Images to annotate
+IMAGES_RECURSIVE = False    # Whether the images in the subdirectories of IMAGES_PATH are annotated too
+MANIFEST_PATH = "data/manifest.json"    # Cached list of the images, used while IMAGES_PATH does not change
+DATA_PATH = "data/data.json"    # Frame information
+JOURNAL_PATH = "data/data.journal.jsonl"    # Images committed since DATA_PATH was last written
+COMPACT_EVERY = 100 # The journal is merged into DATA_PATH after this many commits
+STORE_PATH = "data/annotations.sqlite3" # Frame information when it is stored in SQLite instead of DATA_PATH
+PYRAMID_PATH = "data/pyramids/" # Tile pyramids of the very large images
+PROPOSALS_PATH = "data/proposals.jsonl" # Frames proposed for the images, so they are not computed again
+PREDICTIONS_PATH = "data/predictions.json"  # Frames predicted by another program, in the format of DATA_PATH
+QUEUE_PATH = "data/queue.sqlite3"   # Claim table of the images when several annotators share them
+HASHES_PATH = "data/hashes.jsonl"   # Perceptual hashes of the images, so they are not computed again
+DUPLICATES_PATH = "data/duplicates.json"    # Groups of near-duplicate images found by dedupe.py
+EPSILON = 1e-6  # Rounding tolerance of the ratio checks
+
+
+class Frame:
+    """
+    The class to store a box and its information while it is created. The
+    frames of the displayed image are stored in a FrameStore.
+
+    Attributes
+    ----------
+    self.x : int
+        x coordinate of the top-left corner of the frame in the pixels of
+        the full resolution image. Origin is taken as the top-left corner of
+        the image and down-right directions are positive.
+    self.y : int
+        y coordinate of the top-left corner of the frame in the pixels of
+        the full resolution image. Origin is taken as the top-left corner of
+        the image and down-right directions are positive.
+    self.width : int
+        Width of the frame.
+    self.height : int
+        Height of the frame.
+    self.label : string
+        Class of the object in the box.
+
+    """
+    __slots__ = ("x", "y", "width", "height", "label")
+
+    def __init__(self, x, y, height, width, label):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.label = label
+
+
+def jsonify(frame,  img_width_margin, img_height_margin, img_width, img_height):
+    """
+    Converts the pixel coordinates into new coordinates where the x and y coordinates
+    recalculated relative to images top-left taken as 0,0 and images bottom-right
+    taken as 1,1, also height and width are now the ratio of the image's height/width
+    and frame's height/width
+
+    Parameters
+    ----------
+    frame : Frame
+        Frame object to jsonify
+    img_width_margin : int
+        Margin of image to center in window.
+    img_height_margin : int
+        Margin of image to center in window.
+    img_width : int
+        Width of the current image.
+    img_height : int
+        Height of the current image.
+
+    Returns
+    -------
+    List of floats
+        A list where the attributes of the frame converted into a list of floats according to the given description.
+
+    """
+    return [(frame.x - img_width_margin)/img_width, (frame.y - img_height_margin)/img_height, frame.width/img_width, frame.height/img_height, frame.label]
+
+
+def check_frames(frames):
+    """
+    Finds the frames of an image which are malformed, out of the image or
+    have no area.
+
+    Parameters
+    ----------
+    frames : List
+        The jsonified frames of an image.
+
+    Returns
+    -------
+    List of (int, string)
+        Index of every bad frame and what is wrong with it.
+
+    """
+    problems = []
+    for index, frame in enumerate(frames):
+        if not isinstance(frame, list) or len(frame) != 5 or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in frame[:4]) or not isinstance(frame[4], str):
+            problems.append((index, "malformed %r" % (frame,)))
+            continue
+        x, y, w, h = frame[:4]
+        if w <= 0 or h <= 0:
+            problems.append((index, "degenerate, width %g height %g" % (w, h)))
+        if x < -EPSILON or y < -EPSILON or x + w > 1 + EPSILON or y + h > 1 + EPSILON:
+            problems.append((index, "out of bounds, x %g y %g width %g height %g" % (x, y, w, h)))
+    return problems
+
+
+def fit_image(w, h, width, height):
+    """
+    Calculates the size an image is shown with so it fits into the given
+    area, and the margins to center it. The w/h ratio of the image is fixed,
+    images which already fit are not enlarged.
+
+    Parameters
+    ----------
+    w : int
+        Width of the image.
+    h : int
+        Height of the image.
+    width : int
+        Width of the area to show it in.
+    height : int
+        Height of the area to show it in.
+
+    Returns
+    -------
+    int
+        The width the image is shown with.
+    int
+        The height the image is shown with.
+    int, int
+        The margins to center the image in the area.
+
+    """
+    if h / height > 1 or w / width > 1:
+    # If image is not fitting in the window as it is
+        if h / height > w / width:
+        # If height exceeds more
+            w, h = w * height // h, height
+        else:
+        # If width exceeds more or they exceed equally
+            w, h = width, h * width // w
+    return w, h, (width - w) // 2, (height - h) // 2
+
+
+def annotator_paths(annotator):
+    """
+    Returns the data file and the journal of an annotator who shares the
+    images with others, next to DATA_PATH and JOURNAL_PATH.
+
+    Parameters
+    ----------
+    annotator : string
+        Name of the annotator, letters, digits, "-" and "_" only.
+
+    Returns
+    -------
+    string, string
+        Paths of the data file and the journal.
+
+    """
+    if not annotator or not all(c.isalnum() or c in "-_" for c in annotator):
+        raise ValueError("An annotator name can only have letters, digits, '-' and '_', not %r" % annotator)
+    return DATA_PATH[:-len(".json")] + ".%s.json" % annotator, JOURNAL_PATH[:-len(".journal.jsonl")] + ".%s.journal.jsonl" % annotator
+
+
+def resume_index(images, data):
+    """
+    Returns the index of the first image which is not annotated yet, or of
+    the last image if all of them are.
+
+    Parameters
+    ----------
+    images : sequence of strings
+        Image names in the order they are annotated.
+    data : dict
+        Annotations, image names to frame lists.
+
+    Returns
+    -------
+    int
+        Index of the image to start at.
+
+    """
+    return next((index for index, name in enumerate(images) if name not in data), len(images) - 1)
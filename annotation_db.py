@@ -0,0 +1,271 @@
+"""
+SQLite storage of the annotations.
+
+The JSON data file has to be parsed as a whole to answer any question about
+the annotations. This backend keeps them in a SQLite database instead, one
+row per image and one per frame, indexed by image, label and area, so
+questions like "images with more than 50 person frames" or "frames smaller
+than 1% of the image" are answered by the indexes. A commit replaces the
+frames of one image in a transaction, nothing else is rewritten. SQLiteStore
+has the interface of AnnotationJournal, so the tool saves through the
+BackgroundWriter with either of them.
+"""
+import sqlite3
+from contextlib import contextmanager
+
+X, Y, W, H, LABEL = range(5)    # Fields of a jsonified frame
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, boxes INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS labels (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS boxes (
+    image_id INTEGER NOT NULL REFERENCES images (id),
+    position INTEGER NOT NULL,
+    x REAL NOT NULL, y REAL NOT NULL, w REAL NOT NULL, h REAL NOT NULL,
+    label_id INTEGER NOT NULL REFERENCES labels (id),
+    area REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS boxes_image ON boxes (image_id, position);
+CREATE INDEX IF NOT EXISTS boxes_label ON boxes (label_id, image_id);
+CREATE INDEX IF NOT EXISTS boxes_area ON boxes (area);
+"""
+
+
+class SQLiteStore:
+    """
+    Annotations in a SQLite database. Areas are ratios of the image area,
+    like the coordinates.
+
+    Attributes
+    ----------
+    self.path : string
+        Path of the database.
+    self.compact_every : int
+        Kept for the interface of AnnotationJournal, there is nothing to
+        compact.
+    self.pending : int
+        Always 0, every commit is written in place.
+    self.compacts_data : bool
+        False, compact does not need the annotations.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.compact_every = 1
+        self.pending = 0
+        self.compacts_data = False
+        self._labels = {}   # name -> id
+        # Opened on the main thread, written by the background writer
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")  # Durable after every commit, like the journal
+        self._db.execute("PRAGMA cache_size=-65536")    # 64 MB, the indexes of an import stay in memory
+        self._db.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            self._labels.clear()    # Labels added in the transaction are gone
+            raise
+        self._db.execute("COMMIT")
+
+    def _label_id(self, label):
+        label_id = self._labels.get(label)
+        if label_id is None:
+            self._db.execute("INSERT OR IGNORE INTO labels (name) VALUES (?)", (label,))
+            label_id = self._labels[label] = self._db.execute("SELECT id FROM labels WHERE name = ?", (label,)).fetchone()[0]
+        return label_id
+
+    def load(self):
+        """
+        Reads every annotation.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            The annotations, image names to lists of frames.
+
+        """
+        return dict(self.iter_data())
+
+    def iter_data(self):
+        """
+        Yields the images and their frames one image at a time, in the order
+        the images were first committed.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        generator of (string, List)
+            Image names and their jsonified frames.
+
+        """
+        labels = dict(self._db.execute("SELECT id, name FROM labels"))
+        rows = self._db.execute("SELECT images.id, images.name, x, y, w, h, label_id FROM images LEFT JOIN boxes ON boxes.image_id = images.id ORDER BY images.id, position")
+        current, name, frames = None, None, []
+        for image_id, image, x, y, w, h, label_id in rows:
+            if image_id != current:
+                if current is not None: yield name, frames
+                current, name, frames = image_id, image, []
+            if label_id is not None: frames.append([x, y, w, h, labels[label_id]])
+        if current is not None: yield name, frames
+
+    def append(self, image, frames):
+        """
+        Replaces the frames of an image.
+
+        Parameters
+        ----------
+        image : string
+            Name of the image.
+        frames : List
+            The jsonified frames of the image.
+
+        Returns
+        -------
+        bool
+            Always False, there is nothing to compact.
+
+        """
+        self.append_many([(image, frames)])
+        return False
+
+    def append_many(self, records):
+        """
+        Replaces the frames of several images in one transaction.
+
+        Parameters
+        ----------
+        records : iterable of tuples
+            Image names and their jsonified frames.
+
+        Returns
+        -------
+        None
+
+        """
+        with self._transaction():
+            for image, frames in records:
+                # Not an upsert, which needs SQLite 3.24, and not INSERT OR
+                # REPLACE, which would give the image a new id
+                self._db.execute("INSERT OR IGNORE INTO images (name, boxes) VALUES (?, ?)", (image, len(frames)))
+                self._db.execute("UPDATE images SET boxes = ? WHERE name = ?", (len(frames), image))
+                image_id = self._db.execute("SELECT id FROM images WHERE name = ?", (image,)).fetchone()[0]
+                self._db.execute("DELETE FROM boxes WHERE image_id = ?", (image_id,))
+                self._db.executemany("INSERT INTO boxes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+                    (image_id, position, frame[X], frame[Y], frame[W], frame[H], self._label_id(frame[LABEL]), frame[W] * frame[H])
+                    for position, frame in enumerate(frames)])
+
+    def compact(self, data):
+        """
+        Nothing to do, every commit is already in the database. Called by the
+        BackgroundWriter when saving.
+
+        Parameters
+        ----------
+        data : dict
+            The annotations, not used, None when called by the
+            BackgroundWriter.
+
+        Returns
+        -------
+        None
+
+        """
+        self.pending = 0
+
+    def images(self, label=None, min_count=None, max_count=None):
+        """
+        Returns the images with a number of frames in the given range.
+
+        Parameters
+        ----------
+        label : string
+            Only the frames with this label are counted, all frames if None.
+        min_count, max_count : int
+            Inclusive range of the count, unbounded if None.
+
+        Returns
+        -------
+        List of (string, int)
+            Image names and their counts, in the order they were committed.
+
+        """
+        if label is None:
+            query = "SELECT id, name, boxes AS count FROM images"
+            params = []
+        elif min_count:
+            # Images without the label are not counted, the label index has the rest
+            query = "SELECT images.id, images.name, counted.count FROM (SELECT image_id, count(*) AS count FROM boxes WHERE label_id = (SELECT id FROM labels WHERE name = ?) GROUP BY image_id) AS counted JOIN images ON images.id = counted.image_id"
+            params = [label]
+        else:
+            query = "SELECT images.id, images.name, count(boxes.image_id) AS count FROM images LEFT JOIN boxes ON boxes.image_id = images.id AND boxes.label_id = (SELECT id FROM labels WHERE name = ?) GROUP BY images.id"
+            params = [label]
+        query, params = _in_range("SELECT name, count FROM (%s) WHERE 1" % query, params, "count", min_count, max_count)
+        return self._db.execute(query + " ORDER BY id", params).fetchall()
+
+    def boxes(self, label=None, min_area=None, max_area=None):
+        """
+        Yields the frames with an area in the given range.
+
+        Parameters
+        ----------
+        label : string
+            Only the frames with this label, all labels if None.
+        min_area, max_area : float
+            Inclusive range of the area as a ratio of the image area,
+            unbounded if None.
+
+        Returns
+        -------
+        generator of (string, List)
+            Image names and a jsonified frame, ordered by area.
+
+        """
+        query = "SELECT images.name, x, y, w, h, labels.name FROM boxes JOIN images ON images.id = boxes.image_id JOIN labels ON labels.id = boxes.label_id WHERE 1"
+        params = []
+        if label is not None:
+            query += " AND labels.name = ?"
+            params.append(label)
+        query, params = _in_range(query, params, "area", min_area, max_area)
+        for row in self._db.execute(query + " ORDER BY area", params):
+            yield row[0], list(row[1:])
+
+    def close(self):
+        """
+        Closes the database.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def _in_range(query, params, column, low, high):
+    # Adds the conditions of an inclusive range, None is unbounded
+    if low is not None:
+        query += " AND %s >= ?" % column
+        params = params + [low]
+    if high is not None:
+        query += " AND %s <= ?" % column
+        params = params + [high]
+    return query, params
@@ -0,0 +1,142 @@
+"""
+Reads the annotation file one image at a time.
+
+data.json is a single JSON object of image names to frame lists, loading it
+with json.load needs the whole file, and several times its size, in memory.
+iter_annotations parses it incrementally, only one image's frames are held
+at a time, so tools working on the whole data set use a constant amount of
+memory.
+"""
+import json
+import os
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def iter_annotations(path, chunk_size=1 << 20):
+    """
+    Yields the images and their frames from a data file, in file order.
+
+    Parameters
+    ----------
+    path : string
+        Path of the JSON data file.
+    chunk_size : int
+        Number of characters read from the file at a time.
+
+    Returns
+    -------
+    generator of (string, List)
+        Image names and their jsonified frames.
+
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        reader = _Reader(f, chunk_size)
+        if reader.next_char() != "{":
+            raise ValueError("%s does not contain a JSON object" % path)
+        reader.pos += 1
+        if reader.next_char() == "}": return
+        while True:
+            name = reader.value()
+            if reader.next_char() != ":":
+                raise ValueError("Expected ':' at character %d of %s" % (reader.offset(), path))
+            reader.pos += 1
+            reader.next_char()
+            yield name, reader.value()
+            separator = reader.next_char()
+            reader.pos += 1
+            if separator == "}": return
+            if separator != ",":
+                raise ValueError("Expected ',' or '}' at character %d of %s" % (reader.offset(), path))
+            reader.next_char()
+
+
+def iter_dataset(data_path, journal_path=None):
+    """
+    Yields the annotations of the data file with the records of the journal,
+    which are not compacted into it yet, applied on top. Only the journal is
+    loaded into memory, it is small.
+
+    Parameters
+    ----------
+    data_path : string
+        Path of the JSON data file, it may not exist yet.
+    journal_path : string
+        Path of the journal, None or a missing file for no journal.
+
+    Returns
+    -------
+    generator of (string, List)
+        Image names and their jsonified frames. Images which are only in the
+        journal come last.
+
+    """
+    journaled = {}
+    if journal_path is not None and os.path.exists(journal_path):
+        with open(journal_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break   # Torn last record, the tool drops it as well
+                if not line.endswith(b"\n"): break  # So is a last record whose newline was not written
+                journaled[record["image"]] = record["frames"]
+    if os.path.exists(data_path):
+        for name, frames in iter_annotations(data_path):
+            yield name, journaled.pop(name, frames)
+    for name, frames in journaled.items():
+        yield name, frames
+
+
+class _Reader:
+    """
+    A growing window over a text file that JSON values are decoded from.
+    """
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.consumed = 0   # Characters dropped from the front of buf
+        self.eof = False
+
+    def offset(self):
+        return self.consumed + self.pos
+
+    def _fill(self):
+        if self.pos > self.chunk_size:
+            self.consumed += self.pos
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.f.read(self.chunk_size)
+        if not chunk: self.eof = True
+        self.buf += chunk
+
+    def next_char(self):
+        """
+        Skips whitespace and returns the next character, without consuming
+        it. Returns an empty string at the end of the file.
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._fill()
+
+    def value(self):
+        """
+        Decodes and consumes the JSON value at the current position, reading
+        more of the file until the value is complete.
+        """
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:
+                    # A number at the very end of the buffer may continue
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof: raise
+            self._fill()
@@ -0,0 +1,155 @@
+"""
+Writes the annotations to the disk without blocking the main loop.
+
+Syncing the journal and writing the whole data file can take a long time on
+a slow disk or with a big data set. Both are done on a background thread, the
+main loop only hands over what has to be written and carries on. Commits that
+arrive while the thread is busy are appended together with a single sync, and
+save requests which pile up are merged into one write of the latest data.
+"""
+import sys
+import threading
+import time
+from collections import deque
+
+
+class BackgroundWriter:
+    """
+    Background thread in front of an AnnotationJournal.
+
+    The frame lists in the data dict are never changed in place, a commit
+    always puts a new list in the dict. So a snapshot of the data is a copy of
+    the dict only, the frame lists are shared with the live data.
+
+    Attributes
+    ----------
+    self.journal : AnnotationJournal
+        Where the annotations are written to.
+    self.data : dict
+        The live annotations of the program, image names to frame lists.
+    self.latencies : deque of floats
+        Seconds the last writes took, the most recent one is the last.
+    self.error : Exception
+        The last error the thread ran into, None if there was none.
+    self.profiler : StageProfiler
+        Times the writes as the "save" stage, None to time nothing.
+
+    """
+    def __init__(self, journal, data, profiler=None):
+        self.journal = journal
+        self.data = data
+        self.profiler = profiler
+        self.latencies = deque(maxlen=256)
+        self.error = None
+        self._cond = threading.Condition()
+        self._records = []  # Commits waiting to be appended to the journal
+        self._save = False  # Whether the data file has to be rewritten
+        self._busy = False  # Whether the thread is writing right now
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self._thread.start()
+
+    def commit(self, image, frames):
+        """
+        Queues the frames of an image to be appended to the journal.
+
+        Parameters
+        ----------
+        image : string
+            Name of the image.
+        frames : List
+            The jsonified frames of the image.
+
+        Returns
+        -------
+        None
+
+        """
+        with self._cond:
+            self._records.append((image, frames))
+            self._cond.notify()
+
+    def save(self):
+        """
+        Asks for the data file to be rewritten with the data as it is when
+        the thread gets to it.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        with self._cond:
+            self._save = True
+            self._cond.notify()
+
+    def flush(self):
+        """
+        Waits until everything that was queued is written.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        with self._cond:
+            while (self._records or self._save or self._busy) and self._thread.is_alive():
+                self._cond.wait()
+
+    def close(self):
+        """
+        Writes everything that is queued, stops the thread and closes the
+        journal. Calling it again does nothing.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        if self._closed: return
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.journal.close()
+        if self.latencies:
+            print("Saved %d times, %.1f ms on average, %.1f ms at most" % (len(self.latencies), 1000 * sum(self.latencies) / len(self.latencies), 1000 * max(self.latencies)))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._records and not self._save and not self._closed:
+                    self._cond.wait()
+                if self._closed: return
+                records, self._records = self._records, []
+                save, self._save = self._save, False
+                self._busy = True
+            start = time.perf_counter()
+            try:
+                if records:
+                    self.journal.append_many(records)   # One sync for all of them
+                if save or self.journal.pending >= self.journal.compact_every:
+                    # Snapshot, the main loop may go on changing data. A store
+                    # which does not need the data is not given a copy.
+                    self.journal.compact(self.data.copy() if self.journal.compacts_data else None)
+                self.latencies.append(time.perf_counter() - start)
+                if self.profiler is not None: self.profiler.record("save", self.latencies[-1])
+            except Exception as error:
+                self.error = error
+                print("Could not save the annotations: %s" % error, file=sys.stderr)
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
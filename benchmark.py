@@ -0,0 +1,299 @@
+"""
+Times the paths of the tool that decide how it feels to use: loading an image,
+drawing the frames and the info window, finding and deleting frames,
+converting them to ratios and saving the annotations.
+
+Runs without a window using the dummy video driver. Synthetic images of the
+given resolutions and formats are written to a temporary workspace, the tool is
+imported inside it and its functions are called directly. The results are
+written as JSON, compare them with an older run to catch regressions.
+
+>>> python3 benchmark.py [--out benchmark.json] [--compare old.json]
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Headless, has to be set before PyGame is imported
+import argparse
+import importlib
+import json
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pygame
+
+from annotation_core import jsonify
+
+LABELS = ["car", "person", "bicycle", "dog"]    # Labels the tool is started with
+QUERIES = 1000  # Points looked up for each find_frame measurement
+DELETES = 200   # Frames deleted for each delete_frame measurement
+FRAMES_PER_IMAGE = 10   # Frames of each image in the saved data sets
+
+
+def parse_sizes(text):
+    """
+    Parses a comma separated list of WIDTHxHEIGHT sizes.
+    """
+    sizes = []
+    for item in text.split(","):
+        w, h = item.lower().split("x")
+        sizes.append((int(w), int(h)))
+    return sizes
+
+
+def parse_ints(text):
+    return [int(item) for item in text.split(",")]
+
+
+def make_image(path, size, rng):
+    """
+    Writes a synthetic photo-like image, a gradient with noise and a few
+    shapes, so the encoders have realistic work to do.
+    """
+    w, h = size
+    gradient = np.linspace(0, 200, w, dtype=np.float32)[:, None]
+    pixels = np.empty((w, h, 3), dtype=np.float32)
+    pixels[..., 0] = gradient
+    pixels[..., 1] = np.linspace(0, 160, h, dtype=np.float32)[None, :]
+    pixels[..., 2] = 255 - gradient
+    pixels += rng.normal(0, 12, (w, h, 3)).astype(np.float32)
+    surface = pygame.surfarray.make_surface(np.clip(pixels, 0, 255).astype(np.uint8))
+    for _ in range(8):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        radius = int(rng.integers(min(w, h) // 20, min(w, h) // 5))
+        pygame.draw.circle(surface, color, (int(rng.integers(0, w)), int(rng.integers(0, h))), radius)
+    pygame.image.save(surface, path)
+
+
+def measure(fn, repeat, number=1, setup=None):
+    """
+    Runs fn number times for every repetition and returns the seconds a
+    single call took in every repetition. setup is called before every
+    repetition and is not timed.
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup is not None: setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def result(name, params, samples, number=1):
+    return {
+        "name": name,
+        "params": params,
+        "unit": "s",
+        "repeat": len(samples),
+        "number": number,
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "max": max(samples),
+    }
+
+
+def random_frames(tool, count, rng):
+    """
+    Places frames the size of objects in a crowd image on the displayed
+    image, some of them nested in each other. Returns them as jsonified
+    frames.
+    """
+    entries = []
+    for _ in range(count):
+        w = int(rng.integers(8, max(9, tool.img_width // 6)))
+        h = int(rng.integers(8, max(9, tool.img_height // 4)))
+        x = int(rng.integers(0, tool.img_width - w))
+        y = int(rng.integers(0, tool.img_height - h))
+        entries.append([x / tool.img_width, y / tool.img_height, w / tool.img_width, h / tool.img_height, LABELS[int(rng.integers(len(LABELS)))]])
+    return entries
+
+
+def load_frames(tool, entries):
+    tool.frames.load(entries, 0, 0, tool.img_width, tool.img_height)
+    tool.selected_frame = 0 if entries else None
+
+
+def bench_load(tool, image_paths, args):
+    results = []
+    for (size, fmt), path in image_paths.items():
+        samples = measure(lambda: tool.load_image(path), args.repeat)
+        results.append(result("load_image", {"resolution": "%dx%d" % size, "format": fmt, "bytes": os.path.getsize(path)}, samples))
+        print("load_image %dx%d %s: %.2f ms" % (size + (fmt, 1e3 * results[-1]["median"])))
+    return results
+
+
+def bench_frames(tool, count, args, rng):
+    """
+    Measures the per frame paths with count frames on the displayed image.
+    """
+    results = []
+    params = {"frames": count, "window": "%dx%d" % (tool.width, tool.height)}
+    entries = random_frames(tool, count, rng)
+    load_frames(tool, entries)
+    tool.screen.set_clip(None)
+
+    samples = measure(tool.draw_frames, args.repeat, number=5)
+    results.append(result("draw_frames", params, samples, 5))
+    samples = measure(tool.draw_info, args.repeat, number=20)
+    results.append(result("draw_info", params, samples, 20))
+    samples = measure(lambda: tool.redraw(tool.screen.get_rect()), args.repeat, number=5)
+    results.append(result("redraw", params, samples, 5))
+
+    left, top, shown_width, shown_height = tool.view.image_rect()
+    points = [(left + int(rng.integers(shown_width)), top + int(rng.integers(shown_height))) for _ in range(QUERIES)]
+    samples = measure(lambda: [tool.find_frame(x, y) for x, y in points], args.repeat)
+    results.append(result("find_frame", params, [s / QUERIES for s in samples], QUERIES))
+
+    deletes = min(count, DELETES)
+    centers = []
+    for x, y, w, h, _ in entries[:deletes]:
+        centers.append(tool.view.to_screen((x + w / 2) * tool.img_width, (y + h / 2) * tool.img_height))
+    samples = measure(lambda: [tool.delete_frame(x, y) for x, y in centers], args.repeat, setup=lambda: load_frames(tool, entries))
+    results.append(result("delete_frame", params, [s / deletes for s in samples], deletes))
+    load_frames(tool, entries)
+
+    objects = [tool.Frame(x, y, h, w, tool.frames.labels[label]) for x, y, w, h, label in tool.frames.rows()]
+    samples = measure(lambda: [jsonify(f, 0, 0, tool.img_width, tool.img_height) for f in objects], args.repeat)
+    results.append(result("jsonify", params, samples))
+    samples = measure(lambda: tool.frames.normalized(0, 0, tool.img_width, tool.img_height), args.repeat)
+    results.append(result("normalized", params, samples))
+
+    print("%d frames: %s" % (count, ", ".join("%s %.3f ms" % (r["name"], 1e3 * r["median"]) for r in results)))
+    return results
+
+
+def bench_save(tool, count, args, rng):
+    """
+    Measures saving a data set of count images, from the request until the
+    file is written.
+    """
+    tool.data.clear()
+    for index in range(count):
+        tool.data["synthetic_%07d.jpg" % index] = random_frames(tool, FRAMES_PER_IMAGE, rng)
+
+    def save():
+        tool.save_curr_frames()
+        tool.writer.flush()     # save_curr_frames only queues the write
+
+    samples = measure(save, args.repeat)
+    size = os.path.getsize(tool.DATA_PATH)
+    tool.data.clear()
+    print("save_curr_frames %d images: %.2f ms" % (count, 1e3 * statistics.median(samples)))
+    return [result("save_curr_frames", {"images": count, "frames": count * FRAMES_PER_IMAGE, "bytes": size}, samples)]
+
+
+def environment():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    """
+    Prints the measurements which are slower than in the baseline by more
+    than the tolerance. Returns how many there are.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in baseline["results"]}
+    regressions = 0
+    for r in results:
+        before = old.get((r["name"], json.dumps(r["params"], sort_keys=True)))
+        if before is None or before["median"] <= 0: continue
+        ratio = r["median"] / before["median"]
+        if ratio > 1 + tolerance:
+            regressions += 1
+            print("Slower: %s %s %.3f ms -> %.3f ms (%.2fx)" % (r["name"], r["params"], 1e3 * before["median"], 1e3 * r["median"], ratio))
+    print("%d of %d measurements are more than %d%% slower than %s" % (regressions, len(results), 100 * tolerance, baseline_path))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark loading, drawing, hit testing and saving of the tool.")
+    parser.add_argument("--out", default="benchmark.json", help="result file (default: %(default)s)")
+    parser.add_argument("--resolutions", type=parse_sizes, default=parse_sizes("640x480,1920x1080,4032x3024"), help="image sizes as WIDTHxHEIGHT,... (default: 640x480,1920x1080,4032x3024)")
+    parser.add_argument("--formats", default="png,jpg,bmp", help="image formats (default: %(default)s)")
+    parser.add_argument("--frames", type=parse_ints, default=parse_ints("10,100,1000,5000"), help="frames per image (default: 10,100,1000,5000)")
+    parser.add_argument("--datasets", type=parse_ints, default=parse_ints("100,1000,10000"), help="annotated images in the saved data (default: 100,1000,10000)")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of every measurement (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data (default: %(default)s)")
+    parser.add_argument("--compare", metavar="BASELINE", help="an earlier result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown reported as a regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+
+    workspace = tempfile.mkdtemp(prefix="bilge-benchmark-")
+    cwd = os.getcwd()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        os.makedirs(os.path.join(workspace, "img"))
+        os.makedirs(os.path.join(workspace, "data"))
+        pygame.init()
+        image_paths = {}
+        for size in args.resolutions:
+            for fmt in args.formats.split(","):
+                path = os.path.join(workspace, "img", "%dx%d.%s" % (size + (fmt,)))
+                make_image(path, size, rng)
+                image_paths[size, fmt] = path
+
+        os.chdir(workspace)     # The tool uses paths relative to where it is started
+        tool = importlib.import_module("object_framing_tool")
+        tool.init(LABELS)
+        try:
+            results = bench_load(tool, image_paths, args)
+            largest = max(image_paths, key=lambda key: key[0][0] * key[0][1])
+            tool.img = tool.load_image(image_paths[largest])
+            tool.img_width, tool.img_height = tool.img.size
+            tool.view.set_image(tool.img_width, tool.img_height)
+            for count in args.frames:
+                results += bench_frames(tool, count, args, rng)
+            for count in args.datasets:
+                results += bench_save(tool, count, args, rng)
+            window = "%dx%d" % (tool.width, tool.height)
+        finally:
+            tool.prefetcher.shutdown()
+            tool.writer.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    report = {"environment": environment(), "window": window, "config": {
+        "resolutions": ["%dx%d" % size for size in args.resolutions],
+        "formats": args.formats.split(","),
+        "frames": args.frames,
+        "datasets": args.datasets,
+        "repeat": args.repeat,
+        "seed": args.seed,
+    }, "results": results}
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Wrote %d measurements to %s" % (len(results), out))
+    if baseline is not None and compare(results, baseline, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
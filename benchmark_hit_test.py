@@ -0,0 +1,104 @@
+"""
+Compares finding frames under the mouse with the spatial index against
+looking at every frame one by one, like find_frame used to do.
+
+Run it with
+>>> python3 benchmark_hit_test.py [FRAME_COUNT] [FRAME_COUNT] ...
+"""
+import random
+import sys
+import timeit
+
+from spatial_index import GridIndex
+
+WINDOW = 1536, 864  # Size of the area the frames are placed in
+QUERIES = 2000  # Number of points looked up for each measurement
+
+
+class Box:
+    """
+    Minimal stand-in for the tool's Frame class.
+    """
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+
+def random_boxes(count, rng):
+    """
+    Creates boxes the size of objects in a crowd image, some of them nested
+    in each other.
+    """
+    boxes = []
+    for _ in range(count):
+        w = rng.randint(8, 120)
+        h = rng.randint(8, 160)
+        boxes.append(Box(rng.randint(0, WINDOW[0] - w), rng.randint(0, WINDOW[1] - h), w, h))
+    return boxes
+
+
+def linear_find(boxes, x, y):
+    """
+    The linear scan find_frame used before the spatial index.
+    """
+    for index, frame in enumerate(boxes):
+        if 0 <= x - frame.x <= frame.width and 0 <= y - frame.y <= frame.height:
+            return index
+
+
+def linear_smallest(boxes, x, y):
+    """
+    A linear scan which picks the smallest containing box like the index
+    does, it has to look at every box.
+    """
+    best = None
+    for index, frame in enumerate(boxes):
+        if 0 <= x - frame.x <= frame.width and 0 <= y - frame.y <= frame.height:
+            if best is None or frame.width * frame.height < boxes[best].width * boxes[best].height:
+                best = index
+    return best
+
+
+def bench(count, rng):
+    boxes = random_boxes(count, rng)
+    points = [(rng.randrange(WINDOW[0]), rng.randrange(WINDOW[1])) for _ in range(QUERIES)]
+
+    index = GridIndex()
+    build = timeit.timeit(lambda: [index.insert(b, b.x, b.y, b.width, b.height) for b in boxes], number=1)
+
+    linear = min(timeit.repeat(lambda: [linear_find(boxes, x, y) for x, y in points], number=1, repeat=3))
+    smallest = min(timeit.repeat(lambda: [linear_smallest(boxes, x, y) for x, y in points], number=1, repeat=3))
+    grid = min(timeit.repeat(lambda: [index.query_point(x, y) for x, y in points], number=1, repeat=3))
+
+    def move():
+        for b in boxes[:QUERIES]:
+            b.x = min(b.x + 1, WINDOW[0] - b.width)
+            index.update(b, b.x, b.y, b.width, b.height)
+    update = timeit.timeit(move, number=1) / min(count, QUERIES)
+
+    region = min(timeit.repeat(lambda: index.query_rect(400, 300, 300, 200), number=100, repeat=3)) / 100
+    return {
+        "frames": count,
+        "linear_us": linear / QUERIES * 1e6,
+        "smallest_us": smallest / QUERIES * 1e6,
+        "grid_us": grid / QUERIES * 1e6,
+        "build_ms": build * 1e3,
+        "update_us": update * 1e6,
+        "rect_query_us": region * 1e6,
+    }
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100, 500, 2000, 5000]
+    rng = random.Random(0)
+    print("Per query times, 'first' is the old first match scan, 'smallest' a scan picking the smallest box")
+    print("%8s %12s %14s %10s %9s %11s %12s %10s" % ("frames", "first (us)", "smallest (us)", "grid (us)", "speedup", "build (ms)", "update (us)", "rect (us)"))
+    for count in counts:
+        r = bench(count, rng)
+        print("%8d %12.2f %14.2f %10.2f %8.1fx %11.2f %12.2f %10.1f" % (r["frames"], r["linear_us"], r["smallest_us"], r["grid_us"], r["smallest_us"] / r["grid_us"], r["build_ms"], r["update_us"], r["rect_query_us"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+"""
+Finds the near-duplicate images before they are annotated.
+
+Scraped image folders hold the same scene many times, a little cropped,
+resized or recompressed. Every image is reduced to a 64 bit perceptual hash,
+computed from a tiny grayscale thumbnail by a pool of worker processes, and
+images whose hashes differ in a few bits are grouped: an image joins the
+group of the nearest earlier image within the radius, found with a BK-tree,
+or starts a group of its own. The hashes are cached in HASHES_PATH, only new
+and changed images are hashed again, and the groups are written to
+DUPLICATES_PATH where the tool reads them to skip the duplicates or to start
+them with the frames of an annotated image of their group.
+
+>>> python3 dedupe.py [--method dhash] [--radius 6] [--workers N]
+"""
+import argparse
+import json
+import os
+import sys
+from functools import partial
+
+import numpy as np
+import pygame
+
+from annotation_core import IMAGES_PATH, IMAGES_RECURSIVE, MANIFEST_PATH, HASHES_PATH, DUPLICATES_PATH
+from image_index import ImageIndex
+from journal import write_json_atomic
+from parallel import batched, ordered_map
+
+try:
+    from PIL import Image   # Optional, decodes JPEGs at a fraction of their size
+except ImportError:
+    Image = None
+
+BATCH_SIZE = 64 # Images hashed by a worker at once
+DEFAULT_RADIUS = 6  # Images whose hashes differ in at most this many of the 64 bits are duplicates
+THUMBNAIL_SIZES = {"dhash": (9, 8), "phash": (32, 32)}  # Width and height of the thumbnail of every method
+
+
+def gray_thumbnail(path, size):
+    """
+    Decodes an image into a small grayscale thumbnail.
+
+    Parameters
+    ----------
+    path : string
+        Path of the image.
+    size : int, int
+        Width and height of the thumbnail.
+
+    Returns
+    -------
+    numpy array
+        Brightness of the pixels as floats, in rows.
+
+    """
+    if Image is not None:
+        with Image.open(path) as image:
+            image.draft("L", (size[0] * 8, size[1] * 8))    # Nearly free for JPEGs
+            return np.asarray(image.convert("L").resize(size, Image.BOX), np.float64)
+    surface = pygame.image.load(path)
+    if surface.get_bitsize() < 24:
+        # smoothscale needs 24 or 32 bit pixels, there is no display to convert to
+        converted = pygame.Surface(surface.get_size(), 0, 24)
+        converted.blit(surface, (0, 0))
+        surface = converted
+    pixels = pygame.surfarray.array3d(pygame.transform.smoothscale(surface, size)).swapaxes(0, 1)
+    return pixels @ np.array([0.299, 0.587, 0.114])
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(32)
+
+
+def image_hash(path, method):
+    """
+    Computes the perceptual hash of an image. dhash compares neighbouring
+    pixels of a 9x8 thumbnail, phash compares the lowest frequencies of a
+    32x32 thumbnail with their median, it is slower but survives more edits.
+
+    Parameters
+    ----------
+    path : string
+        Path of the image.
+    method : string
+        "dhash" or "phash".
+
+    Returns
+    -------
+    int
+        The 64 bit hash.
+
+    """
+    pixels = gray_thumbnail(path, THUMBNAIL_SIZES[method])
+    if method == "dhash":
+        bits = pixels[:, 1:] > pixels[:, :-1]
+    else:
+        low = (_DCT @ pixels @ _DCT.T)[:8, :8]
+        bits = low > np.median(low.ravel()[1:])  # Without the average brightness
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def hash_batch(root, method, batch):
+    """
+    Hashes a batch of images. Runs in the worker processes.
+
+    Parameters
+    ----------
+    root : string
+        Directory of the images.
+    method : string
+        "dhash" or "phash".
+    batch : List of (string, string)
+        Image names and their cache keys.
+
+    Returns
+    -------
+    List of (string, string, int)
+        Image names, their cache keys and hashes, the hash is None if the
+        image could not be decoded.
+
+    """
+    hashed = []
+    for name, key in batch:
+        try:
+            value = image_hash(os.path.join(root, name), method)
+        except (pygame.error, OSError, ValueError) as e:
+            print("%s could not be hashed: %s" % (name, e), file=sys.stderr)
+            value = None
+        hashed.append((name, key, value))
+    return hashed
+
+
+def distance(a, b):
+    """
+    Returns the number of bits two hashes differ in.
+    """
+    return bin(a ^ b).count("1")
+
+
+class HashCache:
+    """
+    The hashes computed so far, in memory and in a JSON lines file. Every
+    line is {"image": name, "key": key, "hash": hash}, later lines win.
+
+    Attributes
+    ----------
+    self.path : string
+        Path of the cache file.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}  # name -> (key, hash)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue    # Torn write, the image is hashed again
+                    self._entries[record["image"]] = (record["key"], record["hash"])
+
+    def get(self, name, key):
+        """
+        Returns the cached hash of an image, None if it is not cached for
+        this key.
+        """
+        entry = self._entries.get(name)
+        if entry is None or entry[0] != key: return None
+        return entry[1]
+
+    def put_many(self, records):
+        """
+        Caches the hashes of images and appends them to the file.
+
+        Parameters
+        ----------
+        records : List of (string, string, int)
+            Image names, their cache keys and hashes.
+
+        Returns
+        -------
+        None
+
+        """
+        with open(self.path, "a") as f:
+            for name, key, value in records:
+                self._entries[name] = (key, value)
+                f.write(json.dumps({"image": name, "key": key, "hash": value}) + "\n")
+
+
+def cache_key(root, name, method):
+    """
+    Returns the cache key of an image, it changes with the method and when
+    the image is changed on disk.
+    """
+    stat = os.stat(os.path.join(root, name))
+    return "%s|%d|%d" % (method, stat.st_mtime_ns, stat.st_size)
+
+
+class BKTree:
+    """
+    A metric tree of hashes, finds every hash within a distance of a hash
+    without comparing it with all of them. The children of a node are keyed
+    by their distance to it, by the triangle inequality only the children
+    whose key is within the radius of the distance to the node can hold
+    matches.
+    """
+    def __init__(self):
+        self._root = None   # [hash, items, {distance: child}]
+
+    def add(self, value, item):
+        """
+        Adds an item with its hash.
+
+        Parameters
+        ----------
+        value : int
+            The hash.
+        item : object
+            What is returned when the hash is found.
+
+        Returns
+        -------
+        None
+
+        """
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            d = distance(value, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, radius):
+        """
+        Finds the items whose hashes are within a distance of a hash.
+
+        Parameters
+        ----------
+        value : int
+            The hash.
+        radius : int
+            Largest distance of the matches.
+
+        Returns
+        -------
+        List of (int, object)
+            Distances and items of the matches, in no particular order.
+
+        """
+        found = []
+        pending = [self._root] if self._root is not None else []
+        while pending:
+            node = pending.pop()
+            d = distance(value, node[0])
+            if d <= radius: found.extend((d, item) for item in node[1])
+            pending.extend(child for key, child in node[2].items() if d - radius <= key <= d + radius)
+        return found
+
+
+def cluster(hashes, radius):
+    """
+    Groups the images whose hashes are within the radius of the first image
+    of the group. An image joins the group with the nearest first image, the
+    earliest one if they are equally near, so images never chain into groups
+    of images which do not look alike.
+
+    Parameters
+    ----------
+    hashes : List of (string, int)
+        Image names and their hashes, in the order the images are annotated.
+    radius : int
+        Largest distance of a duplicate to the first image of its group.
+
+    Returns
+    -------
+    List of Lists of strings
+        The groups with more than one image, each in the order of the images.
+
+    """
+    tree = BKTree()
+    groups = {}
+    for order, (name, value) in enumerate(hashes):
+        matches = tree.search(value, radius)
+        if matches:
+            groups[min(matches)[1][1]].append(name)
+        else:
+            tree.add(value, (order, name))
+            groups[name] = [name]
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_duplicates(root, names, method, radius, cache, workers=None):
+    """
+    Hashes the images which are not cached and groups the near-duplicates.
+
+    Parameters
+    ----------
+    root : string
+        Directory of the images.
+    names : iterable of strings
+        Image names in the order they are annotated.
+    method : string
+        "dhash" or "phash".
+    radius : int
+        Largest distance of a duplicate to the first image of its group.
+    cache : HashCache
+        The cached hashes, the new ones are added to it.
+    workers : int
+        Number of processes hashing, the number of CPUs if None.
+
+    Returns
+    -------
+    List of Lists of strings
+        The groups of near-duplicates, as returned by cluster.
+
+    """
+    names = list(names)
+    keys = [cache_key(root, name, method) for name in names]
+    missing = [(name, key) for name, key in zip(names, keys) if cache.get(name, key) is None]
+    for hashed in ordered_map(partial(hash_batch, root, method), batched(missing, BATCH_SIZE), workers):
+        cache.put_many([record for record in hashed if record[2] is not None])
+    hashes = [(name, cache.get(name, key)) for name, key in zip(names, keys)]
+    return cluster([(name, value) for name, value in hashes if value is not None], radius)
+
+
+def load_groups(path):
+    """
+    Reads the groups of near-duplicates written by this script.
+
+    Parameters
+    ----------
+    path : string
+        Path of the duplicates file, it may not exist.
+
+    Returns
+    -------
+    dict
+        Image names to the list of images in their group, the images without
+        duplicates are not in it.
+
+    """
+    if not os.path.exists(path): return {}
+    with open(path, "r") as f:
+        groups = json.load(f)["groups"]
+    return {name: group for group in groups for name in group}
+
+
+class DistinctImages:
+    """
+    The images of an image index without the duplicates, indexed like a list
+    which grows while the index does. It can be used in place of the
+    ImageIndex.
+
+    Attributes
+    ----------
+    self.index : ImageIndex
+        All images.
+    self.skipped : set of strings
+        Images which are left out.
+
+    """
+    def __init__(self, index, skipped):
+        self.index = index
+        self.skipped = skipped
+        self._names = []
+        self._scanned = 0   # Images of the index looked at so far
+
+    @property
+    def complete(self):
+        return self.index.complete and self._scanned == len(self.index)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, index):
+        return self._names[index]
+
+    def __iter__(self):
+        index = 0
+        while self.wait_for(index + 1):
+            yield self._names[index]
+            index += 1
+
+    def wait_for(self, count):
+        """
+        Waits until there are at least the given number of images or the
+        index is complete.
+
+        Parameters
+        ----------
+        count : int
+            Number of images needed.
+
+        Returns
+        -------
+        bool
+            True if there are at least count images.
+
+        """
+        while len(self._names) < count:
+            listed = len(self.index)
+            if listed > self._scanned:
+                self._names.extend(name for name in self.index[self._scanned:listed] if name not in self.skipped)
+                self._scanned = listed
+                continue
+            if self.index.complete and self._scanned == len(self.index): return False
+            self.index.wait_for(self._scanned + 1)  # Until more images are listed
+        return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Group the near-duplicate images so the tool can skip them or copy their frames.")
+    parser.add_argument("--images", default=IMAGES_PATH, help="image directory (default: %(default)s)")
+    parser.add_argument("--method", choices=sorted(THUMBNAIL_SIZES), default="dhash", help="perceptual hash (default: %(default)s)")
+    parser.add_argument("--radius", type=int, default=DEFAULT_RADIUS, help="bits a duplicate's hash may differ in (default: %(default)s)")
+    parser.add_argument("--out", default=DUPLICATES_PATH, help="file of the groups (default: %(default)s)")
+    parser.add_argument("--cache", default=HASHES_PATH, help="cache of the hashes (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: number of CPUs)")
+    args = parser.parse_args(argv)
+    manifest_path = MANIFEST_PATH if args.images == IMAGES_PATH else None  # The manifest is of IMAGES_PATH only
+    names = list(ImageIndex(args.images, IMAGES_RECURSIVE, manifest_path=manifest_path))
+    groups = find_duplicates(args.images, names, args.method, args.radius, HashCache(args.cache), args.workers)
+    write_json_atomic(args.out, {"method": args.method, "radius": args.radius, "groups": groups})
+    duplicates = sum(len(group) - 1 for group in groups)
+    print("%d images, %d groups of near-duplicates, %d images can be skipped, written to %s" % (len(names), len(groups), duplicates, args.out))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
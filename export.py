@@ -0,0 +1,289 @@
+"""
+Exports the annotations to the formats training pipelines read.
+
+The annotation file is streamed one image at a time, the image sizes are read
+from the file headers by a pool of worker processes, and the output is written
+in the order of the annotation file. Memory use does not grow with the size of
+the data set and the same input always gives the same output.
+
+>>> python3 export.py coco [--out export/annotations.json]
+>>> python3 export.py yolo [--out export/yolo]
+>>> python3 export.py voc [--out export/voc]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from functools import partial
+from xml.sax.saxutils import escape
+
+from annotation_core import IMAGES_PATH, DATA_PATH, JOURNAL_PATH
+from annotation_stream import iter_dataset
+from image_header import image_size
+from parallel import batched, ordered_map
+
+BATCH_SIZE = 256    # Images handed to a worker at once
+
+
+def measure_batch(images_root, batch):
+    """
+    Reads the sizes of a batch of images. Runs in the worker processes.
+
+    Parameters
+    ----------
+    images_root : string
+        Directory of the images.
+    batch : List of (string, List)
+        Image names and their jsonified frames.
+
+    Returns
+    -------
+    List of (string, tuple, List)
+        Image names, their width and height or None if the image could not be
+        read or its frames are None, and their frames.
+
+    """
+    measured = []
+    for name, frames in batch:
+        if frames is None:
+            measured.append((name, None, frames))
+            continue
+        try:
+            size = image_size(os.path.join(images_root, name))
+        except (OSError, ValueError):
+            size = None
+        measured.append((name, size, frames))
+    return measured
+
+
+def _is_frame(frame):
+    return isinstance(frame, list) and len(frame) == 5 and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in frame[:4]) and isinstance(frame[4], str)
+
+
+def iter_checked(args):
+    """
+    Yields every annotated image like iter_dataset, with the malformed frames
+    left out. They are reported, like images whose frames are not a list,
+    which are yielded with None as their frames.
+
+    Parameters
+    ----------
+    args : argparse Namespace
+        Command line arguments.
+
+    Returns
+    -------
+    generator of (string, List)
+        Image names and their well-formed frames, None if they are not a
+        list.
+
+    """
+    for name, frames in iter_dataset(args.data, args.journal):
+        if not isinstance(frames, list):
+            print("%s: not a list of frames but %r, skipped" % (name, frames), file=sys.stderr)
+            yield name, None
+            continue
+        if not all(map(_is_frame, frames)):
+            for index, frame in enumerate(frames):
+                if not _is_frame(frame): print("%s: frame %d is malformed %r, left out" % (name, index, frame), file=sys.stderr)
+            frames = [frame for frame in frames if _is_frame(frame)]
+        yield name, frames
+
+
+def iter_measured(args):
+    """
+    Yields every annotated image with its size, in the order of the
+    annotation file.
+
+    Parameters
+    ----------
+    args : argparse Namespace
+        Command line arguments.
+
+    Returns
+    -------
+    generator of (string, tuple, List)
+        As returned by measure_batch.
+
+    """
+    batches = batched(iter_checked(args), BATCH_SIZE)
+    for measured in ordered_map(partial(measure_batch, args.images), batches, args.workers):
+        for record in measured:
+            yield record
+
+
+class LabelIds:
+    """
+    Gives every label a number, in the order they were given on the command
+    line, then in the order they first appear in the annotations.
+    """
+    def __init__(self, labels, start):
+        self.start = start
+        self.ids = {}
+        for label in labels:
+            self.get(label)
+
+    def get(self, label):
+        if label not in self.ids: self.ids[label] = self.start + len(self.ids)
+        return self.ids[label]
+
+    def names(self):
+        return sorted(self.ids, key=self.ids.get)
+
+
+def pixel_boxes(frames, width, height):
+    """
+    Converts jsonified frames into pixel coordinates of the image.
+
+    Parameters
+    ----------
+    frames : List of lists
+        Ratios and labels as written by the tool.
+    width : int
+        Width of the image.
+    height : int
+        Height of the image.
+
+    Returns
+    -------
+    List of tuples
+        x, y, width, height and label of every frame.
+
+    """
+    return [(frame[0] * width, frame[1] * height, frame[2] * width, frame[3] * height, frame[4]) for frame in frames]
+
+
+def export_coco(args):
+    labels = LabelIds(args.labels, 1)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    skipped = 0
+    annotation_id = 0
+    image_id = 0
+    try:
+        with open(args.out + ".tmp", "w") as out, tempfile.TemporaryFile("w+") as annotations:
+            # Annotations are spooled to a temporary file while the images are written
+            out.write('{"images": [')
+            for name, size, frames in iter_measured(args):
+                if size is None:
+                    skipped += 1
+                    continue
+                image_id += 1
+                out.write("%s\n%s" % ("," if image_id > 1 else "", json.dumps({"id": image_id, "file_name": name, "width": size[0], "height": size[1]})))
+                for x, y, w, h, label in pixel_boxes(frames, *size):
+                    annotation_id += 1
+                    annotation = {"id": annotation_id, "image_id": image_id, "category_id": labels.get(label), "bbox": [round(x, 2), round(y, 2), round(w, 2), round(h, 2)], "area": round(w * h, 2), "iscrowd": 0}
+                    annotations.write("%s\n%s" % ("," if annotation_id > 1 else "", json.dumps(annotation)))
+            out.write('\n], "annotations": [')
+            annotations.seek(0)
+            for chunk in iter(lambda: annotations.read(1 << 20), ""):
+                out.write(chunk)
+            categories = [{"id": labels.ids[label], "name": label, "supercategory": "none"} for label in labels.names()]
+            out.write('\n], "categories": %s}\n' % json.dumps(categories))
+        os.replace(args.out + ".tmp", args.out)
+    finally:
+        if os.path.exists(args.out + ".tmp"): os.remove(args.out + ".tmp")  # Left behind only if the export failed
+    return image_id, annotation_id, skipped
+
+
+def export_yolo(args):
+    # YOLO stores ratios of the image size, exactly what the tool stores, so
+    # the images do not have to be read at all
+    labels = LabelIds(args.labels, 0)
+    count = boxes = skipped = 0
+    for name, frames in iter_checked(args):
+        if frames is None:
+            skipped += 1
+            continue
+        lines = ["%d %.6f %.6f %.6f %.6f\n" % (labels.get(f[4]), f[0] + f[2] / 2, f[1] + f[3] / 2, f[2], f[3]) for f in frames]
+        write_text(os.path.join(args.out, "labels", os.path.splitext(name)[0] + ".txt"), "".join(lines))
+        count += 1
+        boxes += len(lines)
+    write_text(os.path.join(args.out, "classes.txt"), "".join(label + "\n" for label in labels.names()))
+    return count, boxes, skipped
+
+
+def export_voc(args):
+    count = boxes = skipped = 0
+    for name, size, frames in iter_measured(args):
+        if size is None:
+            skipped += 1
+            continue
+        width, height = size
+        objects = []
+        for x, y, w, h, label in pixel_boxes(frames, width, height):
+            if w <= 0 or h <= 0 or x >= width or y >= height or x + w <= 0 or y + h <= 0:
+                print("%s: %s frame x %g y %g width %g height %g has no area in the image, left out" % (name, label, x, y, w, h), file=sys.stderr)
+                continue
+            xmin, ymin = min(width, max(1, int(round(x)) + 1)), min(height, max(1, int(round(y)) + 1)) # VOC pixels start at 1
+            xmax, ymax = max(xmin, min(width, int(round(x + w)))), max(ymin, min(height, int(round(y + h))))
+            # Boxes narrower than a pixel are one pixel wide
+            objects.append(VOC_OBJECT % (escape(label), xmin, ymin, xmax, ymax))
+        xml = VOC_ANNOTATION % (escape(os.path.basename(os.path.normpath(args.images))), escape(name), width, height, "".join(objects))
+        write_text(os.path.join(args.out, "Annotations", os.path.splitext(name)[0] + ".xml"), xml)
+        count += 1
+        boxes += len(objects)
+    return count, boxes, skipped
+
+
+VOC_ANNOTATION = """<annotation>
+\t<folder>%s</folder>
+\t<filename>%s</filename>
+\t<size>
+\t\t<width>%d</width>
+\t\t<height>%d</height>
+\t\t<depth>3</depth>
+\t</size>
+\t<segmented>0</segmented>
+%s</annotation>
+"""
+VOC_OBJECT = """\t<object>
+\t\t<name>%s</name>
+\t\t<pose>Unspecified</pose>
+\t\t<truncated>0</truncated>
+\t\t<difficult>0</difficult>
+\t\t<bndbox>
+\t\t\t<xmin>%d</xmin>
+\t\t\t<ymin>%d</ymin>
+\t\t\t<xmax>%d</xmax>
+\t\t\t<ymax>%d</ymax>
+\t\t</bndbox>
+\t</object>
+"""
+
+
+def write_text(path, text):
+    directory = os.path.dirname(path)
+    if directory: os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+EXPORTERS = {
+    "coco": (export_coco, "export/annotations.json", "a COCO JSON file"),
+    "yolo": (export_yolo, "export/yolo", "a directory of YOLO txt files and classes.txt"),
+    "voc": (export_voc, "export/voc", "a directory of Pascal VOC XML files"),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the annotations to COCO, YOLO or Pascal VOC.")
+    subparsers = parser.add_subparsers(dest="format", metavar="FORMAT")
+    subparsers.required = True
+    for name, (_, default_out, description) in EXPORTERS.items():
+        sub = subparsers.add_parser(name, help="write " + description)
+        sub.add_argument("--out", default=default_out, help="output path (default: %(default)s)")
+        sub.add_argument("--data", default=DATA_PATH, help="annotation file (default: %(default)s)")
+        sub.add_argument("--journal", default=JOURNAL_PATH, help="journal of the latest commits (default: %(default)s)")
+        sub.add_argument("--images", default=IMAGES_PATH, help="image directory (default: %(default)s)")
+        sub.add_argument("--labels", nargs="*", default=[], help="labels in the order their ids should follow")
+        sub.add_argument("--workers", type=int, default=None, help="worker processes (default: number of CPUs)")
+    args = parser.parse_args(argv)
+    count, boxes, skipped = EXPORTERS[args.format][0](args)
+    print("Exported %d images with %d boxes to %s" % (count, boxes, args.out))
+    if skipped:
+        print("Skipped %d images which could not be read or whose frames are not a list" % skipped, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Column based storage of the frames of the displayed image.
+
+Instead of one Python object per frame, the coordinates and label ids of all
+frames are kept in one NumPy array, one row per attribute. Adding, deleting and
+changing a frame are O(1), and converting all of them to image relative ratios
+is a single vectorized operation. The frames are also registered in a spatial
+index so the frame under the mouse is found without looking at all of them.
+"""
+import numpy as np
+
+from spatial_index import GridIndex
+
+X, Y, W, H, LABEL = range(5)    # Rows of the column array
+
+
+class FrameStore:
+    """
+    The frames of an image, a frame is referred to with its row number. Rows
+    are kept contiguous, deleting a frame moves the last one into its place.
+
+    Attributes
+    ----------
+    self.labels : List of strings
+        Label names, the label ids stored in the columns index this list.
+        Labels which are not in it yet are added when they are first used.
+    self.index : GridIndex
+        Spatial index of the rows.
+
+    """
+    def __init__(self, labels=(), cell_size=64, capacity=64):
+        self.labels = list(labels)
+        self._label_ids = {label: index for index, label in enumerate(self.labels)}
+        self._columns = np.zeros((5, capacity), dtype=np.int32)
+        self._count = 0
+        self.index = GridIndex(cell_size)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def columns(self):
+        """
+        View of the used part of the columns, rows are x, y, width, height
+        and label id. It must not be changed directly.
+        """
+        return self._columns[:, :self._count]
+
+    def label_id(self, label):
+        """
+        Returns the id of a label, interns it if it is new.
+
+        Parameters
+        ----------
+        label : string
+            Name of the label.
+
+        Returns
+        -------
+        int
+            Index of the label in self.labels.
+
+        """
+        label_id = self._label_ids.get(label)
+        if label_id is None:
+            label_id = self._label_ids[label] = len(self.labels)
+            self.labels.append(label)
+        return label_id
+
+    def rect(self, row):
+        """
+        Returns the x, y, width and height of a frame as Python ints.
+
+        Parameters
+        ----------
+        row : int
+            Row of the frame.
+
+        Returns
+        -------
+        tuple of ints
+            The rectangle of the frame.
+
+        """
+        return tuple(self._columns[:LABEL, row].tolist())
+
+    def label(self, row):
+        """
+        Returns the label name of a frame.
+
+        Parameters
+        ----------
+        row : int
+            Row of the frame.
+
+        Returns
+        -------
+        string
+            The label.
+
+        """
+        return self.labels[self._columns[LABEL, row]]
+
+    def rows(self):
+        """
+        Returns every frame as a tuple of x, y, width, height and label id,
+        converted to Python ints at once. Meant for drawing.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        List of tuples
+            The frames in row order.
+
+        """
+        return self.columns.T.tolist()
+
+    def append(self, x, y, w, h, label):
+        """
+        Adds a frame.
+
+        Parameters
+        ----------
+        x, y : int
+            Top-left corner of the frame.
+        w, h : int
+            Width and height of the frame.
+        label : string
+            Label of the frame.
+
+        Returns
+        -------
+        int
+            Row of the new frame.
+
+        """
+        if self._count == self._columns.shape[1]:
+            grown = np.zeros((5, 2 * self._count), dtype=np.int32)
+            grown[:, :self._count] = self._columns[:, :self._count]
+            self._columns = grown
+        row = self._count
+        self._columns[:, row] = (x, y, w, h, self.label_id(label))
+        self._count += 1
+        self.index.insert(row, x, y, w, h)
+        return row
+
+    def update(self, row, x, y, w, h):
+        """
+        Moves or resizes a frame.
+
+        Parameters
+        ----------
+        row : int
+            Row of the frame.
+        x, y, w, h : int
+            The new rectangle of the frame.
+
+        Returns
+        -------
+        None
+
+        """
+        self._columns[:LABEL, row] = (x, y, w, h)
+        self.index.update(row, x, y, w, h)
+
+    def delete(self, row):
+        """
+        Deletes a frame, the last frame takes its row.
+
+        Parameters
+        ----------
+        row : int
+            Row of the frame.
+
+        Returns
+        -------
+        None
+
+        """
+        last = self._count - 1
+        self.index.remove(row)
+        if row != last:
+            self.index.remove(last)
+            self._columns[:, row] = self._columns[:, last]
+            self.index.insert(row, *self.rect(row))
+        self._count = last
+
+    def delete_many(self, rows):
+        """
+        Deletes several frames.
+
+        Parameters
+        ----------
+        rows : iterable of ints
+            Rows of the frames.
+
+        Returns
+        -------
+        None
+
+        """
+        for row in sorted(set(rows), reverse=True):
+            # From the last one, so that no frame to delete is moved
+            self.delete(row)
+
+    def clear(self):
+        """
+        Deletes every frame.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        self._count = 0
+        self.index.clear()
+
+    def find(self, x, y):
+        """
+        Returns the row of the smallest frame containing the point. Only the
+        frames in the grid cell of the point are tested, read from the columns.
+
+        Parameters
+        ----------
+        x : int
+            x of the point of interest.
+        y : int
+            y of the point of interest.
+
+        Returns
+        -------
+        int
+            Row of the found frame, None if there is no frame there.
+
+        """
+        rows = self.index.candidates(x, y)
+        if not rows: return None
+        rows = np.array(rows)
+        fx, fy, fw, fh = self._columns[:LABEL, rows].astype(np.int64)
+        inside = (fx <= x) & (x <= fx + fw) & (fy <= y) & (y <= fy + fh)
+        if not inside.any(): return None
+        area = np.where(inside, fw * fh, np.iinfo(np.int64).max)
+        return int(rows[np.argmin(area)])
+
+    def find_in(self, x, y, w, h):
+        """
+        Returns the rows of the frames completely inside the rectangle.
+
+        Parameters
+        ----------
+        x, y, w, h : int
+            The rectangle.
+
+        Returns
+        -------
+        List of ints
+            Rows of the found frames.
+
+        """
+        return self.index.query_rect(x, y, w, h, contained=True)
+
+    def normalized(self, x_offset, y_offset, img_width, img_height):
+        """
+        Converts every frame to the format of jsonify in one vectorized step.
+
+        Parameters
+        ----------
+        x_offset : int
+            x of the top-left corner of the image.
+        y_offset : int
+            y of the top-left corner of the image.
+        img_width : int
+            Width of the image.
+        img_height : int
+            Height of the image.
+
+        Returns
+        -------
+        List of lists
+            For every frame its x, y, width and height as ratios of the image
+            size, and its label.
+
+        """
+        columns = self.columns
+        # The rows are filled in an object array, so tolist creates every list
+        # in C instead of joining the ratios and labels row by row in Python
+        rows = np.empty((self._count, 5), dtype=object)
+        rows[:, :LABEL] = (columns[:LABEL].T - np.array([x_offset, y_offset, 0, 0])) / np.array([img_width, img_height, img_width, img_height], np.float64)
+        rows[:, LABEL] = np.array(self.labels, dtype=object)[columns[LABEL]]
+        return rows.tolist()
+
+    def load(self, entries, x_offset, y_offset, img_width, img_height, cell_size=None):
+        """
+        Replaces the frames with the ones in the format of jsonify, the
+        inverse of normalized.
+
+        Parameters
+        ----------
+        entries : List of lists
+            Ratios and labels of the frames.
+        x_offset, y_offset, img_width, img_height : int
+            As in normalized.
+        cell_size : int
+            New cell size of the spatial index, to suit the size of the
+            image. Unchanged if None.
+
+        Returns
+        -------
+        None
+
+        """
+        self.clear()
+        if cell_size is not None: self.index.cell_size = cell_size
+        if not entries: return
+        ratios = np.array([entry[:LABEL] for entry in entries], dtype=np.float64).T
+        ratios[[X, W]] *= img_width
+        ratios[[Y, H]] *= img_height
+        ratios = np.round(ratios)
+        ratios[X] += x_offset
+        ratios[Y] += y_offset
+        for (x, y, w, h), entry in zip(ratios.T.astype(np.int64).tolist(), entries):
+            self.append(x, y, w, h, entry[LABEL])
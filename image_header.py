@@ -0,0 +1,84 @@
+"""
+Image sizes read from the file headers.
+
+Finding out the size of an image by decoding it reads and decompresses the
+whole file. The common formats store the size in the first bytes of the file,
+image_size reads only those. For other formats Pillow is used if it is
+installed, it also stops after the header.
+"""
+import struct
+
+try:
+    from PIL import Image   # Optional, only needed for uncommon formats
+except ImportError:
+    Image = None
+
+
+def image_size(path):
+    """
+    Returns the width and height of an image without decoding it.
+
+    Parameters
+    ----------
+    path : string
+        Path of the image.
+
+    Returns
+    -------
+    int, int
+        Width and height in pixels.
+
+    """
+    with open(path, "rb") as f:
+        head = f.read(32)
+        size = None
+        if head.startswith(b"\x89PNG\r\n\x1a\n"):
+            size = struct.unpack(">II", head[16:24])
+        elif head[:6] in (b"GIF87a", b"GIF89a"):
+            size = struct.unpack("<HH", head[6:10])
+        elif head.startswith(b"BM"):
+            width, height = struct.unpack("<ii", head[18:26])
+            size = width, abs(height)   # Negative height means top-down rows
+        elif head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+            size = _webp_size(head + f.read(8))
+        elif head.startswith(b"\xff\xd8"):
+            f.seek(2)
+            size = _jpeg_size(f)
+    if size is not None: return size
+    if Image is not None:
+        with Image.open(path) as image:
+            return image.size
+    raise ValueError("Could not read the size of %s" % path)
+
+
+def _jpeg_size(f):
+    # Walk the marker segments until a start of frame marker
+    while True:
+        if f.read(1) != b"\xff": return None
+        code = f.read(1)
+        while code == b"\xff": code = f.read(1)   # Fill bytes
+        if not code: return None
+        code = code[0]
+        if code == 0x01 or 0xD0 <= code <= 0xD8:
+            continue    # Markers without a segment
+        length = f.read(2)
+        if len(length) < 2: return None
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", f.read(5))
+            return width, height
+        f.seek(struct.unpack(">H", length)[0] - 2, 1)
+
+
+def _webp_size(head):
+    chunk = head[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = struct.unpack("<I", head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return width, height
+    return None
@@ -0,0 +1,149 @@
+"""
+Lazy index of the images to annotate.
+
+Listing a directory with a million files and checking every one of them
+takes minutes, so the directory is enumerated with os.scandir on a background
+thread and the index can be used while it grows. The first image is available
+as soon as it is found. When the enumeration is complete a manifest is saved,
+the next launch uses it directly if no directory was changed since.
+"""
+import json
+import os
+import threading
+
+from journal import write_json_atomic
+
+IMAGE_EXTENSIONS = (".bmp", ".gif", ".jpeg", ".jpg", ".lbm", ".pbm", ".pcx", ".pgm", ".png", ".pnm", ".ppm", ".svg", ".tga", ".tif", ".tiff", ".webp", ".xpm")
+# Extensions of the formats PyGame can load
+MANIFEST_VERSION = 1    # Changed when the manifest format changes
+
+
+class ImageIndex:
+    """
+    Names of the image files in a directory, relative to the directory and
+    with "/" as seperator. It can be indexed and sliced like a list which
+    grows while the directory is enumerated.
+
+    Attributes
+    ----------
+    self.root : string
+        Directory of the images.
+    self.recursive : bool
+        Whether the subdirectories are enumerated too.
+    self.extensions : tuple of strings
+        Lower case extensions of the files which are taken as images.
+    self.manifest_path : string
+        Where the result of the enumeration is cached, None to not cache it.
+    self.complete : bool
+        Whether every image is in the index.
+
+    """
+    def __init__(self, root, recursive=False, extensions=IMAGE_EXTENSIONS, manifest_path=None):
+        self.root = root
+        self.recursive = recursive
+        self.extensions = tuple(extensions)
+        self.manifest_path = manifest_path
+        self.complete = False
+        self._names = []
+        self._cond = threading.Condition()
+        names = self._read_manifest()
+        if names is not None:
+            self._names = names
+            self.complete = True
+        else:
+            threading.Thread(target=self._scan, name="image-index", daemon=True).start()
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, index):
+        return self._names[index]
+
+    def __iter__(self):
+        index = 0
+        while self.wait_for(index + 1):
+            yield self._names[index]
+            index += 1
+
+    def wait_for(self, count):
+        """
+        Waits until the index has at least the given number of images or the
+        enumeration is complete.
+
+        Parameters
+        ----------
+        count : int
+            Number of images needed.
+
+        Returns
+        -------
+        bool
+            True if there are at least count images.
+
+        """
+        with self._cond:
+            while len(self._names) < count and not self.complete:
+                self._cond.wait()
+            return len(self._names) >= count
+
+    def _scan(self):
+        dirs = {}   # Directories and their modification times, for the manifest
+        pending = [""]
+        batch = []
+        try:
+            while pending:
+                rel_dir = pending.pop()
+                path = os.path.join(self.root, rel_dir)
+                dirs[rel_dir] = os.stat(path).st_mtime_ns
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        name = rel_dir + entry.name
+                        if entry.is_dir():
+                            if self.recursive: pending.append(name + "/")
+                        elif os.path.splitext(entry.name)[1].lower() in self.extensions and entry.is_file():
+                            batch.append(name)
+                            if len(batch) >= 256 or not self._names:
+                                self._publish(batch)    # The first image right away, the rest in batches
+                                batch = []
+                self._publish(batch)
+                batch = []
+        finally:
+            with self._cond:
+                self.complete = True
+                self._cond.notify_all()
+        self._write_manifest(dirs)
+
+    def _publish(self, batch):
+        if not batch: return
+        with self._cond:
+            self._names.extend(batch)
+            self._cond.notify_all()
+
+    def _read_manifest(self):
+        if self.manifest_path is None or not os.path.exists(self.manifest_path): return None
+        try:
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+            if (manifest["version"], manifest["root"], manifest["recursive"], manifest["extensions"]) != (MANIFEST_VERSION, os.path.abspath(self.root), self.recursive, list(self.extensions)):
+                return None
+            for rel_dir, mtime in manifest["dirs"].items():
+                if os.stat(os.path.join(self.root, rel_dir)).st_mtime_ns != mtime: return None
+                # A file was added, removed or renamed in it
+            return manifest["images"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_manifest(self, dirs):
+        if self.manifest_path is None: return
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "root": os.path.abspath(self.root),
+            "recursive": self.recursive,
+            "extensions": list(self.extensions),
+            "dirs": dirs,
+            "images": self._names,
+        }
+        try:
+            write_json_atomic(self.manifest_path, manifest)
+        except OSError:
+            pass    # Only a cache, the next launch enumerates again
@@ -0,0 +1,212 @@
+"""
+Background loading of the images that are going to be annotated next.
+
+Decoding and scaling a large camera image takes a noticeable amount of time,
+so instead of doing it when the user asks for the next image, the upcoming
+images are decoded on worker threads while the current one is annotated.
+PyGame releases the GIL while decoding and smooth scaling, so the workers run
+truly in parallel with the main loop. Images which were already shown are
+kept in a memory bounded cache so going back to them is instant as well.
+"""
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ImagePrefetcher:
+    """
+    Loads images ahead of time on a pool of worker threads.
+
+    Attributes
+    ----------
+    self.load : callable
+        Function which takes an image path and returns the loaded image. Its
+        return value is handed back unchanged by get.
+    self.pending : dict
+        Futures of the loads that are scheduled or running, keyed by path.
+
+    """
+    def __init__(self, load, workers=2):
+        self.load = load
+        self.pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    def schedule(self, paths):
+        """
+        Starts loading the given paths in the background. Loads for paths
+        that are not in the list anymore are cancelled if they have not
+        started yet, and dropped once they are done so their images are not
+        kept alive outside of the image cache.
+
+        Parameters
+        ----------
+        paths : List of strings
+            Paths of the images that will be needed soon, most urgent first.
+
+        Returns
+        -------
+        None
+
+        """
+        for path in list(self.pending):
+            if path not in paths and (self.pending[path].done() or self.pending[path].cancel()):
+                del self.pending[path]
+        for path in paths:
+            if path not in self.pending:
+                self.pending[path] = self._executor.submit(self.load, path)
+
+    def get(self, path):
+        """
+        Returns the loaded image for the given path. If a worker is still
+        decoding it, waits for that worker instead of decoding it twice. If it
+        was never scheduled, it is loaded on the calling thread.
+
+        Parameters
+        ----------
+        path : string
+            Path of the image.
+
+        Returns
+        -------
+        object
+            Whatever the load function returned for the path.
+
+        """
+        future = self.pending.pop(path, None)
+        if future is None or future.cancelled():
+            return self.load(path)
+        return future.result()  # Re-raises the worker's exception if it failed
+
+    def shutdown(self):
+        """
+        Cancels the loads that have not started and stops the workers without
+        waiting for the running ones.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self._executor.shutdown(wait=False)
+
+
+def cache_key(path, window_size):
+    """
+    Returns the key the loaded version of an image is cached with. The
+    modification time is part of the key so that an image which is changed
+    on disk is not served from the cache.
+
+    Parameters
+    ----------
+    path : string
+        Path of the image.
+    window_size : int, int
+        Size of the area the image is fitted into.
+
+    Returns
+    -------
+    tuple
+        The cache key.
+
+    """
+    return path, tuple(window_size), os.stat(path).st_mtime_ns
+
+
+def surface_bytes(surface):
+    """
+    Returns the number of bytes the pixels of a PyGame Surface take.
+
+    Parameters
+    ----------
+    surface : PyGame Surface
+        Surface to measure.
+
+    Returns
+    -------
+    int
+        Size of the pixel buffer in bytes.
+
+    """
+    return surface.get_pitch() * surface.get_height()
+
+
+class ImageCache:
+    """
+    Least recently used cache of loaded images with a memory budget. Entries
+    are evicted by the total number of pixel bytes they hold, not by their
+    count, so a few huge images can not take more memory than the budget.
+
+    Attributes
+    ----------
+    self.max_bytes : int
+        Memory budget of the cache.
+    self.total_bytes : int
+        Bytes held by the cached entries right now.
+
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()   # key -> (value, nbytes), oldest first
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Returns the cached value of the key and marks it as the most
+        recently used one.
+
+        Parameters
+        ----------
+        key : tuple
+            Key created with cache_key.
+
+        Returns
+        -------
+        object
+            The cached value, None if the key is not cached.
+
+        """
+        entry = self._entries.get(key)
+        if entry is None: return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, nbytes):
+        """
+        Caches the value and evicts the least recently used entries until
+        the cache fits in its budget again. A value bigger than the whole
+        budget is not cached at all.
+
+        Parameters
+        ----------
+        key : tuple
+            Key created with cache_key.
+        value : object
+            Value to cache.
+        nbytes : int
+            Memory the value holds.
+
+        Returns
+        -------
+        None
+
+        """
+        if key in self._entries:
+            self.total_bytes -= self._entries.pop(key)[1]
+        if nbytes > self.max_bytes: return
+        self._entries[key] = (value, nbytes)
+        self.total_bytes += nbytes
+        while self.total_bytes > self.max_bytes:
+            self.total_bytes -= self._entries.popitem(last=False)[1][1]
@@ -0,0 +1,240 @@
+"""
+Crash safe storage of the annotations.
+
+Every committed image is appended to a journal file as one JSON line and
+synced to the disk, so a crash or power loss loses at most the image being
+annotated. From time to time the journal is compacted into the JSON data file,
+which is written to a temporary file first and renamed over the old one, so the
+data file is never half written. At startup the data file is read and the
+journal is replayed on top of it.
+"""
+import json
+import os
+
+
+def write_json_atomic(path, obj):
+    """
+    Writes the object as JSON to the path so that the file either has its old
+    or its new content even if the program dies while writing.
+
+    Parameters
+    ----------
+    path : string
+        Path of the JSON file.
+    obj : object
+        JSON serializable object to write.
+
+    Returns
+    -------
+    None
+
+    """
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())  # Several instances may write the same file
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)  # Atomic on the same file system
+    fsync_dir(os.path.dirname(path))
+
+
+def write_items_atomic(path, items):
+    """
+    Writes image names and their frames as a JSON object, like
+    write_json_atomic, but one item at a time so the whole object never has
+    to be in memory.
+
+    Parameters
+    ----------
+    path : string
+        Path of the JSON file.
+    items : iterable of (string, List)
+        Image names and their jsonified frames, every name once.
+
+    Returns
+    -------
+    int
+        Number of items written.
+
+    """
+    count = 0
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w") as f:
+        f.write("{")
+        for name, frames in items:
+            f.write("%s%s: %s" % (", " if count else "", json.dumps(name), json.dumps(frames)))
+            count += 1
+        f.write("}")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(os.path.dirname(path))
+    return count
+
+
+def fsync_dir(path):
+    """
+    Syncs a directory so that a rename in it survives a power loss. Does
+    nothing on platforms where directories can not be opened.
+
+    Parameters
+    ----------
+    path : string
+        Path of the directory.
+
+    Returns
+    -------
+    None
+
+    """
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class AnnotationJournal:
+    """
+    Write-ahead journal of the committed images, on top of the JSON data file.
+
+    Attributes
+    ----------
+    self.data_path : string
+        Path of the JSON data file, a dict of image names to frame lists.
+    self.journal_path : string
+        Path of the journal, every line is {"image": name, "frames": frames}.
+    self.compact_every : int
+        Number of appended records after which compaction is due.
+    self.pending : int
+        Number of records appended since the last compaction.
+    self.compacts_data : bool
+        True, compact writes the annotations it is given to the data file.
+
+    """
+    def __init__(self, data_path, journal_path, compact_every=100):
+        self.data_path = data_path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self.pending = 0
+        self.compacts_data = True
+        self._file = None
+
+    def load(self):
+        """
+        Reads the data file and replays the journal on top of it. A record
+        that was cut in half by a crash is dropped from the end of the journal.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            The annotations, image names to lists of frames.
+
+        """
+        data = {}
+        if os.path.exists(self.data_path):
+            with open(self.data_path, "r") as f:
+                data = json.load(f)
+        good_size = 0   # Size of the journal up to the last complete record
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break   # Torn write, nothing after it was synced
+                    if not line.endswith(b"\n"): break
+                    data[record["image"]] = record["frames"]
+                    good_size += len(line)
+                    self.pending += 1
+        self._file = open(self.journal_path, "ab")
+        self._file.truncate(good_size)
+        return data
+
+    def append(self, image, frames):
+        """
+        Appends the frames of an image to the journal and syncs it to the disk.
+
+        Parameters
+        ----------
+        image : string
+            Name of the image.
+        frames : List
+            The jsonified frames of the image.
+
+        Returns
+        -------
+        bool
+            True if the journal should be compacted now.
+
+        """
+        self.append_many([(image, frames)])
+        return self.pending >= self.compact_every
+
+    def append_many(self, records):
+        """
+        Appends several records with a single sync.
+
+        Parameters
+        ----------
+        records : List of tuples
+            Image names and their jsonified frames.
+
+        Returns
+        -------
+        None
+
+        """
+        lines = [json.dumps({"image": image, "frames": frames}) + "\n" for image, frames in records]
+        self._file.write("".join(lines).encode("utf-8"))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.pending += len(lines)
+
+    def compact(self, data):
+        """
+        Writes the whole data to the data file atomically and empties the
+        journal. If the program dies in between, replaying the journal again
+        on the new data file gives the same result.
+
+        Parameters
+        ----------
+        data : dict
+            The annotations, image names to lists of frames.
+
+        Returns
+        -------
+        None
+
+        """
+        write_json_atomic(self.data_path, data)
+        self._file.truncate(0)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.pending = 0
+
+    def close(self):
+        """
+        Closes the journal file.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,108 @@
+"""
+Turns held keys into steps by the time they are held.
+
+Repeating an action once per redraw makes its speed depend on how fast the
+machine draws, and sleeping between the repeats blocks the window. Instead
+the time every key is held is measured and the steps that became due since
+the last check are returned, so a key moves a frame the same distance per
+second however often it is checked. A tap takes exactly one step, holding
+the key repeats it after a short delay, faster and faster the longer it is
+held.
+"""
+
+
+class KeyRepeater:
+    """
+    Keeps the held keys and how many of their steps are due.
+
+    Attributes
+    ----------
+    self.delay : float
+        Seconds a key is held before it starts repeating.
+    self.rate : float
+        Steps per second when the repeating starts.
+    self.acceleration : float
+        How much the rate grows per second held, relative to rate.
+    self.max_rate : float
+        Steps per second at most.
+    self.max_gap : float
+        Longest time in seconds counted between two checks, so a stalled
+        window does not make a frame jump when it wakes up.
+    self.held : dict
+        Held keys to their press time, the time they were last checked and
+        the fraction of a step which is due.
+
+    """
+    def __init__(self, delay=0.25, rate=30.0, acceleration=3.0, max_rate=600.0, max_gap=0.1):
+        self.delay = delay
+        self.rate = rate
+        self.acceleration = acceleration
+        self.max_rate = max_rate
+        self.max_gap = max_gap
+        self.held = {}
+
+    def press(self, key, now):
+        """
+        Starts holding a key.
+
+        Parameters
+        ----------
+        key : int
+            The key.
+        now : float
+            Time of the press in seconds.
+
+        Returns
+        -------
+        int
+            Steps to take right away, one for the tap.
+
+        """
+        self.held[key] = [now, now, 0.0]
+        return 1
+
+    def release(self, key):
+        """
+        Stops holding a key, it takes no more steps.
+
+        Parameters
+        ----------
+        key : int
+            The key.
+
+        Returns
+        -------
+        None
+
+        """
+        self.held.pop(key, None)
+
+    def steps(self, key, now):
+        """
+        Returns how many steps a held key took since it was last checked.
+
+        Parameters
+        ----------
+        key : int
+            The key.
+        now : float
+            The current time in seconds.
+
+        Returns
+        -------
+        int
+            Number of steps, 0 if the key is not held or still waits for the
+            repeating to start.
+
+        """
+        state = self.held.get(key)
+        if state is None: return 0
+        pressed, checked, due = state
+        start = max(checked, pressed + self.delay, now - self.max_gap)
+        state[1] = now
+        if now <= start: return 0
+        held = now - pressed - self.delay   # Seconds it has been repeating
+        due += min(self.max_rate, self.rate * (1 + self.acceleration * held)) * (now - start)
+        count = int(due)
+        state[2] = due - count
+        return count
@@ -0,0 +1,248 @@
+"""
+Finding labels in label sets of hundreds or thousands of classes.
+
+Picking a label from a list only works while the list fits on the screen.
+LabelIndex keeps the words of every label in a sorted list, so the labels
+whose words start with what was typed are found by binary search, and falls
+back to fuzzy matching when no word does. The labels used last come first.
+LabelPicker is the state of the label palette of the tool, the text typed so
+far, the matching labels and which of them are shown and highlighted, it
+does not draw anything. load_labels reads label files with a hierarchy of
+classes.
+"""
+import bisect
+import json
+import re
+
+SEPARATOR = "/" # Between the levels of a hierarchical label, like "vehicle/car"
+MAX_RECENT = 20 # Number of recently used labels which are put first
+
+_WORD = re.compile(r"[^\W_]+")  # Words of a label, "_", "-", "/" and spaces separate them
+
+
+def load_labels(path):
+    """
+    Reads the labels from a file. A JSON file holds a list of labels, or
+    objects of classes to their subclasses, which are again lists or
+    objects. In a text file every line is a class, and the lines indented
+    below it are its subclasses. Only the classes without subclasses are
+    labels, named with the path of their classes joined by SEPARATOR.
+
+    Parameters
+    ----------
+    path : string
+        Path of the label file.
+
+    Returns
+    -------
+    List of strings
+        The labels in the order of the file.
+
+    """
+    labels = []
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(".json"):
+            _flatten(json.load(f), "", labels)
+            return labels
+        parents = []    # Indentations and names of the classes above the line
+        previous = None
+        for line in f:
+            name = line.strip()
+            if not name or name.startswith("#"): continue
+            indent = len(line) - len(line.lstrip())
+            if previous is not None and indent <= previous[0]:
+                labels.append(SEPARATOR.join([parent for _, parent in parents] + [previous[1]]))
+            elif previous is not None:
+                parents.append(previous)
+            while parents and parents[-1][0] >= indent:
+                parents.pop()
+            previous = (indent, name)
+        if previous is not None:
+            labels.append(SEPARATOR.join([parent for _, parent in parents] + [previous[1]]))
+    return labels
+
+
+def _flatten(node, prefix, labels):
+    if isinstance(node, dict):
+        for name, children in node.items():
+            if children: _flatten(children, prefix + name + SEPARATOR, labels)
+            else: labels.append(prefix + name)
+    elif isinstance(node, list):
+        for child in node:
+            _flatten(child, prefix, labels)
+    else:
+        labels.append(prefix + str(node))
+
+
+def _is_subsequence(query, text):
+    position = 0
+    for char in query:
+        position = text.find(char, position) + 1
+        if not position: return False
+    return True
+
+
+class LabelIndex:
+    """
+    The labels with an index of the prefixes of their words.
+
+    Attributes
+    ----------
+    self.labels : List of strings
+        The labels, in their original order.
+    self.recent : List of strings
+        The labels used last, the latest first.
+
+    """
+    def __init__(self, labels):
+        self.labels = list(dict.fromkeys(labels))   # Without repeated labels
+        self.recent = []
+        self._lower = [label.lower() for label in self.labels]
+        self._words = sorted((word, index) for index, label in enumerate(self._lower) for word in set(_WORD.findall(label)))
+
+    def _starting_with(self, prefix):
+        # Labels with a word starting with the prefix
+        found = set()
+        position = bisect.bisect_left(self._words, (prefix,))
+        while position < len(self._words) and self._words[position][0].startswith(prefix):
+            found.add(self._words[position][1])
+            position += 1
+        return found
+
+    def search(self, query):
+        """
+        Finds the labels matching what was typed. Every word typed has to be
+        the start of a word of the label, if no label has them all the
+        labels which contain the typed letters in order are taken. Recently
+        used labels come first, then the labels starting with the query, then
+        the others in their original order.
+
+        Parameters
+        ----------
+        query : string
+            What was typed, all labels if it is empty.
+
+        Returns
+        -------
+        List of strings
+            The matching labels.
+
+        """
+        query = query.lower().strip()
+        words = _WORD.findall(query)
+        if not words:
+            found = range(len(self.labels))
+        else:
+            found = set.intersection(*(self._starting_with(word) for word in words))
+            if not found:
+                letters = "".join(words)
+                found = [index for index, label in enumerate(self._lower) if _is_subsequence(letters, label)]
+        recent = {label: rank for rank, label in enumerate(self.recent)}
+        return [self.labels[index] for index in sorted(found, key=lambda index: (recent.get(self.labels[index], len(recent)), not self._lower[index].startswith(query), index))]
+
+    def use(self, label):
+        """
+        Puts a label first among the recently used ones.
+
+        Parameters
+        ----------
+        label : string
+            The label which was picked.
+
+        Returns
+        -------
+        None
+
+        """
+        if label in self.recent: self.recent.remove(label)
+        self.recent.insert(0, label)
+        del self.recent[MAX_RECENT:]
+
+
+class LabelPicker:
+    """
+    What the label palette shows while a label is picked.
+
+    Attributes
+    ----------
+    self.index : LabelIndex
+        The labels.
+    self.rows : int
+        Number of labels shown at a time.
+    self.query : string
+        What was typed so far.
+    self.matches : List of strings
+        The labels matching the query.
+    self.top : int
+        Index in matches of the first label shown.
+    self.active : int
+        Index in matches of the highlighted label.
+
+    """
+    def __init__(self, index, rows):
+        self.index = index
+        self.rows = rows
+        self.query = ""
+        self._refresh()
+
+    def _refresh(self):
+        self.matches = self.index.search(self.query)
+        self.top = self.active = 0
+
+    def type(self, text):
+        """
+        Adds typed text to the query.
+        """
+        self.query += text
+        self._refresh()
+
+    def backspace(self):
+        """
+        Removes the last character of the query. Returns False if the query
+        was empty already.
+        """
+        if not self.query: return False
+        self.query = self.query[:-1]
+        self._refresh()
+        return True
+
+    def move(self, steps):
+        """
+        Moves the highlight by some rows, scrolling the shown labels to keep
+        it visible.
+
+        Parameters
+        ----------
+        steps : int
+            Rows to move down, negative to move up.
+
+        Returns
+        -------
+        None
+
+        """
+        if not self.matches: return
+        self.active = min(max(self.active + steps, 0), len(self.matches) - 1)
+        if self.active < self.top: self.top = self.active
+        elif self.active >= self.top + self.rows: self.top = self.active - self.rows + 1
+
+    def visible(self):
+        """
+        Returns the labels which are shown, as a list of their indexes in
+        matches and the labels.
+        """
+        return list(enumerate(self.matches[self.top:self.top + self.rows], self.top))
+
+    def shown(self, row):
+        """
+        Returns the label in the given row of the shown labels, counting from
+        0, None if the row is empty.
+        """
+        index = self.top + row
+        return self.matches[index] if 0 <= row < self.rows and index < len(self.matches) else None
+
+    def chosen(self):
+        """
+        Returns the highlighted label, None if nothing matches.
+        """
+        return self.matches[self.active] if self.matches else None
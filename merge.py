@@ -0,0 +1,138 @@
+"""
+Merges the annotations of the annotators who shared the images into one
+data file.
+
+With --annotator every instance of the tool saves to its own data file and
+journal, like data/data.alice.json and data/data.alice.journal.jsonl. This
+script reads them one image at a time and writes every image once. An image
+can only be annotated by more than one of them when a lease ran out, then the
+annotator the work queue has as its owner wins, or the first annotator given
+if the queue does not know the image.
+
+>>> python3 merge.py [ANNOTATOR ...] [--out data/data.json]
+"""
+import argparse
+import glob
+import os
+import sys
+
+from annotation_core import DATA_PATH, QUEUE_PATH, annotator_paths
+from annotation_stream import iter_dataset
+from journal import write_items_atomic
+from work_queue import ClaimQueue
+
+
+def find_annotators():
+    """
+    Returns the names of the annotators who have a data file or a journal
+    next to DATA_PATH, sorted.
+    """
+    data_path, journal_path = annotator_paths("NAME")
+    names = set()
+    for path in (data_path, journal_path):
+        prefix, suffix = path.split("NAME")
+        for found in glob.glob(prefix + "*" + suffix):
+            name = found[len(prefix):len(found) - len(suffix)]
+            try:
+                annotator_paths(name)
+            except ValueError:
+                continue    # Not the file of an annotator
+            names.add(name)
+    return sorted(names)
+
+
+def choose_sources(annotators, owners):
+    """
+    Decides which annotator every image is taken from. Only the image names
+    are held in memory.
+
+    Parameters
+    ----------
+    annotators : List of strings
+        The annotators, earlier ones win when the queue does not decide.
+    owners : dict
+        Image names to the annotator the work queue has them done by.
+
+    Returns
+    -------
+    dict
+        Image names to the annotator they are taken from.
+    int
+        Number of images more than one annotator has.
+
+    """
+    sources = {}
+    conflicts = 0
+    for annotator in annotators:
+        for name, _ in iter_dataset(*annotator_paths(annotator)):
+            if name not in sources:
+                sources[name] = annotator
+                continue
+            if sources[name] == annotator: continue
+            conflicts += 1
+            if owners.get(name) == annotator: sources[name] = annotator
+    return sources, conflicts
+
+
+def merge(annotators, out, owners=None):
+    """
+    Writes the annotations of the annotators into one data file. The file is
+    written to a temporary file first and renamed, it is never half written.
+
+    Parameters
+    ----------
+    annotators : List of strings
+        The annotators.
+    out : string
+        Path of the merged data file.
+    owners : dict
+        Image names to the annotator the work queue has them done by, None
+        to take every image from the first annotator who has it.
+
+    Returns
+    -------
+    int
+        Number of images written.
+    int
+        Number of images more than one annotator has.
+
+    """
+    sources, conflicts = choose_sources(annotators, owners or {})
+    def chosen():
+        for annotator in annotators:
+            for name, frames in iter_dataset(*annotator_paths(annotator)):
+                if sources.get(name) != annotator: continue
+                del sources[name]   # Written once even if the journal repeats it
+                yield name, frames
+    return write_items_atomic(out, chosen()), conflicts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge the annotations of the annotators into one data file.")
+    parser.add_argument("annotators", nargs="*", help="annotators to merge, in order of priority (default: every annotator found)")
+    parser.add_argument("--out", default=DATA_PATH, help="merged data file (default: %(default)s)")
+    parser.add_argument("--queue", default=QUEUE_PATH, help="work queue deciding who did an image (default: %(default)s)")
+    args = parser.parse_args(argv)
+    annotators = args.annotators or find_annotators()
+    for annotator in annotators:
+        try:
+            annotator_paths(annotator)
+        except ValueError as e:
+            parser.error(str(e))
+    if not annotators:
+        print("No annotations of annotators found next to %s" % DATA_PATH, file=sys.stderr)
+        return 1
+    owners = None
+    if os.path.exists(args.queue):
+        queue = ClaimQueue(args.queue, None, read_only=True)
+        owners = queue.owners()
+        queue.close()
+    count, conflicts = merge(annotators, args.out, owners)
+    print("Merged %d images of %d annotators into %s" % (count, len(annotators), args.out))
+    if conflicts:
+        print("%d images were annotated by more than one annotator, one of them is kept" % conflicts, file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,76 +1,147 @@
 import pygame
-import sys, os
-from os import listdir
-from os.path import isfile, join
-import json
+import sys
+import argparse
+import time
+import atexit
+import threading
+from os.path import join
+from annotation_core import IMAGES_PATH, IMAGES_RECURSIVE, MANIFEST_PATH, DATA_PATH, JOURNAL_PATH, COMPACT_EVERY, PYRAMID_PATH, PROPOSALS_PATH, QUEUE_PATH, STORE_PATH, DUPLICATES_PATH
+from annotation_core import Frame, fit_image, resume_index, annotator_paths
+from image_pipeline import ImagePrefetcher, ImageCache, cache_key, surface_bytes
+from render_scheduler import RenderScheduler
+from text_cache import FontRegistry, TextCache
+from frame_store import FrameStore, LABEL
+from journal import AnnotationJournal
+from annotation_db import SQLiteStore
+from background_writer import BackgroundWriter
+from image_index import ImageIndex
+from profiler import StageProfiler
+from key_repeat import KeyRepeater
+from proposals import ProposalCache, ProposalWorker
+from work_queue import ClaimQueue, LeasedImages
+from dedupe import DistinctImages, load_groups
+from tracking import FrameTracker
+from label_index import LabelIndex, LabelPicker, load_labels
+from viewport import Viewport
+from pyramid import TilePyramid
+from image_header import image_size
+
+try:
+    from PIL import Image   # Optional, decodes big JPEGs at a reduced size
+except ImportError:
+    Image = None
+
+LABELS = []  # Possible classes for objects ( Given as console arguments or in a label file, set by init )
+PALETTE_ROWS = 9    # Labels shown at a time in the label palette, the number keys pick them before anything is typed
+PREFETCH_DEPTH = 3  # How many of the upcoming images are decoded in background
+PREFETCH_WORKERS = 2    # Number of threads decoding the upcoming images
+IMAGE_CACHE_BYTES = 512 * 1024 * 1024   # Memory budget of the already loaded images
+MAX_FPS = 60    # Redraws per second are capped to this
+STORE_BACKEND = "json"  # "json" saves to DATA_PATH and JOURNAL_PATH, "sqlite" to the database in STORE_PATH
+GRID_CELL_SIZE = 64 # Cell size in window pixels of the index used to find frames
+PYRAMID_MIN_PIXELS = 64 * 1000 * 1000   # Bigger images are shown from a tile pyramid kept in PYRAMID_PATH
+TILE_CACHE_BYTES = 128 * 1024 * 1024    # Memory budget of the decoded tiles of pyramids
+MAX_ZOOM = 8    # Window pixels per image pixel at most
+ZOOM_STEP = 1.25    # Zoom factor of one step of the mouse wheel
+PROFILE = False # Whether the stages of the main loop are timed and shown, F3 switches it while running
+PROFILE_TRACE = None    # CSV or JSON lines file every timing is written to, None for no trace
+HUD_INTERVAL = 0.5  # Seconds between updates of the shown timings
+HUD_LINES = 14  # Lines of the info window the timings take at most
+KEY_REPEAT_DELAY = 0.25 # Seconds an adjustment key is held before the frame keeps changing
+KEY_REPEAT_RATE = 30    # Steps per second when the frame starts changing
+KEY_REPEAT_ACCELERATION = 3 # The steps per second grow by this many times KEY_REPEAT_RATE every second the key is held
+KEY_REPEAT_MAX_RATE = 600   # Steps per second at most
+COARSE_STEP = 10    # Steps taken at once while SHIFT is held
+PROPOSAL_PROVIDER = None    # Proposes frames for the images as "module:function", like "proposals:from_predictions", None to propose none
+PROPOSAL_DEPTH = 5  # How many of the upcoming images are proposed in background
+PROPOSAL_COLOR = (255, 200, 0)  # Border color of the proposed frames
+LEASE_SECONDS = 900 # An image leased from the work queue is given to another annotator if it is not renewed for this long
+LEASE_BATCH = 10    # Number of images leased from the work queue at a time
+CARRY_FORWARD = False   # Whether an image which is not annotated starts with the frames of the image before it, moved to where their objects are, for images taken from a video
+DUPLICATES = None   # What is done with the near-duplicates found by dedupe.py, "skip" leaves them out, "copy" starts them with the frames of an annotated image like them, None shows them like the others
+
+# Nothing is opened or read when this module is imported, init creates the
+# window and loads the annotations into the globals below.
 
-IMAGES_PATH = "img/"    # Images to annotate
-DATA_PATH = "data/data.json"    # Frame information
-LABELS = [label for label in sys.argv[1:]]  # Possible classes for objects ( Given as console argument )
-
-class Frame:
+window_to_screen_ratio = 0.8    # Ratio of the window's lengths and the screen's
+info_ratio = 0.2    # Info windows ratio to the total length of the window
+screen = None   # Window surface ( will be used to draw things on the window )
+width = None    # Width of the window without the info window
+height = None   # Height of the window
+len_info = None # Width of the info window
+info_rect = None    # Info window with its seperator line
+bg_color = (255,255,255)    # Background color in RGB
+LABEL_FONT = ("comicsansms", 16, True) # Font of the labels, as name, size and boldness
+INFO_FONT = ("Comic Sans MS", 12, False)    # Font of the info window
+fonts = FontRegistry()  # Every font is created once
+text_cache = TextCache(fonts)   # Rendered texts are reused between redraws
+background = None   # The image composed on the background color, cached to redraw
+background_key = None   # The image and view the background was composed with
+rubber_band = None  # Rect of the frame being dragged, None if not dragging
+label_index = None  # LABELS indexed by the words in them, with the labels used last
+palette = None  # The label palette while a label is picked, as its LabelPicker and Rect
+palette_width = None    # Width of the label palette, wide enough for the longest label
+profiler = StageProfiler()  # Times the stages of the main loop, disabled until init
+hud_rect = None # Part of the info window the timings are shown in
+view = None # Which part of the image is shown and how big, converts between image and window pixels
+tile_cache = None   # Decoded tiles of the pyramids
+pyramid_lock = threading.Lock() # Pyramids are built one at a time, building decodes the whole image
+proposer = None # Runs PROPOSAL_PROVIDER on the upcoming images in a worker process
+suggestions = None  # Frames proposed for the current image which are not accepted or rejected yet
+suggested = False   # Whether the proposals of the current image arrived
+key_repeater = KeyRepeater(KEY_REPEAT_DELAY, KEY_REPEAT_RATE, KEY_REPEAT_ACCELERATION, KEY_REPEAT_MAX_RATE)
+# Steps of the held adjustment keys by the time they are held
+
+frames = None   # The frames drawn on the current image, stored as columns
+# with a spatial index to find them under the mouse
+images = None   # Names of the image files in IMAGES_PATH, relative to it. The
+# folder is listed in background, the list grows while the window is in use.
+# With a work queue only the images leased to this annotator are in it.
+claim_queue = None  # Work queue shared with the other annotators, None when annotating alone
+lease_renewed = None    # When the leases of the work queue were last renewed
+duplicates = {} # Image names to their group of near-duplicates, read from DUPLICATES_PATH
+copied_from = None  # Image the frames of the current image were copied from, None if they were not
+tracker = None  # Tracks the frames of an annotated image into the next one when CARRY_FORWARD is set
+carried = None  # The image the frames of the current image were carried from, and the frames before
+# and after loading them, while they are being tracked. None otherwise.
+selected_frame = None
+# The currently focused frame, also held as an index integer.
+journal = None  # Every commit is written here right away so a crash does not lose work
+data = None # Information of frames, it gives a list of frames for the given
+# image name as a key. The annotations of the previous sessions are loaded.
+writer = None   # Writes the annotations without blocking the window
+curr_img = None # Index of the image that is currently displayed, this is the
+# index for images array. Resumes at the first image which is not annotated yet.
+
+class SurfaceImage:
     """
-    The class to store every box and its information:
+    An image which is small enough to be kept in memory at full resolution.
 
     Attributes
     ----------
-    self.x : int
-        x coordinate of the top-left corner of the frame. Origin is taken as
-        the top-left corner of the window and down-right directions are
-        positive.
-    self.y : int
-        y coordinate of the top-left corner of the frame. Origin is taken as
-        the top-left corner of the window and down-right directions are
-        positive.
-    self.width : int
-        Width of the frame.
-    self.height : int
-        Height of the frame.
-    self.label : string
-        Class of the object in the box.
+    self.path : string
+        Path of the image.
+    self.full : PyGame Surface
+        The image at full resolution, zoomed parts are scaled from it. None
+        until the image is zoomed if it was decoded at a reduced size.
+    self.fitted : PyGame Surface
+        The image resized to fit the window, shown when not zoomed.
+    self.size : int, int
+        Width and height of the full resolution image.
 
     """
-    def __init__(self, x, y, height, width, label):
-        self.x = x
-        self.y = y
-        self.width = width
-        self.height = height
-        self.label = label
-
+    __slots__ = ("path", "full", "fitted", "size")
 
-pygame.init()   # Initialize PyGame
-pygame.display.set_caption("Object Framing Tool")   # Window title
-
-screen_width, screen_height = pygame.display.Info().current_w, pygame.display.Info().current_h  # Resolution of screen in pixel length
-
-window_to_screen_ratio = 0.8    # Ratio of the window's lengths and the screen's
-size = width, height = int(screen_width * window_to_screen_ratio), int(screen_height * window_to_screen_ratio) # Window size
-window = pygame.display.set_mode(size)  # Create window
-screen = pygame.display.get_surface()   # Get window surface ( will be used to draw things on the window )
-bg_color = (255,255,255)    # Background color in RGB
-info_ratio = 0.2    # Info windows ratio to the total length of the window
-len_info = int(width * info_ratio)  # Width of the info window
-width = width - len_info    # width is then updated to make calculations easier,
-# the window is created with the previous width but now will be refering to the
-# width without info window.
-
-frames = [] # The array to store drawn frames in runtime
-
-images = [f for f in listdir(IMAGES_PATH) if isfile(join(IMAGES_PATH, f))]
-# Names of the image files in the set path as IMAGES_PATH
-curr_img = 0
-# Index of the image that is currently displayed, this is the index for images
-# array.
-selected_frame = None
-# The currently focused frame, also held as an index integer.
-
-data = {} # Information of frames, it gives a list of frames for the given
-# image name as a key.
+    def __init__(self, path, size, fitted, full=None):
+        self.path = path
+        self.size = size
+        self.fitted = fitted
+        self.full = full
 
 def delete_frame(x, y):
     """
-    Deletes the frame with the given coordinates. Will not handle
-    if the given coordinate is in multiple boxes.
+    Deletes the frame with the given coordinates. If the given coordinate
+    is in multiple boxes the smallest one is deleted.
 
     Parameters
     ----------
@@ -85,65 +156,168 @@ def delete_frame(x, y):
 
     """
     global selected_frame # use global variable selected frame
-    to_delete = None      # if a frame can be found containing the given point
-                          # this will be the index of it
-    for index, frame in enumerate(frames):
-        if 0 <= x - frame.x <= frame.width and 0 <= y - frame.y <= frame.height:
-            to_delete = index
-            break
-    if to_delete is not None: del frames[to_delete] # If found delete it
+    to_delete = find_frame(x, y)  # if a frame can be found containing the given point
+                                  # this will be the index of it
+    if to_delete is not None: frames.delete(to_delete) # If found delete it
+    selected_frame = None # Selected frame is reset because indices may shift
+
+def delete_frames_in(x, y, w, h):
+    """
+    Deletes every frame which is completely inside the given rectangle.
+
+    Parameters
+    ----------
+    x : int
+        Top-left x coordinate of the rectangle.
+    y : int
+        Top-left y coordinate of the rectangle.
+    w : int
+        Width of the rectangle.
+    h : int
+        Height of the rectangle.
+
+    Returns
+    -------
+    None
+
+    """
+    global selected_frame
+    left, top = view.to_image(x, y)
+    right, bottom = view.to_image(x + w, y + h)
+    frames.delete_many(frames.find_in(left, top, right - left, bottom - top))
     selected_frame = None # Selected frame is reset because indices may shift
 
 def load_image(img_path):
     """
-    Loads the image with the given path and resizes it into a size which
-    it will fit into the window. The w/h ratio of the image is fixed.
+    Loads the image with the given path. An image with up to
+    PYRAMID_MIN_PIXELS pixels is resized into a size which it will fit into
+    the window, the w/h ratio of the image is fixed. A JPEG which is much
+    bigger than the window is decoded at a reduced size right away, it is
+    decoded at full resolution only when it is zoomed. A bigger image is
+    opened as a tile pyramid, which is built the first time, so only its
+    visible parts are ever decoded. Only one pyramid is built at a time, so
+    the prefetch workers do not decode several huge images at once.
 
     Parameters
     ----------
     img_path : string
         The path of the image to load.
 
+    Returns
+    -------
+    SurfaceImage or TilePyramid
+        The loaded image.
+
+    """
+    try:
+        w, h = image_size(img_path)
+    except (OSError, ValueError):
+        w = h = 0   # Decoded normally, which reports the problem
+    if w * h > PYRAMID_MIN_PIXELS:
+        with profiler.stage("open_pyramid"), pyramid_lock:
+            return TilePyramid.open(img_path, PYRAMID_PATH, decode_pixels)
+    with profiler.stage("load_image"):
+        image = None
+        if w and h:
+            fit_size = fit_image(w, h, width, height)[:2]
+            if fit_size != (w, h): image = decode_reduced(img_path, fit_size)
+        if image is None:
+            image = pygame.image.load(img_path).convert()
+            w, h = image.get_size()
+    full = image if image.get_size() == (w, h) else None   # Decoded when zoomed if reduced
+    fit_w, fit_h, _, _ = fit_image(w, h, width, height)
+    fitted = image
+    if (fit_w, fit_h) != image.get_size():
+    # If image is not fitting in the window as it is
+        with profiler.stage("scale"):
+            fitted = pygame.transform.smoothscale(image, (fit_w, fit_h))
+    return SurfaceImage(img_path, (w, h), fitted, full)
+
+def decode_reduced(img_path, size):
+    """
+    Decodes a JPEG at the smallest of 1/2, 1/4 or 1/8 of its size which still
+    covers the given size. The decoder skips the details it does not need, so
+    this takes a fraction of the time and memory of a full decode.
+
+    Parameters
+    ----------
+    img_path : string
+        The path of the image.
+    size : int, int
+        The size the image will be shown with.
+
     Returns
     -------
     PyGame Surface
-        The loaded and resized image file.
-    int
-        The width of the image.
-    int
-        The height of the image.
-    int, int
-        The margins to center the image in window.
+        The decoded image, None if the image is not a JPEG or Pillow is not
+        installed.
 
     """
-    image = pygame.image.load(img_path).convert()
-    h = image.get_height() 
-    w = image.get_width()
+    if Image is None: return None
+    with Image.open(img_path) as decoded:
+        if decoded.format != "JPEG": return None
+        decoded.draft("RGB", size)
+        decoded = decoded.convert("RGB")
+        return pygame.image.frombuffer(decoded.tobytes(), decoded.size, "RGB").convert()
+
+def full_resolution(image):
+    """
+    Returns an image at full resolution, decodes it if it was decoded at a
+    reduced size and caches it with its new size.
 
+    Parameters
+    ----------
+    image : SurfaceImage
+        The image.
 
-    if h / height > 1 or w / width > 1:
-    # If image is not fitting in the window as it is
-        if h / height > w / width:
-        # If height exceeds more
-            image = pygame.transform.smoothscale(image, (w * height // h, height)) 
-            # resize
-        else:
-        # If width exceeds more or they exceed equally
-            image = pygame.transform.smoothscale(image, (width, h * width // w))
-            # resize
-        h = image.get_height()
-        w = image.get_width()
-    
+    Returns
+    -------
+    PyGame Surface
+        The image at full resolution.
 
+    """
+    if image.full is None:
+        with profiler.stage("load_image"):
+            image.full = pygame.image.load(image.path).convert()
+        image_cache.put(cache_key(image.path, (width, height)), image, image_bytes(image))
+    return image.full
+
+def decode_pixels(img_path):
+    """
+    Decodes an image into an array of its pixels, to build its pyramid.
+
+    Parameters
+    ----------
+    img_path : string
+        The path of the image.
+
+    Returns
+    -------
+    NumPy array
+        The pixels with the shape (height, width, 3).
+
+    """
+    image = pygame.image.load(img_path)
+    if image.get_bitsize() < 24:
+        converted = pygame.Surface(image.get_size(), 0, 24)
+        converted.blit(image, (0, 0))
+        image = converted
+    return pygame.surfarray.pixels3d(image).transpose(1, 0, 2)   # A view, not a copy
+
+def image_bytes(image):
+    """
+    Returns the memory a loaded image takes, the tiles of a pyramid are
+    accounted for in the tile cache.
+    """
+    if isinstance(image, TilePyramid): return 0
+    if image.full is None: return surface_bytes(image.fitted)
+    return surface_bytes(image.full) + (surface_bytes(image.fitted) if image.fitted is not image.full else 0)
 
-    img_height_margin = (height - h) // 2 # To center
-    img_width_margin = (width - w) // 2 # To center
-    return image, w, h, img_width_margin, img_height_margin
-        
 def find_frame(x, y):
     """
-    Returns the index of the frame with the given coordinates. Will not handle
-    if the given coordinate is in multiple boxes.
+    Returns the index of the frame with the given coordinates. If the given
+    coordinate is in multiple boxes the smallest one is returned, so nested
+    boxes can be selected.
 
     Parameters
     ----------
@@ -155,44 +329,252 @@ def find_frame(x, y):
     Returns
     -------
     int
-        Index of the found frame.
+        Index of the found frame, None if there is no frame there.
+
+    """
+    return frames.find(*view.to_image(x, y))
 
+def get_image(img_path):
     """
-    for index, frame in enumerate(frames):
-        if 0 <= x - frame.x <= frame.width and 0 <= y - frame.y <= frame.height:
-            return index
+    Returns the loaded image for the given path from the image cache, if it
+    is not there takes it from the prefetcher and caches it.
+
+    Parameters
+    ----------
+    img_path : string
+        The path of the image to load.
+
+    Returns
+    -------
+    tuple
+        Same as the return value of load_image.
 
-def jsonify(frame,  img_width_margin, img_height_margin, img_width, img_height):
     """
-    Converts the pixel coordinates into new coordinates where the x and y coordinates
-    recalculated relative to images top-left taken as 0,0 and images bottom-right
-    taken as 1,1, also height and width are now the ratio of the image's height/width
-    and frame's height/width
+    key = cache_key(img_path, (width, height))
+    loaded = image_cache.get(key)
+    if loaded is None:
+        with profiler.stage("get_image"):   # Waits for the worker if it is still decoding
+            loaded = prefetcher.get(img_path)
+        image_cache.put(key, loaded, image_bytes(loaded))
+    return loaded
+
+def prefetch_after(index):
+    """
+    Schedules the images after the given index, which are not cached yet,
+    to be decoded in background.
 
     Parameters
     ----------
-    frame : Frame
-        Frame object to jsonify
-    img_width_margin : int
-        Margin of image to center in window.
-    img_height_margin : int
-        Margin of image to center in window.
-    img_width : int
-        Width of the current image.
-    img_height : int
-        Height of the current image.
+    index : int
+        Index of the image that is currently displayed.
 
     Returns
     -------
-    List of floats
-        A list where the attributes of the frame converted into a list of floats according to the given description.
+    None
+
+    """
+    upcoming = [join(IMAGES_PATH, name) for name in images[index + 1:index + 1 + PREFETCH_DEPTH]]
+    prefetcher.schedule([path for path in upcoming if cache_key(path, (width, height)) not in image_cache])
 
+def propose_after(index):
     """
-    return [(frame.x - img_width_margin)/img_width, (frame.y - img_height_margin)/img_height, frame.width/img_width, frame.height/img_height, frame.label]
+    Schedules the current image and the ones after it to be proposed frames
+    for in background, unless they are annotated already.
+
+    Parameters
+    ----------
+    index : int
+        Index of the image that is currently displayed.
+
+    Returns
+    -------
+    None
+
+    """
+    upcoming = [name for name in images[index:index + 1 + PROPOSAL_DEPTH] if name not in data]
+    proposer.schedule([(name, join(IMAGES_PATH, name)) for name in upcoming])
+
+def update_suggestions():
+    """
+    Shows the proposals of the current image once they are computed. Images
+    which are annotated already are not proposed any frames.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+
+    """
+    global suggested
+    name = images[curr_img]
+    entries = [] if name in data else proposer.get(name, join(IMAGES_PATH, name))
+    if entries is None: return  # Still being computed
+    suggestions.load(entries, 0, 0, img_width, img_height, frames.index.cell_size)
+    suggested = True
+    scheduler.invalidate()
+
+def take_suggestion(x, y, accept):
+    """
+    Accepts or rejects the proposed frame at the given window position. An
+    accepted frame is added to the frames and selected, so it can be adjusted
+    right away. If proposals are nested the smallest one is taken.
+
+    Parameters
+    ----------
+    x, y : int
+        The position in window pixels.
+    accept : bool
+        Whether to accept the proposal, otherwise it is rejected.
+
+    Returns
+    -------
+    None
+
+    """
+    global selected_frame
+    row = suggestions.find(*view.to_image(x, y))
+    if row is None: return
+    invalidate_frame(row, suggestions)
+    if accept:
+        invalidate_frame(selected_frame)
+        selected_frame = frames.append(*suggestions.rect(row), suggestions.label(row))
+        invalidate_frame(selected_frame)
+    suggestions.delete(row)
+
+def copy_source(name):
+    """
+    Finds the near-duplicate of an image whose frames it starts with when
+    DUPLICATES is "copy".
+
+    Parameters
+    ----------
+    name : string
+        Name of the image.
+
+    Returns
+    -------
+    string
+        The first annotated image of the group of the image, None if the
+        image is annotated itself or none of its group is.
+
+    """
+    if DUPLICATES != "copy" or name in data: return None
+    return next((other for other in duplicates.get(name, ()) if other != name and other in data), None)
+
+def carry_after(index):
+    """
+    Starts tracking the frames of an annotated image into the image after
+    it in background, if that one is not annotated yet.
+
+    Parameters
+    ----------
+    index : int
+        Index of the annotated image.
+
+    Returns
+    -------
+    None
+
+    """
+    if index + 1 >= len(images) or not data.get(images[index]) or images[index + 1] in data: return
+    tracker.schedule(join(IMAGES_PATH, images[index]), join(IMAGES_PATH, images[index + 1]), data[images[index]])
+
+def carry_frames():
+    """
+    Starts the current image with the frames of the image before it, if it
+    is not annotated and has no frames yet. They are the tracked frames if
+    the tracker is done, otherwise the frames where they were, which are
+    moved by update_carried once they are tracked.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+
+    """
+    global carried
+    carried = None
+    if curr_img == 0 or len(frames) or images[curr_img] in data: return
+    previous = images[curr_img - 1]
+    entries = data.get(previous)
+    if not entries: return
+    tracked = tracker.get(join(IMAGES_PATH, previous), join(IMAGES_PATH, images[curr_img]), entries)
+    frames.load(tracked if tracked is not None else entries, 0, 0, img_width, img_height, frames.index.cell_size)
+    if tracked is None: carried = (previous, entries, frames.normalized(0, 0, img_width, img_height))
+
+def update_carried():
+    """
+    Moves the carried frames of the current image once they are tracked,
+    unless they were changed in the meantime.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+
+    """
+    global carried
+    previous, entries, loaded = carried
+    tracked = tracker.get(join(IMAGES_PATH, previous), join(IMAGES_PATH, images[curr_img]), entries)
+    if tracked is None: return  # Still being tracked
+    carried = None
+    scheduler.invalidate(info_rect)
+    if frames.normalized(0, 0, img_width, img_height) != loaded: return   # Already edited, keep the edits
+    frames.load(tracked, 0, 0, img_width, img_height, frames.index.cell_size)
+    scheduler.invalidate()
+
+def commit_curr_frames():
+    """
+    Adds the frames of the current image to the data dict and queues them to
+    be appended to the journal. The background writer compacts the journal
+    into the data file when it is due.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+
+    """
+    with profiler.stage("commit"):
+        data[images[curr_img]] = frames.normalized(0, 0, img_width, img_height)
+        # Same as calling jsonify for every frame, but in one step
+        # Always a new list, the background writer shares the old ones with its snapshots
+        writer.commit(images[curr_img], data[images[curr_img]])
+        if claim_queue is not None: images.complete(images[curr_img])
+        if tracker is not None: carry_after(curr_img)   # Ready by the time the next image is shown
 
 def save_curr_frames():
     """
-    Saves the data dict as a JSON file to the DATA_PATH given.
+    Asks the background writer to save the data dict as a JSON file to the
+    DATA_PATH given and to empty the journal. The file is replaced atomically,
+    it is never half written. Returns without waiting for the write.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+
+    """
+    writer.save()
+
+def quit_tool():
+    """
+    Saves everything, waits until it is written and exits.
 
     Parameters
     ----------
@@ -203,33 +585,135 @@ def save_curr_frames():
     None
 
     """
-    with open(DATA_PATH, "w") as f:
-        json.dump(data, f)
+    save_curr_frames()
+    prefetcher.shutdown()
+    if proposer is not None: proposer.shutdown()
+    if tracker is not None: tracker.shutdown()
+    writer.close()  # Flushes the queued writes
+    if claim_queue is not None: claim_queue.release()   # The others can take the images not done yet
+    profiler.close()
+    sys.exit()
+
+def draw_image(image):
+    """
+    This function draws the given image on screen as the viewport shows it.
+    Only the part inside the clip area of the screen is drawn.
+
+    Parameters
+    ----------
+    image : SurfaceImage or TilePyramid
+        Image to draw.
+
+    Returns
+    -------
+    None
+
+    """
+    global background, background_key
+    if background_key != (image, view.state()):
+        # Compose the image on the background once, after that drawing it is one blit
+        background = pygame.Surface(screen.get_size()).convert()
+        background.fill(bg_color)
+        background.set_clip(pygame.Rect(0, 0, width, height)) # Never over the info window
+        if isinstance(image, TilePyramid): compose_tiles(image)
+        else: compose_surface(image)
+        background.set_clip(None)
+        background_key = (image, view.state())
+    clip = screen.get_clip()
+    screen.blit(background, clip.topleft, clip) # Only the part that is redrawn
+
+def scale_to(surface, size):
+    """
+    Resizes a surface, smoothly when shrinking and to sharp pixels when
+    enlarging so that the pixels can be framed exactly.
+    """
+    if size == surface.get_size(): return surface
+    if size[0] < surface.get_width(): return pygame.transform.smoothscale(surface, size)
+    return pygame.transform.scale(surface, size)
+
+def compose_surface(image):
+    """
+    Draws the visible part of an image which is in memory on the background.
+
+    Parameters
+    ----------
+    image : SurfaceImage
+        Image to draw.
+
+    Returns
+    -------
+    None
 
-def draw_image(image, img_width_margin, img_height_margin):
     """
-    This function draws the given image on screen.
+    if view.fitted():
+        background.blit(image.fitted, view.image_rect()[:2])
+        return
+    left, top, right, bottom = view.visible()
+    if right <= left or bottom <= top: return
+    x, y, w, h = view.to_screen_rect(left, top, right - left, bottom - top)
+    part = full_resolution(image).subsurface((left, top, right - left, bottom - top))
+    background.blit(scale_to(part, (w, h)), (x, y))
+
+def compose_tiles(pyramid):
+    """
+    Draws the visible tiles of a pyramid on the background, from the level
+    which suits the zoom. Only these tiles are read from the disk.
 
     Parameters
     ----------
-    image : PyGame Surface
+    pyramid : TilePyramid
         Image to draw.
-    img_width_margin : int
-        Margin to center the image.
-    img_height_margin : int
-        Margin to center the image.
 
     Returns
     -------
     None
 
     """
-    screen.fill(bg_color) # Erase everything ( fill with background color)
-    screen.blit(image, (img_width_margin, img_height_margin)) # Draw image
+    level = pyramid.level_for(view.zoom)
+    scale = 1 << level  # Image pixels per pixel of the level
+    span = pyramid.tile_size * scale    # Image pixels a tile covers
+    left, top, right, bottom = view.visible()
+    for row in range(top // span, -(-bottom // span)):
+        for column in range(left // span, -(-right // span)):
+            tile_x, tile_y = column * span, row * span
+            tile_w, tile_h = min(span, img_width - tile_x), min(span, img_height - tile_y)
+            x, y, w, h = view.to_screen_rect(tile_x, tile_y, tile_w, tile_h)
+            if w <= 0 or h <= 0: continue
+            tile = tile_surface(pyramid, level, row, column)
+            part = tile.subsurface((0, 0, -(-tile_w // scale), -(-tile_h // scale)))  # Without the padding
+            background.blit(scale_to(part, (w, h)), (x, y))
+
+def tile_surface(pyramid, level, row, column):
+    """
+    Returns a tile of a pyramid as a surface, decoded once and cached.
+
+    Parameters
+    ----------
+    pyramid : TilePyramid
+        The pyramid.
+    level, row, column : int
+        Position of the tile.
+
+    Returns
+    -------
+    PyGame Surface
+        The tile.
+
+    """
+    key = (pyramid.directory, level, row, column)
+    surface = tile_cache.get(key)
+    if surface is None:
+        with profiler.stage("read_tile"):
+            size = pyramid.tile_size
+            surface = pygame.image.frombuffer(pyramid.tile(level, row, column).tobytes(), (size, size), "RGB").convert()
+        tile_cache.put(key, surface, surface_bytes(surface))
+    return surface
 
 def draw_frames():
     """
-    This function draws the frames in the global list frames with their labels.
+    This function draws the frames in the global frame store with their labels,
+    and the proposed frames under them. Frames outside of the clip area of the
+    screen are skipped. The selected frame is drawn in green.
 
     Parameters
     ----------
@@ -240,75 +724,236 @@ def draw_frames():
     None
 
     """
-    font = pygame.font.SysFont("comicsansms", 16, True)
-    for frame in frames:
-        f = pygame.Rect(frame.x, frame.y, frame.width, frame.height)
-        pygame.draw.rect(screen, (255, 0, 0), f, 2)
-        # Draw box in red
-        text = font.render(frame.label, True, (255, 255, 255))
-        text_height_margin = (frame.height - text.get_height()) // 2
-        text_width_margin = (frame.width - text.get_width()) // 2
+    previous_clip = screen.get_clip()
+    clip = previous_clip.clip(pygame.Rect(0, 0, width, height))
+    if not clip: return
+    screen.set_clip(clip)   # Zoomed frames may reach over the info window
+    if suggestions: draw_store(suggestions, clip, PROPOSAL_COLOR, 1)
+    draw_store(frames, clip, (255, 0, 0), 2, selected_frame)
+    screen.set_clip(previous_clip)
+
+def draw_store(store, clip, color, border, selected=None):
+    """
+    Draws the frames of a frame store, reading them from its columns.
+
+    Parameters
+    ----------
+    store : FrameStore
+        Frames to draw.
+    clip : PyGame Rect
+        Frames outside of it are skipped.
+    color : tuple
+        Border color in RGB.
+    border : int
+        Border width.
+    selected : int
+        Row of the frame drawn in green, None if there is none.
+
+    Returns
+    -------
+    None
+
+    """
+    rects = view.to_screen_rects(store.columns[:LABEL]).T.tolist()
+    # The frames are stored in image pixels, converted to the window at once
+    for index, ((x, y, w, h), label_id) in enumerate(zip(rects, store.columns[LABEL].tolist())):
+        label = store.labels[label_id]
+        if not clip.colliderect(frame_bounds(x, y, w, h, label)): continue
+        f = pygame.Rect(x, y, w, h)
+        pygame.draw.rect(screen, (0, 255, 0) if index == selected else color, f, border)
+        # Draw box in the color, or green if it is selected
+        text = text_cache.render(label, LABEL_FONT, True, (255, 255, 255))
+        text_height_margin = (h - text.get_height()) // 2
+        text_width_margin = (w - text.get_width()) // 2
         # Margins to center the text in box
-        screen.blit(text, (frame.x + text_width_margin, frame.y + text_height_margin))
+        screen.blit(text, (x + text_width_margin, y + text_height_margin))
         # Draw text
 
-def draw_info(img_width_margin, img_height_margin):
+def draw_info():
     """
     This function draws the information of the selected rectangle on the information window.
+    The coordinates are pixels of the full resolution image.
 
     Parameters
     ----------
-    img_width_margin : int
-        Margin between the image and the window to center the image.
-    img_height_margin :
-        Margin between the image and the window to center the image.
+    None
 
     Returns
     -------
     None
 
     """
-    font = pygame.font.SysFont('Comic Sans MS', 12)
+    screen.fill(bg_color, info_rect) # Erase the old information
     pygame.draw.line(screen, (0,0,0), (width, 0), (width, height), 2) # To seperate info window and image
     if selected_frame != None:
-        f = pygame.Rect(frames[selected_frame].x, frames[selected_frame].y, frames[selected_frame].width, frames[selected_frame].height)
-        pygame.draw.rect(screen, (0, 255, 0), f, 2) # Draw the selected rectangle green
-
-        x = frames[selected_frame].x
-        y = frames[selected_frame].y
-        w = frames[selected_frame].width
-        h = frames[selected_frame].height
+        x, y, w, h = frames.rect(selected_frame)
 
-        text = font.render('Top-left: (%d, %d)' % (x - img_width_margin, y - img_height_margin), False, (0, 0, 0))
+        text = text_cache.render('Top-left: (%d, %d)' % (x, y), INFO_FONT, False, (0, 0, 0))
         centered_w = (len_info - text.get_width()) // 2
         screen.blit(text,(width + centered_w, text.get_height() * 2))
         
-        text = font.render('Top-right: (%d, %d)' % (x - img_width_margin + w, y - img_height_margin), False, (0, 0, 0))
+        text = text_cache.render('Top-right: (%d, %d)' % (x + w, y), INFO_FONT, False, (0, 0, 0))
         centered_w = (len_info - text.get_width()) // 2
         screen.blit(text,(width + centered_w, text.get_height() * 4))
 
-        text = font.render('Bottom-left: (%d, %d)' % (x - img_width_margin, y - img_height_margin + h), False, (0, 0, 0))
+        text = text_cache.render('Bottom-left: (%d, %d)' % (x, y + h), INFO_FONT, False, (0, 0, 0))
         centered_w = (len_info - text.get_width()) // 2
         screen.blit(text,(width + centered_w, text.get_height() * 6))
     
-        text = font.render('Bottom-right: (%d, %d)' % (x - img_width_margin + w, y - img_height_margin + h), False, (0, 0, 0))
+        text = text_cache.render('Bottom-right: (%d, %d)' % (x + w, y + h), INFO_FONT, False, (0, 0, 0))
         centered_w = (len_info - text.get_width()) // 2
         screen.blit(text,(width + centered_w, text.get_height() * 8))
 
-        text = font.render('Width: %d' % frames[selected_frame].width, False, (0, 0, 0))
+        text = text_cache.render('Width: %d' % w, INFO_FONT, False, (0, 0, 0))
         centered_w = (len_info - text.get_width()) // 2
         screen.blit(text,(width + centered_w, text.get_height() * 10))
 
-        text = font.render('Height: %d' % frames[selected_frame].height, False, (0, 0, 0))
+        text = text_cache.render('Height: %d' % h, INFO_FONT, False, (0, 0, 0))
         centered_w = (len_info - text.get_width()) // 2
         screen.blit(text,(width + centered_w, text.get_height() * 12))
 
-        text = font.render('Label: ' + frames[selected_frame].label, False, (0, 0, 0))
+        text = text_cache.render('Label: ' + frames.label(selected_frame), INFO_FONT, False, (0, 0, 0))
         centered_w = (len_info - text.get_width()) // 2
         screen.blit(text,(width + centered_w, text.get_height() * 14))
         # Write the information
 
-def select_frame(img, img_width_margin, img_height_margin):
+    text = text_cache.render('Zoom: %d%%' % round(view.zoom * 100), INFO_FONT, False, (0, 0, 0))
+    centered_w = (len_info - text.get_width()) // 2
+    screen.blit(text,(width + centered_w, text.get_height() * 17))
+
+    if proposer is not None:
+        text = text_cache.render('Proposals: %d' % len(suggestions) if suggested else 'Proposing...', INFO_FONT, False, (0, 0, 0))
+        centered_w = (len_info - text.get_width()) // 2
+        screen.blit(text,(width + centered_w, text.get_height() * 19))
+
+    if copied_from is not None or carried is not None:
+        text = text_cache.render('Copied from %s' % copied_from if copied_from is not None else 'Tracking...', INFO_FONT, False, (0, 0, 0))
+        centered_w = (len_info - text.get_width()) // 2
+        screen.blit(text,(width + centered_w, text.get_height() * 21))
+
+def frame_bounds(x, y, w, h, label):
+    """
+    Returns the area the frame takes on the window when drawn, including its
+    border and its label which may be wider than the frame.
+
+    Parameters
+    ----------
+    x, y : int
+        Top-left corner of the frame.
+    w, h : int
+        Width and height of the frame.
+    label : string
+        Label of the frame.
+
+    Returns
+    -------
+    PyGame Rect
+        The area to redraw when the frame changes.
+
+    """
+    bounds = pygame.Rect(x, y, w, h).inflate(4, 4)
+    text = text_cache.render(label, LABEL_FONT, True, (255, 255, 255)).get_rect()
+    text.center = bounds.center
+    return bounds.union(text)
+
+def redraw(rect):
+    """
+    Draws everything that is inside the given area of the window. The
+    drawing is clipped to the area by the caller.
+
+    Parameters
+    ----------
+    rect : PyGame Rect
+        The dirty area of the window.
+
+    Returns
+    -------
+    None
+
+    """
+    with profiler.stage("draw_image"):
+        draw_image(img)
+    with profiler.stage("draw_frames"):
+        draw_frames()
+    if rubber_band is not None:
+        pygame.draw.rect(screen, (255, 0, 0), rubber_band, 2)
+    if palette is not None:
+        draw_palette()
+    if rect.colliderect(info_rect):
+        with profiler.stage("draw_info"):
+            draw_info()
+        if profiler.enabled and rect.colliderect(hud_rect):
+            draw_hud()
+
+def draw_hud():
+    """
+    Draws the median and the 99th percentile of the times of the frames and
+    of every stage at the bottom of the info window.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+
+    """
+    font = fonts.get(INFO_FONT)
+    screen.fill(bg_color, hud_rect)
+    pygame.draw.line(screen, (0, 0, 0), hud_rect.topleft, hud_rect.topright, 1)
+    lines = ["Stage  p50 / p99 ms"]
+    for name in ["frame"] + [name for name in profiler.names() if name != "frame"]:
+        summary = profiler.summary(name)
+        if summary is not None:
+            lines.append("%s  %.1f / %.1f" % (name, summary[0] * 1000, summary[1] * 1000))
+    for index, line in enumerate(lines[:HUD_LINES]):
+        text = font.render(line, False, (0, 0, 0))  # Not cached, the numbers change all the time
+        screen.blit(text, (hud_rect.left + 4, hud_rect.top + 2 + index * font.get_linesize()))
+
+def invalidate_frame(index, store=None):
+    """
+    Marks the area of a frame and the info window to be redrawn.
+
+    Parameters
+    ----------
+    index : int
+        Index of the frame in the store, if None only the info window is
+        marked.
+    store : FrameStore
+        Store of the frame, frames if None.
+
+    Returns
+    -------
+    None
+
+    """
+    if store is None: store = frames
+    if index is not None: scheduler.invalidate(frame_bounds(*view.to_screen_rect(*store.rect(index)), store.label(index)))
+    scheduler.invalidate(info_rect)
+
+def renew_lease():
+    """
+    Renews the images leased from the work queue once a third of their lease
+    is over. Every loop waiting for the user calls it, so a long drag or an
+    open label palette does not let another annotator take the image.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+
+    """
+    global lease_renewed
+    if claim_queue is None: return
+    if time.monotonic() - lease_renewed > LEASE_SECONDS / 3:
+        claim_queue.renew() # Keep the leased images while working on them
+        lease_renewed = time.monotonic()
+
+def select_frame():
     """
     This function handles the drag and drop frame selection event.
     
@@ -320,61 +965,68 @@ def select_frame(img, img_width_margin, img_height_margin):
     creates the Frame object and returns it to this function. The Frame
     object is added to global frames list.
 
+    The frame is dragged in window pixels and stored in the pixels of the
+    full resolution image.
+
     Parameters
     ----------
-    img : PyGame Surface
-        Currently selected image to annotate
-    img_width_margin : int
-        Margin between the image and the window to center the image.
-    img_height_margin :
-        Margin between the image and the window to center the image.
+    None
 
     Returns
     -------
     None
 
     """
-    global frames   # Using global frames list
-    start_pos = pygame.mouse.get_pos()  # The position when you click to select the box
-    if start_pos[0] > width: start_pos = width, start_pos[1]
-    # This is to prevent people from drawing frames on info window
+    global rubber_band   # Using the dragged frame
+    bounds = pygame.Rect(view.image_rect()).clip(pygame.Rect(0, 0, width, height))
+    # Frames can only be drawn on the visible part of the image, not on the
+    # margins or the info window
+    start_pos = clamp_point(pygame.mouse.get_pos(), bounds)  # The position when you click to select the box
     while True:
         """
-        This loop is like a sub loop of the main drawing loop. It does
-        everything the main loop does but in addition to that it draws the
-        frame with updated coordinates as you drag your mouse on the window.
+        This loop is like a sub loop of the main drawing loop. It sleeps
+        until the mouse moves and then redraws only the area of the frame
+        with the old and updated coordinates as you drag your mouse on the
+        window.
         """
 
-        draw_image(img, img_width_margin, img_height_margin)    # Draws the image on screen ( centered )
-        draw_frames()   # Draw the boxes created 
-        draw_info(img_width_margin, img_height_margin) # Draw the info window
-
-        ### These 3 are the default drawing funtions ###
-
-        curr_pos = pygame.mouse.get_pos()   # Current position of the mouse
+        curr_pos = clamp_point(pygame.mouse.get_pos(), bounds)   # Current position of the mouse
         # The frame will be drawn between the curr_pos and the start_pos
-        if curr_pos[0] > width: curr_pos = width, curr_pos[1]
-        # Handling the situation where the mouse is on info window
         x = min(start_pos[0], curr_pos[0])
         y = min(start_pos[1], curr_pos[1])
         w = abs(start_pos[0] - curr_pos[0])
         h = abs(start_pos[1] - curr_pos[1])
         f = pygame.Rect(x, y, w, h)
         # Deciding coordinates and creating a PyGame Rect object to draw.
-        pygame.draw.rect(screen, (255, 0, 0), f, 2)
-        pygame.display.flip()
-        
-        for event in pygame.event.get():
+        if f != rubber_band:
+            if rubber_band is not None: scheduler.invalidate(rubber_band.inflate(4, 4))
+            scheduler.invalidate(f.inflate(4, 4))
+            rubber_band = f
+        scheduler.present(redraw)
+        renew_lease()
+
+        for event in scheduler.wait():
             if event.type == pygame.MOUSEBUTTONUP:
                 # User stopped dragging so create the frame
                 frame = create_frame(x, y, w, h)
-                # Currently calculated coordinates
+                # Currently calculated coordinates, shown while the label is picked
+                rubber_band = None
+                scheduler.invalidate()  # The label selection box is drawn over everything
                 if frame is None: return    # If there is an error cancel
-                frames += [ frame ] # Else add frame to the frames
+                left, top = view.to_image(frame.x, frame.y)
+                right, bottom = view.to_image(frame.x + frame.width, frame.y + frame.height)
+                right, bottom = min(right, img_width), min(bottom, img_height)
+                frames.append(left, top, right - left, bottom - top, frame.label) # Else add frame to the frames
                 return  # End the function
             if event.type == pygame.QUIT:
                 sys.exit()
 
+def clamp_point(point, rect):
+    """
+    Moves a point to the closest point inside the given rectangle.
+    """
+    return min(max(point[0], rect.left), rect.right), min(max(point[1], rect.top), rect.bottom)
+
 def create_frame(x, y, w, h):
     """
     Calls a function to let user select the frames label. Then it creates
@@ -397,79 +1049,131 @@ def create_frame(x, y, w, h):
         The created Frame object after drag and drop and label selection.
 
     """
-    label = select_label(x + w, y + h, 100, 100, LABELS)
+    label = select_label(x + w, y + h)
     # Function to select the label of the frame
     if label is None: return None   # Error handling
     return Frame(x, y, h, w, label)
 
-def select_label(x, y, w, h, LABELS):
+def select_label(x, y):
     """
-    Opens a small box which consists of possible labels to select.
-    It waits for the user to select a label and after the label
-    is selected, returns the selected label.
+    Opens the label palette and waits for the user to pick a label. The
+    labels matching what is typed are listed, the ones used last first, and
+    the palette is redrawn while typing. A label is picked by clicking it,
+    by its number key before anything is typed, or with the arrow keys and
+    RETURN.
 
     Parameters
     ----------
     x : int
-        Top-left x coordinate of the label selection box.
+        Top-left x coordinate of the palette.
         ( Default is the bottom right corner of the according frame. )
     y : int
-        Top-left y coordinate of the label selection box.
+        Top-left y coordinate of the palette.
         ( Default is the bottom right corner of the according frame. )
-    w : int
-        Width of the selecting box.
-    h : int
-        Height of the selecting box.
-    LABELS : List of strings
-        Possible labels to select.
 
     Returns
     -------
     String
-        The selected label by the user.
-
-    """
-    if x + w >= width: x = width - w
-    if y + h >= height: y = height - h
-    # If box exceeds window limits then move it to the min distant valid point.
-    per_label_h = h // len(LABELS)  # Divide to get each label box's height.
-    font = pygame.font.SysFont("comicsansms", 16, True) # Set text font
-    for index, label in enumerate(LABELS):
-        lb = pygame.Rect(x, y + index * per_label_h, w, per_label_h)    # Label box
-        pygame.draw.rect(screen, (255, 255, 255), lb, 0)
-        # Draw the label box
-        pygame.draw.line(screen, (0, 0, 0), (x, y + index * per_label_h), (x + w, y + index * per_label_h), 2)
-        # This line is to seperate each label box
-        text = font.render(label, True, (0, 0, 0))
-        # Create label as a text object
-        text_height_margin = (per_label_h - text.get_height()) // 2
-        text_width_margin = (w - text.get_width()) // 2
-        # Calculate the margins to center the text in the box
-        screen.blit(text, (x + text_width_margin, y + index * per_label_h + text_height_margin))
-        # Draw the text
-    pygame.draw.line(screen, (0, 0, 0), (x, y + h), (x + w, y + h), 2)
-    pygame.draw.line(screen, (0, 0, 0), (x, y), (x, y + h), 2)
-    pygame.draw.line(screen, (0, 0, 0), (x + w, y), (x + w, y + h), 2)
-    # Borders of label box
-    pygame.display.flip() # Update screen
-    while True:
-        for event in pygame.event.get():
-            if event.type == pygame.MOUSEBUTTONUP:
-                # Return the selected label, if mouse is out of borders
-                # do nothing and wait for valid selection
-                curr_pos = pygame.mouse.get_pos()
-                if x < curr_pos[0] < x + w and y < curr_pos[1] < y + h:
-                    return LABELS[ (curr_pos[1] - y) // per_label_h ]
-            if event.type == pygame.KEYUP and event.key == pygame.K_BACKSPACE:
-                # Cancel the selection by pressing backspace
-                return None
-            if event.type == pygame.QUIT:
-                sys.exit()
+        The selected label by the user, None if the selection is cancelled
+        with ESCAPE or with BACKSPACE when nothing is typed.
+
+    """
+    global palette
+    row_height = fonts.get(LABEL_FONT).get_linesize() + 4
+    picker = LabelPicker(label_index, max(1, min(PALETTE_ROWS, len(label_index.labels))))
+    rect = pygame.Rect(x, y, palette_width, (picker.rows + 1) * row_height)   # The last row shows what is typed
+    rect.right, rect.bottom = min(rect.right, width), min(rect.bottom, height)
+    rect.left, rect.top = max(rect.left, 0), max(rect.top, 0)
+    # If the palette exceeds window limits then move it to the min distant valid point.
+    palette = picker, rect
+    pygame.key.start_text_input()
+    try:
+        while True:
+            scheduler.invalidate(rect.inflate(4, 4))
+            scheduler.present(redraw)
+            renew_lease()
+            for event in scheduler.wait():
+                label = None
+                if event.type == pygame.TEXTINPUT:
+                    if event.text in "123456789" and len(event.text) == 1 and not picker.query:
+                        label = picker.shown(int(event.text) - 1)   # Number keys pick the shown labels, once typing they are part of the query
+                    else:
+                        picker.type(event.text)
+                if event.type == pygame.KEYDOWN:
+                    if event.key in (pygame.K_UP, pygame.K_DOWN):
+                        picker.move(-1 if event.key == pygame.K_UP else 1)
+                    if event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+                        picker.move(-picker.rows if event.key == pygame.K_PAGEUP else picker.rows)
+                if event.type == pygame.KEYUP:
+                    # On release, so the main loop does not get the release of RETURN
+                    if event.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
+                        label = picker.chosen()
+                    if event.key == pygame.K_ESCAPE:
+                        return None
+                    if event.key == pygame.K_BACKSPACE and not picker.backspace():
+                        # Cancel the selection by pressing backspace when nothing is typed
+                        return None
+                if event.type == pygame.MOUSEWHEEL:
+                    picker.move(-event.y)
+                if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                    # Pick the clicked label, if mouse is out of the labels
+                    # do nothing and wait for valid selection
+                    curr_pos = pygame.mouse.get_pos()
+                    if rect.collidepoint(curr_pos):
+                        label = picker.shown((curr_pos[1] - rect.y) // row_height)
+                if event.type == pygame.QUIT:
+                    sys.exit()
+                if label is not None:
+                    label_index.use(label)
+                    return label
+    finally:
+        pygame.key.stop_text_input()
+        palette = None
+        scheduler.invalidate(rect.inflate(4, 4))
+
+def draw_palette():
+    """
+    Draws the label palette over the image, the labels which are shown with
+    their number keys while nothing is typed, the highlighted one on a blue
+    background, and what is typed in the last row.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
 
-def check_and_do_frame_adjustment():
     """
-    Checks if there is a selected frame and the valid keys are pressed,
-    if so adjusts the frame accordingly.
+    picker, rect = palette
+    row_height = fonts.get(LABEL_FONT).get_linesize() + 4
+    screen.fill((255, 255, 255), rect)
+    for row, (index, label) in enumerate(picker.visible()):
+        top = rect.y + row * row_height
+        if index == picker.active:
+            screen.fill((200, 220, 255), (rect.x, top, rect.width, row_height))
+        text = text_cache.render(label if picker.query else '%d  %s' % (row + 1, label), LABEL_FONT, True, (0, 0, 0))
+        screen.blit(text, (rect.x + 6, top + 2), (0, 0, rect.width - 12, row_height))
+        # Labels which are too long are cut at the border
+        pygame.draw.line(screen, (0, 0, 0), (rect.x, top + row_height - 1), (rect.right - 1, top + row_height - 1), 1)
+    top = rect.bottom - row_height
+    pygame.draw.line(screen, (0, 0, 0), (rect.x, top), (rect.right - 1, top), 2)
+    if picker.query:
+        text = text_cache.render(picker.query + '_', LABEL_FONT, True, (0, 0, 0))
+    else:
+        text = text_cache.render('Type to search', LABEL_FONT, True, (150, 150, 150))
+    screen.blit(text, (rect.x + 6, top + 2), (0, 0, rect.width - 12, row_height))
+    count = text_cache.render('%d' % len(picker.matches), INFO_FONT, False, (150, 150, 150))
+    screen.blit(count, (rect.right - count.get_width() - 6, top + (row_height - count.get_height()) // 2))
+    pygame.draw.rect(screen, (0, 0, 0), rect, 2)
+    # Borders of the palette
+
+def adjust_frame(key, steps):
+    """
+    Adjusts the selected frame for the given key. A step is one window pixel,
+    or one image pixel when zoomed in so far that an image pixel is bigger
+    than a window pixel. While SHIFT is held it is COARSE_STEP steps.
 
     W - Make shorter
     S - Make Taller
@@ -479,102 +1183,328 @@ def check_and_do_frame_adjustment():
 
     Parameters
     ----------
-    None
+    key : int
+        The pressed key.
+    steps : int
+        How many steps to adjust the frame by.
 
     Returns
     -------
     None
 
     """
-    keys = pygame.key.get_pressed() # Get pressed keys map
-
-    if keys[pygame.K_a] and selected_frame is not None: # A to make thinner
-        frames[selected_frame].width -= 1
-        if frames[selected_frame].width <= 0: frames[selected_frame].width = 1
-        pygame.time.delay(10)
-    if keys[pygame.K_w] and selected_frame is not None: # W to make shorter
-        frames[selected_frame].height -= 1
-        if frames[selected_frame].height <= 0: frames[selected_frame].height = 1
-        pygame.time.delay(10)
-    if keys[pygame.K_d] and selected_frame is not None: # D to make wider
-        frames[selected_frame].width += 1
-        if frames[selected_frame].x + frames[selected_frame].width > width: frames[selected_frame].width = width - frames[selected_frame].x
-        pygame.time.delay(10)
-    if keys[pygame.K_s] and selected_frame is not None: # S to make taller
-        frames[selected_frame].height += 1
-        if frames[selected_frame].y + frames[selected_frame].height > height: frames[selected_frame].height = height - frames[selected_frame].y
-        pygame.time.delay(10)
+    x, y, w, h = frames.rect(selected_frame)
+    step = steps * max(1, int(round(1 / view.zoom)))    # Image pixels, a window pixel or at least one
+    if pygame.key.get_mods() & pygame.KMOD_SHIFT: step *= COARSE_STEP
+
+    if key == pygame.K_a: # A to make thinner
+        w -= step
+        if w <= 0: w = 1
+    if key == pygame.K_w: # W to make shorter
+        h -= step
+        if h <= 0: h = 1
+    if key == pygame.K_d: # D to make wider
+        w += step
+        if x + w > img_width: w = img_width - x
+    if key == pygame.K_s: # S to make taller
+        h += step
+        if y + h > img_height: h = img_height - y
     # with size adjustements the top-left corner is always fixed
 
-    if keys[pygame.K_LEFT] and selected_frame is not None:
-        frames[selected_frame].x -= 1
-        if frames[selected_frame].x <= 0: frames[selected_frame].x = 0
-        pygame.time.delay(10)
-    if keys[pygame.K_UP] and selected_frame is not None:
-        frames[selected_frame].y -= 1
-        if frames[selected_frame].y <= 0: frames[selected_frame].y = 0
-        pygame.time.delay(10)
-    if keys[pygame.K_RIGHT] and selected_frame is not None:
-        frames[selected_frame].x += 1
-        if frames[selected_frame].x + frames[selected_frame].width > width: frames[selected_frame].x = width - frames[selected_frame].width
-        pygame.time.delay(10)
-    if keys[pygame.K_DOWN] and selected_frame is not None:
-        frames[selected_frame].y += 1
-        if frames[selected_frame].y + frames[selected_frame].height > height: frames[selected_frame].y = height - frames[selected_frame].height
-        pygame.time.delay(10)
+    if key == pygame.K_LEFT:
+        x -= step
+        if x <= 0: x = 0
+    if key == pygame.K_UP:
+        y -= step
+        if y <= 0: y = 0
+    if key == pygame.K_RIGHT:
+        x += step
+        if x + w > img_width: x = img_width - w
+    if key == pygame.K_DOWN:
+        y += step
+        if y + h > img_height: y = img_height - h
     # Move the rectangle with the arrow keys
+    frames.update(selected_frame, x, y, w, h)
+
+def check_and_do_frame_adjustment():
+    """
+    Checks if there is a selected frame and adjustment keys are held, if so
+    adjusts the frame by the steps which became due since the last check.
+    The steps depend on how long the keys are held, not on how often this is
+    called, and nothing sleeps.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+
+    """
+    if selected_frame is None: return
+    keys = pygame.key.get_pressed() # Get pressed keys map
+    now = time.perf_counter()
+    for key in list(key_repeater.held):
+        if not keys[key]:
+            key_repeater.release(key)   # Released while the window was not focused
+            continue
+        steps = key_repeater.steps(key, now)
+        if steps: adjust_frame(key, steps)
 
 
 load_flag = True    # To prevent loading the image every frame
-img_width = None    # Current image's width
-img_height = None   # Current image's height
+img_width = None    # Current image's width at full resolution
+img_height = None   # Current image's height at full resolution
 img = None  # Current image object
-img_height_margin = None    # Margin to center the image
-img_width_margin = None # Margin to center the image
-
-while True :
-
-    if load_flag:   # If the current image to display is not loaded to the RAM yet
-        img, img_width, img_height, img_width_margin, img_height_margin = load_image(IMAGES_PATH + images[curr_img])
-        # Load the image
-        load_flag = False
-        # Since image is loaded make the flag false so it will not be loaded
-        # over and over.
-    draw_image(img, img_width_margin, img_height_margin)
-    draw_frames()
-    draw_info(img_width_margin, img_height_margin)
-    pygame.display.flip()
-    # Default drawing phase
-
-    for event in pygame.event.get():
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and pygame.mouse.get_pos()[0] < width:
-            # if left clicked start frame selecting process
-            select_frame(img, img_width_margin, img_height_margin)
-
-        if event.type == pygame.MOUSEBUTTONUP and event.button == 3:
-            # if right clicked on a frame, delete it
-            curr_pos = pygame.mouse.get_pos()
-            delete_frame(curr_pos[0], curr_pos[1])
-
-        if event.type == pygame.KEYUP:
-            if event.key == pygame.K_RETURN:
-                # if RETURN key is pressed add the frames to data dict and move to the next img
-                data[images[curr_img]] = [jsonify(frame, img_width_margin, img_height_margin, img_width, img_height) for frame in frames]
-                frames = [] # Empty the old images frame list
-                selected_frame = None   # If there were any selected frames unselect it
-                curr_img += 1 # Iterate to the next image
-                load_flag = True # Since new image will be loaded make the flag True
-                if curr_img == len(images):
-                    # If there are no image left save and exit
-                    save_curr_frames()
-                    sys.exit()
-            if event.key == pygame.K_t:
-                # To select hover on a box and press T
+prefetcher = None   # Decodes the next images while the current one is annotated
+image_cache = None  # Keeps the already loaded images to navigate back and forth
+scheduler = None    # Redraws only the changed parts of the window and sleeps when idle
+ADJUSTMENT_KEYS = (pygame.K_a, pygame.K_w, pygame.K_d, pygame.K_s, pygame.K_LEFT, pygame.K_UP, pygame.K_RIGHT, pygame.K_DOWN)
+# Keys which change the selected frame while they are held
+
+def init(labels, annotator=None):
+    """
+    Opens the window, starts listing the images and loads the annotations of
+    the previous sessions. Exits if there are no images.
+
+    Parameters
+    ----------
+    labels : List of strings
+        Possible classes for objects.
+    annotator : string
+        Name of the annotator to share the images with others through the
+        work queue in QUEUE_PATH, the annotations are saved to the files of
+        this annotator. None to annotate every image alone.
+
+    Returns
+    -------
+    None
+
+    """
+    global LABELS, screen, width, height, len_info, info_rect, hud_rect, profiler, view, tile_cache, label_index, palette_width
+    global frames, images, journal, data, writer, curr_img, prefetcher, image_cache, scheduler, proposer, suggestions, claim_queue, lease_renewed, duplicates, tracker
+    LABELS = list(labels)
+    pygame.init()   # Initialize PyGame
+    pygame.display.set_caption("Object Framing Tool")   # Window title
+
+    screen_width, screen_height = pygame.display.Info().current_w, pygame.display.Info().current_h  # Resolution of screen in pixel length
+
+    size = width, height = int(screen_width * window_to_screen_ratio), int(screen_height * window_to_screen_ratio) # Window size
+    pygame.display.set_mode(size)  # Create window
+    screen = pygame.display.get_surface()   # Get window surface
+    len_info = int(width * info_ratio)  # Width of the info window
+    width = width - len_info    # width is then updated to make calculations easier,
+    # the window is created with the previous width but now will be refering to the
+    # width without info window.
+    info_rect = pygame.Rect(width - 1, 0, len_info + 1, height)
+    hud_height = HUD_LINES * fonts.get(INFO_FONT).get_linesize() + 4
+    hud_rect = pygame.Rect(width + 1, height - hud_height, len_info - 1, hud_height)
+    view = Viewport(width, height, MAX_ZOOM)
+    label_index = LabelIndex(LABELS)
+    label_font = fonts.get(LABEL_FONT)
+    palette_width = min(width // 2, max([label_font.size('0  ' + label)[0] + 12 for label in label_index.labels] + [120]))
+    profiler = StageProfiler(PROFILE, trace_path=PROFILE_TRACE)
+    atexit.register(profiler.close)
+
+    frames = FrameStore(LABELS, GRID_CELL_SIZE)
+    suggestions = FrameStore(LABELS, GRID_CELL_SIZE)
+    if PROPOSAL_PROVIDER is not None:
+        proposer = ProposalWorker(PROPOSAL_PROVIDER, ProposalCache(PROPOSALS_PATH))
+    if CARRY_FORWARD:
+        tracker = FrameTracker()
+    images = ImageIndex(IMAGES_PATH, IMAGES_RECURSIVE, manifest_path=MANIFEST_PATH)
+    if DUPLICATES is not None:
+        duplicates = load_groups(DUPLICATES_PATH)
+        if DUPLICATES == "skip":
+            # The first image of every group is annotated, the others are left out
+            images = DistinctImages(images, set(name for name, group in duplicates.items() if name != group[0]))
+    if STORE_BACKEND == "sqlite":
+        journal = SQLiteStore(STORE_PATH)   # Shared by all annotators, SQLite locks it
+    else:
+        data_path, journal_path = (DATA_PATH, JOURNAL_PATH) if annotator is None else annotator_paths(annotator)
+        journal = AnnotationJournal(data_path, journal_path, COMPACT_EVERY)
+    data = journal.load()
+    if annotator is not None:
+        claim_queue = ClaimQueue(QUEUE_PATH, annotator, LEASE_SECONDS, LEASE_BATCH)
+        claim_queue.sync(data)
+        lease_renewed = time.monotonic()    # The leases taken from now on last LEASE_SECONDS
+        images = LeasedImages(claim_queue, images)
+    writer = BackgroundWriter(journal, data, profiler)
+    atexit.register(writer.close)   # Whatever the way the program ends, write what is queued
+    prefetcher = ImagePrefetcher(load_image, PREFETCH_WORKERS)
+    image_cache = ImageCache(IMAGE_CACHE_BYTES)
+    tile_cache = ImageCache(TILE_CACHE_BYTES)
+    scheduler = RenderScheduler(screen, MAX_FPS, profiler=profiler)
+    if not images.wait_for(1):
+        print(("There are no images left to annotate in %s" if claim_queue is not None else "There are no images in %s") % IMAGES_PATH)
+        sys.exit()
+    curr_img = resume_index(images, data)
+
+def main(argv=None):
+    """
+    The main loop of the program. It sleeps until an event arrives, handles
+    it and redraws the parts of the window that changed.
+
+    Parameters
+    ----------
+    argv : List of strings
+        The labels and options, sys.argv[1:] if None.
+
+    Returns
+    -------
+    None
+
+    """
+    parser = argparse.ArgumentParser(description="Frame and label the objects in the images in %s." % IMAGES_PATH)
+    parser.add_argument("labels", nargs="*", help="possible classes of the objects")
+    parser.add_argument("--labels-file", help="more labels from a file, one per line with the subclasses indented below their class, or a JSON list or object of them")
+    parser.add_argument("--annotator", help="share the images with other annotators through %s, saving to the files of this name" % QUEUE_PATH)
+    args = parser.parse_args(argv)
+    if args.annotator is not None:
+        try:
+            annotator_paths(args.annotator)
+        except ValueError as e:
+            parser.error(str(e))
+    labels = list(args.labels)
+    if args.labels_file is not None:
+        try:
+            labels += load_labels(args.labels_file)
+        except (OSError, ValueError) as e:
+            parser.error("Could not read the labels from %s: %s" % (args.labels_file, e))
+    init(labels, args.annotator)
+    global selected_frame, curr_img, load_flag, suggested, copied_from
+    global img, img_width, img_height
+    delete_start = None # Position the right mouse button was pressed at
+    hud_updated = 0 # When the shown timings were last redrawn
+    pan_start = None    # Position the middle mouse button was pressed at while panning
+    while True :
+
+        if load_flag:   # If the current image to display is not loaded to the RAM yet
+            img = get_image(join(IMAGES_PATH, images[curr_img]))
+            img_width, img_height = img.size
+            view.set_image(img_width, img_height)   # Fitted into the window
+            # Load the image, waits for the worker if it is still decoding it
+            prefetch_after(curr_img)
+            # Start decoding the images that come after it
+            copied_from = copy_source(images[curr_img])
+            frames.load(data.get(images[curr_img], data.get(copied_from, [])), 0, 0, img_width, img_height, max(GRID_CELL_SIZE, int(GRID_CELL_SIZE / view.zoom)))
+            # Bring back the frames if the image was annotated before, or
+            # start with the frames of a near-duplicate
+            if tracker is not None: carry_frames()
+            # or with the frames of the image before it, tracked into this one
+            suggestions.clear()
+            suggested = False
+            if proposer is not None: propose_after(curr_img)
+            # Start proposing frames for it and the images after it
+            load_flag = False
+            # Since image is loaded make the flag false so it will not be loaded
+            # over and over.
+            scheduler.invalidate()  # Everything changed
+        renew_lease()
+        if proposer is not None and not suggested:
+            update_suggestions()    # Shows the proposals when the worker is done
+        if carried is not None:
+            update_carried()    # Moves the carried frames when the tracker is done
+        if profiler.enabled and time.perf_counter() - hud_updated > HUD_INTERVAL:
+            scheduler.invalidate(hud_rect)
+            hud_updated = time.perf_counter()
+        scheduler.present(redraw)
+        # Drawing phase, only the dirty parts of the window are drawn
+
+        adjusting = selected_frame is not None and bool(key_repeater.held)
+        for event in scheduler.wait(busy=adjusting):
+            # Sleeps until an event arrives unless a frame is being adjusted
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and pygame.mouse.get_pos()[0] < width:
+                # if left clicked start frame selecting process
+                select_frame()
+
+            if event.type == pygame.MOUSEWHEEL:
+                # Zoom in and out around the cursor with the mouse wheel
                 curr_pos = pygame.mouse.get_pos()
-                selected_frame = find_frame(curr_pos[0], curr_pos[1])
+                if curr_pos[0] < width and view.zoom_at(ZOOM_STEP ** event.y, curr_pos[0], curr_pos[1]):
+                    scheduler.invalidate()
+
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 2:
+                pan_start = pygame.mouse.get_pos()  # Drag with the middle button to move the image
+            if event.type == pygame.MOUSEMOTION and pan_start is not None:
+                curr_pos = pygame.mouse.get_pos()
+                if view.pan(curr_pos[0] - pan_start[0], curr_pos[1] - pan_start[1]):
+                    scheduler.invalidate()
+                pan_start = curr_pos
+            if event.type == pygame.MOUSEBUTTONUP and event.button == 2:
+                pan_start = None
+
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
+                delete_start = pygame.mouse.get_pos()  # Where right dragging started
+
+            if event.type == pygame.MOUSEBUTTONUP and event.button == 3:
+                # if right clicked on a frame, delete it, if right dragged
+                # delete the frames inside the dragged rectangle
+                curr_pos = pygame.mouse.get_pos()
+                invalidate_frame(selected_frame)
+                if delete_start is not None and max(abs(curr_pos[0] - delete_start[0]), abs(curr_pos[1] - delete_start[1])) > 3:
+                    scheduler.invalidate()
+                    delete_frames_in(min(curr_pos[0], delete_start[0]), min(curr_pos[1], delete_start[1]), abs(curr_pos[0] - delete_start[0]), abs(curr_pos[1] - delete_start[1]))
+                else:
+                    invalidate_frame(find_frame(curr_pos[0], curr_pos[1]))
+                    delete_frame(curr_pos[0], curr_pos[1])
+                delete_start = None
+
+            if event.type == pygame.KEYDOWN and event.key in ADJUSTMENT_KEYS:
+                # A tap adjusts the selected frame by one step right away
+                if selected_frame is not None:
+                    invalidate_frame(selected_frame)
+                    adjust_frame(event.key, key_repeater.press(event.key, time.perf_counter()))
+                    invalidate_frame(selected_frame)
+            if event.type == pygame.KEYUP and event.key in ADJUSTMENT_KEYS:
+                key_repeater.release(event.key)
+
+            if event.type == pygame.KEYUP:
+                if event.key == pygame.K_RETURN:
+                    # if RETURN key is pressed add the frames to data dict and move to the next img
+                    commit_curr_frames()
+                    selected_frame = None   # If there were any selected frames unselect it
+                    curr_img += 1 # Iterate to the next image
+                    load_flag = True # Since new image will be loaded make the flag True
+                    if not images.wait_for(curr_img + 1):
+                        # If there are no image left save and exit
+                        quit_tool()
+                if event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+                    # PAGE UP goes to the previous image, PAGE DOWN to the next one
+                    step = -1 if event.key == pygame.K_PAGEUP else 1
+                    if curr_img + step >= 0 and images.wait_for(curr_img + step + 1):
+                        if frames or images[curr_img] in data: commit_curr_frames()
+                        # Keep what is drawn so far, but do not mark untouched images as done
+                        selected_frame = None
+                        curr_img += step
+                        load_flag = True
+                if event.key == pygame.K_HOME:
+                    # HOME shows the whole image again
+                    view.fit()
+                    scheduler.invalidate()
+                if event.key == pygame.K_F3:
+                    # F3 shows or hides the timings of the stages
+                    profiler.enabled = not profiler.enabled
+                    scheduler.invalidate(info_rect)
+                if event.key in (pygame.K_y, pygame.K_n):
+                    # Hover on a proposed frame, Y accepts and selects it, N rejects it
+                    curr_pos = pygame.mouse.get_pos()
+                    take_suggestion(curr_pos[0], curr_pos[1], event.key == pygame.K_y)
+                if event.key == pygame.K_t:
+                    # To select hover on a box and press T
+                    curr_pos = pygame.mouse.get_pos()
+                    invalidate_frame(selected_frame)
+                    selected_frame = find_frame(curr_pos[0], curr_pos[1])
+                    invalidate_frame(selected_frame)
+
+            if event.type == pygame.QUIT:
+                quit_tool()
 
-        if event.type == pygame.QUIT:
-            save_curr_frames()
-            sys.exit()
+        if adjusting:
+            invalidate_frame(selected_frame)
+            check_and_do_frame_adjustment() # Edit the selected frame with WASD and arrows
+            invalidate_frame(selected_frame)
 
-    check_and_do_frame_adjustment() # Edit the selected frame with WASD and arrows
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Helpers to spread work over processes while streaming.
+
+ProcessPoolExecutor.map submits the whole input at once, which for a data
+set of hundreds of thousands of images means holding all of it in memory.
+ordered_map keeps only a bounded number of batches in flight and yields the
+results in input order, so output is deterministic and memory stays flat.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+
+def batched(iterable, size):
+    """
+    Splits an iterable into lists of the given size, the last one may be
+    shorter.
+
+    Parameters
+    ----------
+    iterable : iterable
+        Items to split.
+    size : int
+        Number of items in a batch.
+
+    Returns
+    -------
+    generator of Lists
+        The batches.
+
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch: return
+        yield batch
+
+
+def ordered_map(fn, iterable, workers=None, window=None, initializer=None, initargs=()):
+    """
+    Applies fn to every item in worker processes and yields the results in
+    the order of the items.
+
+    Parameters
+    ----------
+    fn : callable
+        Function to apply, has to be importable by the workers.
+    iterable : iterable
+        Items, read lazily.
+    workers : int
+        Number of processes, the number of CPUs if None. With 1 the items are
+        processed in this process.
+    window : int
+        Number of items in flight at most, four per worker if None.
+    initializer : callable
+        Called once in every worker process before any item.
+    initargs : tuple
+        Arguments of the initializer.
+
+    Returns
+    -------
+    generator
+        The results of fn.
+
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        if initializer is not None: initializer(*initargs)
+        for item in iterable:
+            yield fn(item)
+        return
+    window = window or 4 * workers
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        pending = deque()
+        for item in iterable:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,187 @@
+"""
+Timing of the stages of the main loop.
+
+Every stage, like drawing the frames or loading an image, is timed with a
+context manager and the last samples of each stage are kept, so the tool can
+show how long a frame takes while it is used. The samples can also be written
+to a CSV or JSON lines trace file to look at later. When the profiler is
+disabled a stage is a shared context manager which does nothing, so the
+instrumentation can stay in the code.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()  # Handed out by every disabled profiler
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StageProfiler:
+    """
+    Keeps the last samples of every stage and optionally writes all of them
+    to a trace file. Stages may be timed from any thread.
+
+    A frame is the time from the main loop waking up for an event until the
+    window is updated, the time spent sleeping is not part of it.
+
+    Attributes
+    ----------
+    self.enabled : bool
+        Whether anything is timed. Can be changed at any time.
+    self.window : int
+        Number of samples kept for every stage.
+    self.trace_path : string
+        Path of the trace file, None for no trace. Files ending with .csv
+        are written as CSV, others as JSON lines.
+
+    """
+    def __init__(self, enabled=False, window=600, trace_path=None):
+        self.enabled = enabled
+        self.window = window
+        self.trace_path = trace_path
+        self._samples = {}  # Stage names to deques of seconds, in the order they were first seen
+        self._frame_start = None
+        self._lock = threading.Lock()
+        self._trace = None
+        self._csv = trace_path is not None and trace_path.lower().endswith(".csv")
+        self._epoch = time.perf_counter()
+
+    def stage(self, name):
+        """
+        Returns a context manager which times the code inside it as the
+        given stage.
+
+        Parameters
+        ----------
+        name : string
+            Name of the stage.
+
+        Returns
+        -------
+        context manager
+            Does nothing if the profiler is disabled.
+
+        """
+        if not self.enabled: return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        """
+        Adds a sample to a stage.
+
+        Parameters
+        ----------
+        name : string
+            Name of the stage.
+        seconds : float
+            How long the stage took.
+
+        Returns
+        -------
+        None
+
+        """
+        if not self.enabled: return
+        samples = self._samples.get(name)
+        if samples is None:
+            with self._lock:
+                samples = self._samples.setdefault(name, deque(maxlen=self.window))
+        samples.append(seconds)
+        if self.trace_path is not None: self._write(name, seconds)
+
+    def begin_frame(self):
+        """
+        Marks that the main loop woke up to work on a new frame.
+        """
+        if self.enabled: self._frame_start = time.perf_counter()
+
+    def end_frame(self, drawn=True):
+        """
+        Marks that the frame is over, records it if it was begun and
+        something was drawn.
+        """
+        if self._frame_start is None: return
+        if drawn: self.record("frame", time.perf_counter() - self._frame_start)
+        self._frame_start = None
+
+    def names(self):
+        """
+        Returns the names of the stages with samples, in the order they were
+        first recorded.
+        """
+        with self._lock:
+            return list(self._samples)
+
+    def summary(self, name):
+        """
+        Returns the median and the 99th percentile of the kept samples of a
+        stage.
+
+        Parameters
+        ----------
+        name : string
+            Name of the stage.
+
+        Returns
+        -------
+        float, float, int
+            Median and 99th percentile in seconds and the number of samples,
+            None if there are no samples.
+
+        """
+        samples = self._samples.get(name)
+        if not samples: return None
+        ordered = sorted(list(samples))
+        count = len(ordered)
+        return ordered[(count - 1) // 2], ordered[max(0, -(-99 * count // 100) - 1)], count
+
+    def close(self):
+        """
+        Closes the trace file. Calling it again does nothing.
+        """
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+            self.trace_path = None
+
+    def _write(self, name, seconds):
+        with self._lock:
+            if self.trace_path is None: return
+            if self._trace is None:
+                directory = os.path.dirname(self.trace_path)
+                if directory: os.makedirs(directory, exist_ok=True)
+                self._trace = open(self.trace_path, "w")
+                if self._csv: self._trace.write("time,thread,stage,ms\n")
+            now = time.perf_counter() - self._epoch
+            thread = threading.current_thread().name
+            if self._csv:
+                self._trace.write("%.6f,%s,%s,%.4f\n" % (now, thread, name, seconds * 1e3))
+            else:
+                self._trace.write(json.dumps({"time": round(now, 6), "thread": thread, "stage": name, "ms": round(seconds * 1e3, 4)}) + "\n")
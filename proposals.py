@@ -0,0 +1,274 @@
+"""
+Frames suggested by a detector before an image is annotated.
+
+A proposal provider is any function which takes the name of an image and its
+path and returns frames in the format of jsonify. It can run a CPU model on
+the pixels or read the predictions of another program. The provider is given
+as "module:function" and runs in a separate worker process on the images
+which come next, so a slow model never blocks the window. The proposals are
+kept in a JSON lines cache file, a revisited image or a restarted tool does
+not compute them again.
+"""
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from annotation_core import PREDICTIONS_PATH
+
+_providers = {} # Providers imported in this process, by their spec
+_predictions = None # Modification time and contents of PREDICTIONS_PATH, read again when it changes
+
+
+def load_provider(spec):
+    """
+    Imports a proposal provider.
+
+    Parameters
+    ----------
+    spec : string
+        The provider as "module:function", the module has to be importable.
+
+    Returns
+    -------
+    callable
+        The provider.
+
+    """
+    module, _, name = spec.partition(":")
+    if not name: raise ValueError("A proposal provider is given as module:function, not %s" % spec)
+    return getattr(importlib.import_module(module), name)
+
+
+def propose(spec, name, path):
+    """
+    Runs a provider on an image, the provider is imported once per process.
+
+    Parameters
+    ----------
+    spec : string
+        The provider as "module:function".
+    name : string
+        Name of the image, as in the annotations.
+    path : string
+        Path of the image.
+
+    Returns
+    -------
+    List of lists
+        The proposed frames in the format of jsonify.
+
+    """
+    provider = _providers.get(spec)
+    if provider is None: provider = _providers[spec] = load_provider(spec)
+    return [list(entry[:5]) for entry in provider(name, path)]
+
+
+def from_predictions(name, path):
+    """
+    A provider which proposes the frames of PREDICTIONS_PATH, a file in the
+    format of the annotations written by another program.
+
+    Parameters
+    ----------
+    name : string
+        Name of the image.
+    path : string
+        Path of the image, not used.
+
+    Returns
+    -------
+    List of lists
+        The predicted frames of the image, empty if there are none.
+
+    """
+    global _predictions
+    mtime = os.stat(PREDICTIONS_PATH).st_mtime_ns
+    if _predictions is None or _predictions[0] != mtime:
+        with open(PREDICTIONS_PATH) as f:
+            _predictions = mtime, json.load(f)
+    return _predictions[1].get(name, [])
+
+
+class ProposalCache:
+    """
+    The proposals computed so far, in memory and in a JSON lines file. Every
+    line is {"image": name, "key": key, "frames": frames}, later lines win.
+
+    Attributes
+    ----------
+    self.path : string
+        Path of the cache file.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}  # name -> (key, frames)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue    # Torn write, the image is proposed again
+                    self._entries[record["image"]] = (record["key"], record["frames"])
+
+    def get(self, name, key):
+        """
+        Returns the cached proposals of an image.
+
+        Parameters
+        ----------
+        name : string
+            Name of the image.
+        key : string
+            Provider and version of the image they have to be computed with.
+
+        Returns
+        -------
+        List of lists
+            The proposals, None if they are not cached for this key.
+
+        """
+        entry = self._entries.get(name)
+        if entry is None or entry[0] != key: return None
+        return entry[1]
+
+    def put(self, name, key, frames):
+        """
+        Caches the proposals of an image and appends them to the file.
+
+        Parameters
+        ----------
+        name : string
+            Name of the image.
+        key : string
+            Provider and version of the image they were computed with.
+        frames : List of lists
+            The proposals.
+
+        Returns
+        -------
+        None
+
+        """
+        self._entries[name] = (key, frames)
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"image": name, "key": key, "frames": frames}) + "\n")
+
+
+class ProposalWorker:
+    """
+    Computes the proposals of the upcoming images in a worker process.
+
+    Attributes
+    ----------
+    self.spec : string
+        The provider as "module:function".
+    self.cache : ProposalCache
+        Where finished proposals are kept.
+    self.pending : dict
+        Futures of the images that are scheduled or running, keyed by name.
+    self.failed : dict
+        Images the provider failed on, to the key they failed with. They are
+        tried again when the tool is restarted.
+
+    """
+    def __init__(self, spec, cache, workers=1):
+        self.spec = spec
+        self.cache = cache
+        self.pending = {}
+        self.failed = {}
+        # Spawned, forking a process with a window and running threads is not safe
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def key(self, path):
+        """
+        Returns the cache key of an image, it changes with the provider and
+        when the image or PREDICTIONS_PATH is changed on disk.
+        """
+        predictions = os.stat(PREDICTIONS_PATH).st_mtime_ns if os.path.exists(PREDICTIONS_PATH) else 0
+        return "%s|%d|%d" % (self.spec, os.stat(path).st_mtime_ns, predictions)
+
+    def schedule(self, images):
+        """
+        Starts computing the proposals of the given images in the background,
+        unless they are cached. Images that are not in the list anymore are
+        cancelled if they have not started yet.
+
+        Parameters
+        ----------
+        images : List of tuples
+            Names and paths of the images, most urgent first.
+
+        Returns
+        -------
+        None
+
+        """
+        names = set(name for name, _ in images)
+        for name in list(self.pending):
+            if name not in names and self.pending[name][1].cancel():
+                del self.pending[name]
+        for name, path in images:
+            if name in self.pending: continue
+            key = self.key(path)
+            if self.cache.get(name, key) is None and self.failed.get(name) != key:
+                self.pending[name] = (key, self._executor.submit(propose, self.spec, name, path))
+
+    def get(self, name, path):
+        """
+        Returns the proposals of an image if they are ready, never waits.
+        Schedules the image if it is not cached or scheduled yet.
+
+        Parameters
+        ----------
+        name : string
+            Name of the image.
+        path : string
+            Path of the image.
+
+        Returns
+        -------
+        List of lists
+            The proposals in the format of jsonify, None if they are still
+            being computed.
+
+        """
+        key = self.key(path)
+        frames = self.cache.get(name, key)
+        if frames is not None: return frames
+        if self.failed.get(name) == key: return []
+        if name not in self.pending or self.pending[name][0] != key:
+            self.pending[name] = (key, self._executor.submit(propose, self.spec, name, path))
+        future = self.pending[name][1]
+        if not future.done(): return None
+        del self.pending[name]
+        try:
+            frames = future.result()
+        except Exception as e:
+            print("Proposing frames for %s failed: %r" % (name, e), file=sys.stderr)
+            self.failed[name] = key
+            return []
+        self.cache.put(name, key, frames)
+        return frames
+
+    def shutdown(self):
+        """
+        Cancels the scheduled images and stops the worker without waiting.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        for _, future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,203 @@
+"""
+Tile pyramids of very large images.
+
+Decoding a 30000x20000 aerial mosaic takes seconds and gigabytes of memory,
+and scaled down to the window its small objects can not be framed. Such an
+image is decoded once and stored on the disk as a pyramid: the full
+resolution image and copies of it halved again and again, every level cut
+into square tiles. The levels are memory mapped, so showing a part of the
+image at some zoom only reads the tiles of that part from the level closest
+to the zoom, however big the image is.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from journal import write_json_atomic
+
+TILE_SIZE = 256 # Length of the side of a tile in pixels
+VERSION = 1 # Changes when the layout of the files changes
+
+
+class TilePyramid:
+    """
+    A pyramid stored in a directory. Level 0 is the full resolution image,
+    every level is half the size of the one before, the last one fits in a
+    single tile. Every level is an array of tiles with the shape (rows,
+    columns, tile size, tile size, 3), tiles on the right and bottom edges
+    are padded by repeating their last pixels.
+
+    Attributes
+    ----------
+    self.directory : string
+        Directory of the pyramid.
+    self.size : int, int
+        Width and height of the full resolution image.
+    self.tile_size : int
+        Length of the side of a tile in pixels.
+    self.levels : List of NumPy memmaps
+        The tiles of every level.
+
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.size = tuple(meta["size"])
+        self.tile_size = meta["tile_size"]
+        self.levels = [np.load(os.path.join(directory, "level_%d.npy" % level), mmap_mode="r") for level in range(meta["levels"])]
+
+    @classmethod
+    def open(cls, path, cache_dir, decode, tile_size=TILE_SIZE):
+        """
+        Opens the pyramid of an image, builds it first if it is not in the
+        cache directory yet or the image changed since it was built.
+
+        Parameters
+        ----------
+        path : string
+            Path of the image.
+        cache_dir : string
+            Directory the pyramids are kept in.
+        decode : callable
+            Takes the path of the image and returns its pixels as an array
+            with the shape (height, width, 3). Only called when building.
+        tile_size : int
+            Length of the side of a tile in pixels.
+
+        Returns
+        -------
+        TilePyramid
+            The opened pyramid.
+
+        """
+        stat = os.stat(path)
+        key = "%s|%d|%d|%d|%d" % (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, tile_size, VERSION)
+        name = os.path.splitext(os.path.basename(path))[0]
+        directory = os.path.join(cache_dir, "%s-%s" % (name, hashlib.sha1(key.encode()).hexdigest()[:16]))
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            build_pyramid(decode(path), directory, tile_size)
+        return cls(directory)
+
+    def level_for(self, zoom):
+        """
+        Returns the level to show the image with at the given zoom, the
+        smallest one which still has at least one pixel per window pixel.
+
+        Parameters
+        ----------
+        zoom : float
+            Window pixels per full resolution pixel.
+
+        Returns
+        -------
+        int
+            The level.
+
+        """
+        level = 0
+        while level + 1 < len(self.levels) and zoom * (2 << level) <= 1:
+            level += 1
+        return level
+
+    def tile(self, level, row, column):
+        """
+        Returns the pixels of a tile, read from the disk when they are used.
+
+        Parameters
+        ----------
+        level : int
+            Level of the tile.
+        row, column : int
+            Position of the tile in the level.
+
+        Returns
+        -------
+        NumPy array
+            The pixels with the shape (tile size, tile size, 3).
+
+        """
+        return self.levels[level][row, column]
+
+
+def build_pyramid(pixels, directory, tile_size=TILE_SIZE):
+    """
+    Cuts an image into the tiles of every level and writes them to the
+    directory. The levels are written to a temporary directory which is
+    renamed when it is complete, so a pyramid is never half written. Only
+    a few tiles are in memory at a time besides the decoded image.
+
+    Parameters
+    ----------
+    pixels : NumPy array
+        The image with the shape (height, width, 3).
+    directory : string
+        Where to write the pyramid.
+    tile_size : int
+        Length of the side of a tile in pixels.
+
+    Returns
+    -------
+    None
+
+    """
+    height, width = pixels.shape[:2]
+    temporary = "%s.%d.%d.tmp" % (directory, os.getpid(), threading.get_ident())
+    os.makedirs(temporary)
+    try:
+        level = _tile_level(pixels, os.path.join(temporary, "level_0.npy"), tile_size)
+        count = 1
+        while level.shape[0] > 1 or level.shape[1] > 1:
+            level = _halve_level(level, os.path.join(temporary, "level_%d.npy" % count))
+            count += 1
+        del level   # Closes the memmap
+        write_json_atomic(os.path.join(temporary, "meta.json"), {"version": VERSION, "size": [width, height], "tile_size": tile_size, "levels": count})
+        try:
+            os.rename(temporary, directory)
+        except OSError:
+            # Built by another thread or process in the meantime
+            if not os.path.exists(os.path.join(directory, "meta.json")): raise
+            shutil.rmtree(temporary, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+
+
+def _tile_level(pixels, path, tile_size):
+    height, width = pixels.shape[:2]
+    rows, columns = -(-height // tile_size), -(-width // tile_size)
+    tiles = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(rows, columns, tile_size, tile_size, 3))
+    for row in range(rows):
+        strip = pixels[row * tile_size:(row + 1) * tile_size]
+        for column in range(columns):
+            block = strip[:, column * tile_size:(column + 1) * tile_size]
+            h, w = block.shape[:2]
+            tiles[row, column, :h, :w] = block
+            if w < tile_size: tiles[row, column, :h, w:] = tiles[row, column, :h, w - 1:w]
+            if h < tile_size: tiles[row, column, h:] = tiles[row, column, h - 1:h]
+    tiles.flush()
+    return tiles
+
+
+def _halve_level(tiles, path):
+    # Every tile of the next level is made of 2x2 tiles of this one, each
+    # shrunk to a quarter by averaging 2x2 pixels. The missing tiles on the
+    # edges are replaced by their neighbours, they only cover padding.
+    rows, columns, tile_size = tiles.shape[0], tiles.shape[1], tiles.shape[2]
+    half = tile_size // 2
+    next_rows, next_columns = -(-rows // 2), -(-columns // 2)
+    halved = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(next_rows, next_columns, tile_size, tile_size, 3))
+    sums = np.empty((tile_size, tile_size, 3), dtype=np.uint16)
+    for row in range(next_rows):
+        for column in range(next_columns):
+            for dy in range(2):
+                for dx in range(2):
+                    source = tiles[min(2 * row + dy, rows - 1), min(2 * column + dx, columns - 1)].astype(np.uint16)
+                    sums[dy * half:(dy + 1) * half, dx * half:(dx + 1) * half] = source[0::2, 0::2] + source[1::2, 0::2] + source[0::2, 1::2] + source[1::2, 1::2]
+            halved[row, column] = (sums + 2) >> 2
+    halved.flush()
+    return halved
@@ -0,0 +1,82 @@
+"""
+Searches the annotations in the SQLite database, and converts them between
+the database and the JSON data file.
+
+>>> python3 query.py images --label person --min 50
+>>> python3 query.py boxes --max-area 0.01
+>>> python3 query.py import [--data data/data.json]
+>>> python3 query.py export [--out data/data.json]
+"""
+import argparse
+import json
+import os
+import sys
+
+from annotation_core import DATA_PATH, JOURNAL_PATH, STORE_PATH
+from annotation_db import SQLiteStore
+from annotation_stream import iter_dataset
+from journal import write_items_atomic
+from parallel import batched
+
+BATCH_SIZE = 1000   # Images imported in one transaction
+
+
+def find_images(store, args):
+    for name, count in store.images(args.label, args.min, args.max):
+        print("%s\t%d" % (name, count))
+
+
+def find_boxes(store, args):
+    for name, frame in store.boxes(args.label, args.min_area, args.max_area):
+        print("%s\t%s" % (name, json.dumps(frame)))
+
+
+def import_json(store, args):
+    count = 0
+    for batch in batched(iter_dataset(args.data, args.journal), BATCH_SIZE):
+        store.append_many(batch)
+        count += len(batch)
+    print("Imported %d images from %s into %s" % (count, args.data, args.db))
+
+
+def export_json(store, args):
+    count = write_items_atomic(args.out, store.iter_data())
+    print("Exported %d images from %s to %s" % (count, args.db, args.out))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the annotations in the SQLite database or convert them from and to JSON.")
+    parser.add_argument("--db", default=STORE_PATH, help="annotation database (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    subparsers.required = True
+    sub = subparsers.add_parser("images", help="list the images with a number of frames, with their counts")
+    sub.add_argument("--label", help="count only the frames with this label")
+    sub.add_argument("--min", type=int, help="at least this many frames")
+    sub.add_argument("--max", type=int, help="at most this many frames")
+    sub.set_defaults(run=find_images)
+    sub = subparsers.add_parser("boxes", help="list the frames with an area, smallest first")
+    sub.add_argument("--label", help="only the frames with this label")
+    sub.add_argument("--min-area", type=float, help="area at least this ratio of the image area")
+    sub.add_argument("--max-area", type=float, help="area at most this ratio of the image area")
+    sub.set_defaults(run=find_boxes)
+    sub = subparsers.add_parser("import", help="add the annotations of the JSON data file to the database")
+    sub.add_argument("--data", default=DATA_PATH, help="annotation file (default: %(default)s)")
+    sub.add_argument("--journal", default=JOURNAL_PATH, help="journal of the latest commits (default: %(default)s)")
+    sub.set_defaults(run=import_json)
+    sub = subparsers.add_parser("export", help="write the database as a JSON data file")
+    sub.add_argument("--out", default=DATA_PATH, help="annotation file to write (default: %(default)s)")
+    sub.set_defaults(run=export_json)
+    args = parser.parse_args(argv)
+    if args.command != "import" and not os.path.exists(args.db):
+        print("There is no database at %s" % args.db, file=sys.stderr)
+        return 1
+    store = SQLiteStore(args.db)
+    try:
+        args.run(store, args)
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
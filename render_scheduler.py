@@ -0,0 +1,119 @@
+"""
+Decides when the window is redrawn and which parts of it.
+
+Instead of redrawing the whole window as fast as possible, the main loop
+sleeps until an event arrives, the parts of the window that changed are
+marked as dirty, and only those parts are redrawn and sent to the display.
+When nothing happens nothing is drawn, so an idle tool uses no CPU.
+"""
+import pygame
+
+
+class RenderScheduler:
+    """
+    Collects the dirty regions of the window and presents them with a capped
+    frame rate.
+
+    Attributes
+    ----------
+    self.screen : PyGame Surface
+        Surface of the window.
+    self.max_fps : int
+        Maximum number of redraws per second.
+    self.idle_timeout : int
+        Milliseconds to sleep at most while waiting for an event when nothing
+        is animating. Lets the main loop run its periodic work.
+    self.dirty : List of PyGame Rects
+        Regions to redraw on the next present.
+    self.profiler : StageProfiler
+        Times the frames, polling the events and updating the display. None
+        to time nothing.
+
+    """
+    max_rects = 32  # More dirty rects than this are merged into one
+
+    def __init__(self, screen, max_fps=60, idle_timeout=500, profiler=None):
+        self.screen = screen
+        self.max_fps = max_fps
+        self.idle_timeout = idle_timeout
+        self.dirty = []
+        self.clock = pygame.time.Clock()
+        self.profiler = profiler
+
+    def invalidate(self, rect=None):
+        """
+        Marks a region of the window to be redrawn.
+
+        Parameters
+        ----------
+        rect : PyGame Rect
+            Region to redraw, if None the whole window is redrawn.
+
+        Returns
+        -------
+        None
+
+        """
+        if rect is None: rect = self.screen.get_rect()
+        rect = pygame.Rect(rect).clip(self.screen.get_rect())
+        if rect.width and rect.height: self.dirty.append(rect)
+
+    def wait(self, busy=False):
+        """
+        Sleeps until an event arrives and returns it with the other pending
+        events.
+
+        Parameters
+        ----------
+        busy : bool
+            True while something changes without events, like a frame being
+            resized with a held key. Then it waits at most one frame.
+
+        Returns
+        -------
+        List of PyGame Events
+            The events, empty if it timed out.
+
+        """
+        timeout = 1000 // self.max_fps if busy else self.idle_timeout
+        event = pygame.event.wait(timeout)
+        if self.profiler is not None and (busy or event.type != pygame.NOEVENT):
+            self.profiler.begin_frame() # Woke up to work, not for the periodic timeout
+        if event.type == pygame.NOEVENT: return []
+        if self.profiler is None: return [event] + pygame.event.get()
+        with self.profiler.stage("events"):
+            return [event] + pygame.event.get()
+
+    def present(self, redraw):
+        """
+        Redraws the dirty regions and updates only them on the display. Sleeps
+        if needed so that it does not run faster than max_fps.
+
+        Parameters
+        ----------
+        redraw : callable
+            Called with a dirty PyGame Rect, has to draw everything inside it.
+            Drawing outside of it is clipped.
+
+        Returns
+        -------
+        None
+
+        """
+        if not self.dirty:
+            if self.profiler is not None: self.profiler.end_frame(drawn=False)
+            return
+        rects = self.dirty
+        if len(rects) > self.max_rects: rects = [rects[0].unionall(rects[1:])]
+        self.dirty = []
+        for rect in rects:
+            self.screen.set_clip(rect)
+            redraw(rect)
+        self.screen.set_clip(None)
+        if self.profiler is None:
+            pygame.display.update(rects)
+        else:
+            with self.profiler.stage("flip"):
+                pygame.display.update(rects)
+            self.profiler.end_frame()
+        self.clock.tick(self.max_fps)
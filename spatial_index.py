@@ -0,0 +1,217 @@
+"""
+Uniform grid index over axis aligned boxes.
+
+The window is divided into square cells and every box is registered in the
+cells it overlaps. A point query only looks at the boxes of one cell and a
+rectangle query at the boxes of the cells it covers, so hit testing does not
+slow down as the number of frames grows.
+"""
+from collections import defaultdict
+
+
+class GridIndex:
+    """
+    Spatial index of boxes, each box is stored with an item it belongs to.
+    Box edges are inclusive, a point on the border of a box is inside it.
+
+    Attributes
+    ----------
+    self.cell_size : int
+        Length of the side of a grid cell in pixels.
+
+    """
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self._cells = defaultdict(list)  # (column, row) -> items in the cell
+        self._boxes = {}    # item -> (x, y, w, h)
+        self._order = {}    # item -> insertion number, to break ties
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def __contains__(self, item):
+        return item in self._boxes
+
+    def _cell_range(self, x, y, w, h):
+        c = self.cell_size
+        return range(x // c, (x + w) // c + 1), range(y // c, (y + h) // c + 1)
+
+    def insert(self, item, x, y, w, h):
+        """
+        Adds a box to the index.
+
+        Parameters
+        ----------
+        item : hashable
+            What the box belongs to, returned by the queries.
+        x : int
+            x coordinate of the top-left corner of the box.
+        y : int
+            y coordinate of the top-left corner of the box.
+        w : int
+            Width of the box.
+        h : int
+            Height of the box.
+
+        Returns
+        -------
+        None
+
+        """
+        self._boxes[item] = (x, y, w, h)
+        self._order[item] = self._counter
+        self._counter += 1
+        columns, rows = self._cell_range(x, y, w, h)
+        for column in columns:
+            for row in rows:
+                self._cells[column, row].append(item)
+
+    def remove(self, item):
+        """
+        Removes the box of the item from the index.
+
+        Parameters
+        ----------
+        item : hashable
+            Item that was inserted.
+
+        Returns
+        -------
+        None
+
+        """
+        columns, rows = self._cell_range(*self._boxes.pop(item))
+        del self._order[item]
+        for column in columns:
+            for row in rows:
+                cell = self._cells[column, row]
+                cell.remove(item)
+                if not cell: del self._cells[column, row]
+
+    def update(self, item, x, y, w, h):
+        """
+        Moves the box of an item to its new place. The item keeps its
+        insertion order.
+
+        Parameters
+        ----------
+        item : hashable
+            Item that was inserted.
+        x, y, w, h : int
+            The new box, as in insert.
+
+        Returns
+        -------
+        None
+
+        """
+        old = self._boxes[item]
+        if old == (x, y, w, h): return
+        if self._cell_range(*old) == self._cell_range(x, y, w, h):
+            self._boxes[item] = (x, y, w, h)    # Still in the same cells
+            return
+        order = self._order[item]
+        self.remove(item)
+        self.insert(item, x, y, w, h)
+        self._order[item] = order
+
+    def clear(self):
+        """
+        Removes every box.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        self._cells.clear()
+        self._boxes.clear()
+        self._order.clear()
+
+    def query_point(self, x, y):
+        """
+        Returns the item of the smallest box containing the point, so that
+        a box nested in another one can still be picked. If boxes have the
+        same area the one inserted first wins.
+
+        Parameters
+        ----------
+        x : int
+            x of the point of interest.
+        y : int
+            y of the point of interest.
+
+        Returns
+        -------
+        hashable
+            The found item, None if no box contains the point.
+
+        """
+        best = None
+        best_key = None
+        for item in self._cells.get((x // self.cell_size, y // self.cell_size), ()):
+            bx, by, bw, bh = self._boxes[item]
+            if 0 <= x - bx <= bw and 0 <= y - by <= bh:
+                key = (bw * bh, self._order[item])
+                if best_key is None or key < best_key:
+                    best, best_key = item, key
+        return best
+
+    def candidates(self, x, y):
+        """
+        Returns the items registered in the cell of the point, without
+        checking whether their boxes contain it. For callers which test the
+        boxes themselves.
+
+        Parameters
+        ----------
+        x : int
+            x of the point of interest.
+        y : int
+            y of the point of interest.
+
+        Returns
+        -------
+        List
+            The items of the cell, must not be changed.
+
+        """
+        return self._cells.get((x // self.cell_size, y // self.cell_size), ())
+
+    def query_rect(self, x, y, w, h, contained=False):
+        """
+        Returns the items of the boxes which intersect the rectangle, in
+        insertion order.
+
+        Parameters
+        ----------
+        x, y, w, h : int
+            The rectangle, as in insert.
+        contained : bool
+            If True only the boxes completely inside the rectangle are
+            returned.
+
+        Returns
+        -------
+        List
+            The found items.
+
+        """
+        found = set()
+        columns, rows = self._cell_range(x, y, w, h)
+        for column in columns:
+            for row in rows:
+                for item in self._cells.get((column, row), ()):
+                    if item in found: continue
+                    bx, by, bw, bh = self._boxes[item]
+                    if contained:
+                        hit = x <= bx and y <= by and bx + bw <= x + w and by + bh <= y + h
+                    else:
+                        hit = bx <= x + w and x <= bx + bw and by <= y + h and y <= by + bh
+                    if hit: found.add(item)
+        return sorted(found, key=self._order.__getitem__)
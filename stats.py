@@ -0,0 +1,294 @@
+"""
+Statistics and checks of the annotations for the daily quality control.
+
+The annotation file is streamed one image at a time like in export.py and the
+frames are gathered into batches which are counted with NumPy, so neither
+the memory use nor the time per frame grows with the size of the data set.
+It reports the frames of every label, the distribution of the frames per
+image, histograms of the frame sizes and aspect ratios, and every frame which
+is malformed or out of the image. The files of several annotators are read
+by a pool of worker processes, one file each, and their counts are added up.
+
+>>> python3 stats.py [--data data/data.json] [--missing]
+>>> python3 stats.py --annotators [ANNOTATOR ...] [--workers N]
+"""
+import argparse
+import json
+import sys
+from collections import Counter
+from itertools import chain
+
+import numpy as np
+
+from annotation_core import IMAGES_PATH, IMAGES_RECURSIVE, MANIFEST_PATH, DATA_PATH, JOURNAL_PATH, EPSILON, annotator_paths, check_frames
+from annotation_stream import iter_dataset
+from image_index import ImageIndex
+from merge import find_annotators
+from parallel import batched, ordered_map
+
+BATCH_SIZE = 4096   # Images counted with NumPy at once
+SIZE_EDGES = np.linspace(0.1, 0.9, 9)   # Square root of the frame area as a ratio of the image area
+ASPECT_EDGES = 2.0 ** np.arange(-3, 4)  # Width over height of the frames, 1/8 to 8
+COUNT_EDGES = (0, 1, 2, 5, 10, 20, 50, 100) # Lower ends of the buckets of frames per image
+
+
+class DatasetStats:
+    """
+    The counts of some images, batches of images are added to it and the
+    counts of other images are merged into it.
+
+    Attributes
+    ----------
+    self.images : int
+        Number of images.
+    self.frames : int
+        Number of frames.
+    self.labels : Counter
+        Labels to their number of frames.
+    self.per_image : numpy array
+        Number of images with 0, 1, 2, ... frames.
+    self.sizes : numpy array
+        Histogram of the frame sizes over SIZE_EDGES.
+    self.aspects : numpy array
+        Histogram of the aspect ratios over ASPECT_EDGES.
+    self.problems : List of (string, int, string)
+        Image name, index and what is wrong of every bad frame. The index is
+        None if the frames of the image are not a list.
+    self.names : set of strings
+        Names of the images, None if they are not kept.
+
+    """
+    def __init__(self, keep_names=False):
+        self.images = 0
+        self.frames = 0
+        self.labels = Counter()
+        self.per_image = np.zeros(1, np.int64)
+        self.sizes = np.zeros(len(SIZE_EDGES) + 1, np.int64)
+        self.aspects = np.zeros(len(ASPECT_EDGES) + 1, np.int64)
+        self.problems = []
+        self.names = set() if keep_names else None
+
+    def add(self, batch):
+        """
+        Counts a batch of images.
+
+        Parameters
+        ----------
+        batch : List of (string, List)
+            Image names and their jsonified frames.
+
+        Returns
+        -------
+        None
+
+        """
+        if not set(type(frames) for _, frames in batch) <= {list}:
+            # Rare, images whose frames are not a list are counted without frames
+            malformed = [(name, frames) for name, frames in batch if not isinstance(frames, list)]
+            self.problems.extend((name, None, "not a list of frames but %r" % (frames,)) for name, frames in malformed)
+            batch = [(name, frames if isinstance(frames, list) else []) for name, frames in batch]
+        lengths = np.fromiter((len(frames) for _, frames in batch), np.int64, len(batch))
+        self.images += len(batch)
+        self.frames += int(lengths.sum())
+        self._add_counts(lengths)
+        if self.names is not None: self.names.update(name for name, _ in batch)
+        flat = list(chain.from_iterable(frames for _, frames in batch))
+        owners = np.repeat(np.arange(len(batch)), lengths)
+        suspects = set()
+        if set(map(type, flat)) <= {list} and set(map(len, flat)) <= {5}:
+            table = np.array(flat, object).reshape(len(flat), 5)
+            well_formed = set(map(type, table[:, :4].ravel())) <= {int, float} and set(map(type, table[:, 4])) <= {str}
+        else:
+            well_formed = False
+        if not well_formed:
+            # Rare, the malformed frames are left out one by one
+            keep = [type(frame) is list and len(frame) == 5 and type(frame[4]) is str and all(type(v) in (int, float) for v in frame[:4]) for frame in flat]
+            suspects.update(owners[~np.array(keep, bool)].tolist())
+            flat = [frame for frame, kept in zip(flat, keep) if kept]
+            owners = owners[np.array(keep, bool)]
+            table = np.array(flat, object).reshape(len(flat), 5)
+        if len(flat):
+            x, y, w, h = table[:, :4].astype(np.float64).T
+            bad = (w <= 0) | (h <= 0) | (x < -EPSILON) | (y < -EPSILON) | (x + w > 1 + EPSILON) | (y + h > 1 + EPSILON)
+            suspects.update(owners[bad].tolist())
+            good = (w > 0) & (h > 0)    # The others have no size or aspect ratio
+            self.sizes += np.bincount(np.searchsorted(SIZE_EDGES, np.sqrt(w[good] * h[good]), "right"), minlength=len(self.sizes))
+            self.aspects += np.bincount(np.searchsorted(ASPECT_EDGES, w[good] / h[good], "right"), minlength=len(self.aspects))
+            self.labels.update(Counter(table[:, 4].tolist()))
+        for position in sorted(suspects):
+            name, frames = batch[position]
+            self.problems.extend((name, index, problem) for index, problem in check_frames(frames))
+
+    def _add_counts(self, counts):
+        found = np.bincount(counts)
+        if len(found) > len(self.per_image):
+            self.per_image = np.concatenate([self.per_image, np.zeros(len(found) - len(self.per_image), np.int64)])
+        self.per_image[:len(found)] += found
+
+    def merge(self, other):
+        """
+        Adds the counts of other images.
+
+        Parameters
+        ----------
+        other : DatasetStats
+            Counts of images which are not counted here.
+
+        Returns
+        -------
+        None
+
+        """
+        self.images += other.images
+        self.frames += other.frames
+        self.labels.update(other.labels)
+        self._add_counts(np.repeat(np.arange(len(other.per_image)), other.per_image))
+        self.sizes += other.sizes
+        self.aspects += other.aspects
+        self.problems.extend(other.problems)
+        if self.names is not None: self.names.update(other.names)
+
+    def per_image_buckets(self):
+        """
+        Returns the number of images in the buckets of COUNT_EDGES, as a list
+        of (string, int) like ("5-9", 120).
+        """
+        buckets = []
+        for low, high in zip(COUNT_EDGES, COUNT_EDGES[1:] + (None,)):
+            if high is None: title = "%d+" % low
+            elif high == low + 1: title = "%d" % low
+            else: title = "%d-%d" % (low, high - 1)
+            buckets.append((title, int(self.per_image[low:high].sum())))
+        return buckets
+
+    def summary(self):
+        """
+        Returns the counts as a dict which can be written as JSON.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            The counts, the histograms are lists of {"bin": title, "count": n}.
+
+        """
+        counts = np.arange(len(self.per_image))
+        cumulative = np.cumsum(self.per_image)
+        return {
+            "images": self.images,
+            "frames": self.frames,
+            "labels": dict(self.labels.most_common()),
+            "frames_per_image": {
+                "mean": self.frames / self.images if self.images else 0.0,
+                "median": int(np.searchsorted(cumulative, (self.images + 1) // 2)) if self.images else 0,
+                "max": int(counts[self.per_image > 0].max()) if self.images else 0,
+                "histogram": [{"bin": title, "count": count} for title, count in self.per_image_buckets()],
+            },
+            "sizes": _histogram(SIZE_EDGES, self.sizes, "%.1f"),
+            "aspect_ratios": _histogram(ASPECT_EDGES, self.aspects, "%g"),
+            "bad_frames": sum(1 for _, index, _ in self.problems if index is not None),
+            "bad_images": sum(1 for _, index, _ in self.problems if index is None),
+        }
+
+
+def _histogram(edges, counts, format):
+    # Titles the bins of np.searchsorted(edges, values, "right") for positive values
+    bounds = ["0"] + [format % edge for edge in edges] + ["inf"]
+    return [{"bin": "%s to %s" % (low, high), "count": int(count)} for low, high, count in zip(bounds, bounds[1:], counts)]
+
+
+def shard_stats(job):
+    """
+    Counts the images of one data file and its journal. Runs in the worker
+    processes.
+
+    Parameters
+    ----------
+    job : (string, string, bool)
+        Paths of the data file and the journal, and whether the image names
+        are kept.
+
+    Returns
+    -------
+    DatasetStats
+        The counts of the file.
+
+    """
+    data_path, journal_path, keep_names = job
+    stats = DatasetStats(keep_names)
+    for batch in batched(iter_dataset(data_path, journal_path), BATCH_SIZE):
+        stats.add(batch)
+    return stats
+
+
+def print_report(summary, missing):
+    print("%d images, %d frames" % (summary["images"], summary["frames"]))
+    print("\nFrames per label")
+    for label, count in summary["labels"].items():
+        print("  %-24s %10d  %5.1f%%" % (label, count, 100.0 * count / summary["frames"]))
+    per_image = summary["frames_per_image"]
+    print("\nFrames per image, mean %.2f, median %d, max %d" % (per_image["mean"], per_image["median"], per_image["max"]))
+    _print_histogram(per_image["histogram"])
+    print("\nFrame size, square root of the area as a ratio of the image area")
+    _print_histogram(summary["sizes"])
+    print("\nAspect ratio, width over height in ratios of the image")
+    _print_histogram(summary["aspect_ratios"])
+    if missing is not None:
+        print("\n%d images in the image directory are not annotated" % len(missing))
+
+
+def _print_histogram(histogram):
+    for entry in histogram:
+        print("  %-16s %10d" % (entry["bin"], entry["count"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count the labels, frames per image, frame sizes and aspect ratios and report bad frames.")
+    parser.add_argument("--data", default=DATA_PATH, help="annotation file (default: %(default)s)")
+    parser.add_argument("--journal", default=JOURNAL_PATH, help="journal of the latest commits (default: %(default)s)")
+    parser.add_argument("--annotators", nargs="*", default=None, help="read the files of these annotators instead, or of every annotator found if none is given")
+    parser.add_argument("--missing", action="store_true", help="list the images which are not annotated")
+    parser.add_argument("--images", default=IMAGES_PATH, help="image directory for --missing (default: %(default)s)")
+    parser.add_argument("--json", default=None, help="also write the counts to this JSON file")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for the annotator files (default: number of CPUs)")
+    args = parser.parse_args(argv)
+    if args.annotators is None:
+        shards = [(args.data, args.journal)]
+    else:
+        annotators = args.annotators or find_annotators()
+        try:
+            shards = [annotator_paths(annotator) for annotator in annotators]
+        except ValueError as e:
+            parser.error(str(e))
+        if not shards:
+            print("No annotations of annotators found next to %s" % DATA_PATH, file=sys.stderr)
+            return 1
+
+    stats = DatasetStats(args.missing)
+    jobs = [(data_path, journal_path, args.missing) for data_path, journal_path in shards]
+    for shard in ordered_map(shard_stats, jobs, min(args.workers or len(jobs), len(jobs))):
+        stats.merge(shard)
+
+    for name, index, problem in stats.problems:
+        if index is None: print("%s: %s" % (name, problem))
+        else: print("%s: frame %d is %s" % (name, index, problem))
+    missing = None
+    if args.missing:
+        manifest_path = MANIFEST_PATH if args.images == IMAGES_PATH else None # The manifest is of IMAGES_PATH only
+        missing = [name for name in ImageIndex(args.images, IMAGES_RECURSIVE, manifest_path=manifest_path) if name not in stats.names]
+        for name in missing:
+            print("%s: not annotated" % name)
+    summary = stats.summary()
+    print_report(summary, missing)
+    if args.json is not None:
+        if missing is not None: summary["missing"] = missing
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if stats.problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,43 +1,166 @@
-import pygame
-import sys, os
-from os import listdir
-from os.path import isfile, join
-import json
-
-IMAGES_PATH = "img/"
-DATA_PATH = "data/data.json"
-
-pygame.init()
-pygame.display.set_caption("Framing Tool Test")
-
-screen_width, screen_height = pygame.display.Info().current_w, pygame.display.Info().current_h
-screen_ratio = 0.8
-
-size = width, height = int(screen_width * screen_ratio), int(screen_height * screen_ratio)
-window = pygame.display.set_mode(size)
-screen = pygame.display.get_surface()
-bg_color = (255,255,255)
-
-images = [f for f in listdir(IMAGES_PATH) if isfile(join(IMAGES_PATH, f))]
-curr_img = 0
-
-data = None
-with open(DATA_PATH, "r") as f:
-    data = json.load(f)
-
-def load():
-    image = pygame.image.load(IMAGES_PATH + images[curr_img]).convert()
-    screen.blit(image, (0, 0))
-    for frame in data[images[curr_img]]:
-        r = pygame.Rect(int(frame[0] * image.get_width()), int(frame[1] * image.get_height()), int(frame[2] * image.get_width()), int(frame[3] * image.get_height()))
-        pygame.draw.rect(screen, (255, 0, 0), r, 2)
-    pygame.display.flip()
-
-while True:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT: sys.exit()
-        if event.type == pygame.KEYUP and event.key == pygame.K_RETURN:
-            curr_img += 1
-
-    load()
-
+"""
+Checks whether the frames are at the right place, without opening a window.
+
+Every annotated image, or a random sample of them, is drawn with its frames
+on contact sheets which are saved as image files, the sheets are rendered by a
+pool of worker processes. Frames which are out of the image or have no area
+are reported for the whole data set.
+
+>>> python3 test.py [--sample N] [--out qa] [--workers N]
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Headless, has to be set before PyGame is imported
+import argparse
+import random
+import sys
+from functools import partial
+
+import pygame
+
+from annotation_core import IMAGES_PATH, DATA_PATH, JOURNAL_PATH, check_frames
+from annotation_stream import iter_dataset
+from parallel import batched, ordered_map
+
+
+def init_worker():
+    pygame.font.init()
+
+
+def render_sheet(options, job):
+    """
+    Draws a contact sheet of images with their frames and saves it. Runs in
+    the worker processes.
+
+    Parameters
+    ----------
+    options : argparse Namespace
+        Command line arguments.
+    job : (int, List)
+        Number of the sheet and the image names with their frames.
+
+    Returns
+    -------
+    List of (string, string)
+        Images which could not be loaded and why.
+
+    """
+    number, items = job
+    thumb = options.thumb
+    label_height = 16
+    rows = (len(items) + options.columns - 1) // options.columns
+    sheet = pygame.Surface((options.columns * thumb, rows * (thumb + label_height)))
+    sheet.fill((40, 40, 40))
+    font = pygame.font.Font(None, label_height)
+    problems = []
+    for position, (name, frames) in enumerate(items):
+        cell_x = (position % options.columns) * thumb
+        cell_y = (position // options.columns) * (thumb + label_height)
+        try:
+            image = pygame.image.load(os.path.join(options.images, name))
+        except (pygame.error, OSError) as error:
+            problems.append((name, "could not be loaded: %s" % error))
+            continue
+        w, h = image.get_size()
+        if image.get_bitsize() < 24:
+            # smoothscale needs 24 or 32 bit pixels, there is no display to convert to
+            converted = pygame.Surface((w, h), 0, 24)
+            converted.blit(image, (0, 0))
+            image = converted
+        scale = min(thumb / w, thumb / h)
+        image = pygame.transform.smoothscale(image, (max(1, int(w * scale)), max(1, int(h * scale))))
+        tw, th = image.get_size()   # The ratios are relative to the image, so they are scaled by its drawn size
+        sheet.blit(image, (cell_x, cell_y))
+        bad = {index for index, _ in check_frames(frames)}
+        for index, frame in enumerate(frames):
+            if index in bad and not (isinstance(frame, list) and len(frame) == 5): continue
+            try:
+                rect = pygame.Rect(cell_x + int(frame[0] * tw), cell_y + int(frame[1] * th), max(1, int(frame[2] * tw)), max(1, int(frame[3] * th)))
+            except (TypeError, ValueError):
+                continue
+            pygame.draw.rect(sheet, (255, 255, 0) if index in bad else (255, 0, 0), rect, 1)
+        caption = font.render("%s (%d)" % (name, len(frames)), True, (230, 230, 230))
+        sheet.blit(caption, (cell_x + 2, cell_y + thumb + 1))
+    pygame.image.save(sheet, os.path.join(options.out, "sheet_%05d.%s" % (number, options.format)))
+    return problems
+
+
+def sample(records, count, seed):
+    """
+    Picks a random sample of the records in one pass, keeping their order.
+
+    Parameters
+    ----------
+    records : iterable
+        Items to sample from.
+    count : int
+        Size of the sample.
+    seed : int
+        Seed of the random generator, the same seed gives the same sample.
+
+    Returns
+    -------
+    List
+        The sampled items.
+
+    """
+    rng = random.Random(seed)
+    reservoir = []
+    for index, record in enumerate(records):
+        if index < count:
+            reservoir.append((index, record))
+        else:
+            slot = rng.randint(0, index)
+            if slot < count: reservoir[slot] = (index, record)
+    return [record for _, record in sorted(reservoir, key=lambda item: item[0])]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the frames on contact sheets and report bad frames.")
+    parser.add_argument("--data", default=DATA_PATH, help="annotation file (default: %(default)s)")
+    parser.add_argument("--journal", default=JOURNAL_PATH, help="journal of the latest commits (default: %(default)s)")
+    parser.add_argument("--images", default=IMAGES_PATH, help="image directory (default: %(default)s)")
+    parser.add_argument("--out", default="qa", help="directory of the contact sheets (default: %(default)s)")
+    parser.add_argument("--sample", type=int, default=None, help="render only this many random images")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the sample (default: %(default)s)")
+    parser.add_argument("--columns", type=int, default=4, help="images in a row of a sheet (default: %(default)s)")
+    parser.add_argument("--rows", type=int, default=4, help="rows of a sheet (default: %(default)s)")
+    parser.add_argument("--thumb", type=int, default=320, help="size of an image on a sheet (default: %(default)s)")
+    parser.add_argument("--format", choices=("png", "jpg"), default="jpg", help="format of the sheets (default: %(default)s)")
+    parser.add_argument("--no-sheets", action="store_true", help="only check the frames")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: number of CPUs)")
+    options = parser.parse_args(argv)
+    os.makedirs(options.out, exist_ok=True)
+
+    stats = {"images": 0, "frames": 0, "bad": 0, "malformed": 0}
+
+    def checked():
+        # Checks every image while they stream past, on the way to rendering
+        for name, frames in iter_dataset(options.data, options.journal):
+            stats["images"] += 1
+            if not isinstance(frames, list):
+                # Not rendered, there are no frames to draw
+                stats["malformed"] += 1
+                print("%s: not a list of frames but %r" % (name, frames))
+                continue
+            stats["frames"] += len(frames)
+            for index, problem in check_frames(frames):
+                stats["bad"] += 1
+                print("%s: frame %d is %s" % (name, index, problem))
+            yield name, frames
+
+    if options.no_sheets:
+        for _ in checked(): pass
+        failures = []
+    else:
+        to_render = checked() if options.sample is None else sample(checked(), options.sample, options.seed)
+        sheets = enumerate(batched(to_render, options.columns * options.rows))
+        failures = [problem for problems in ordered_map(partial(render_sheet, options), sheets, options.workers, initializer=init_worker) for problem in problems]
+
+    for name, problem in failures:
+        print("%s: %s" % (name, problem))
+    print("Checked %d images with %d frames, %d bad frames, %d images without a list of frames, %d images could not be loaded" % (stats["images"], stats["frames"], stats["bad"], stats["malformed"], len(failures)))
+    return 1 if stats["bad"] or stats["malformed"] or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
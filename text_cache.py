@@ -0,0 +1,93 @@
+"""
+Fonts and rendered texts which are reused between redraws.
+
+pygame.font.SysFont looks the font up in the system every time it is called
+and rendering a text rasterizes every glyph of it, both of which are far more
+expensive than blitting an already rendered surface. Fonts are created once
+and rendered texts are kept, so drawing hundreds of labels is only blits.
+"""
+from collections import OrderedDict
+
+import pygame
+
+
+class FontRegistry:
+    """
+    Creates every font once and hands out the same object afterwards.
+
+    A font is described with a tuple of its name, its size and whether it is
+    bold, like ("comicsansms", 16, True).
+
+    """
+    def __init__(self):
+        self._fonts = {}
+
+    def get(self, font):
+        """
+        Returns the PyGame Font for the given description.
+
+        Parameters
+        ----------
+        font : tuple
+            Name, size and boldness of the font.
+
+        Returns
+        -------
+        PyGame Font
+            The font, created on the first request.
+
+        """
+        if font not in self._fonts:
+            name, size, bold = font
+            self._fonts[font] = pygame.font.SysFont(name, size, bold)
+        return self._fonts[font]
+
+
+class TextCache:
+    """
+    Least recently used cache of rendered texts.
+
+    Attributes
+    ----------
+    self.fonts : FontRegistry
+        Where the fonts to render with come from.
+    self.max_entries : int
+        Number of rendered texts to keep at most.
+
+    """
+    def __init__(self, fonts, max_entries=2048):
+        self.fonts = fonts
+        self.max_entries = max_entries
+        self._surfaces = OrderedDict()
+
+    def render(self, text, font, antialias, color):
+        """
+        Returns the rendered text, renders it only if it is not cached.
+
+        Parameters
+        ----------
+        text : string
+            Text to render.
+        font : tuple
+            Name, size and boldness of the font.
+        antialias : bool
+            Whether the text is rendered antialiased.
+        color : tuple
+            RGB color of the text.
+
+        Returns
+        -------
+        PyGame Surface
+            The rendered text. It is shared, so it must not be drawn on.
+
+        """
+        key = (text, font, antialias, tuple(color))
+        surface = self._surfaces.get(key)
+        if surface is None:
+            surface = self.fonts.get(font).render(text, antialias, color)
+            self._surfaces[key] = surface
+            if len(self._surfaces) > self.max_entries:
+                self._surfaces.popitem(last=False)  # Evict the least recently used
+        else:
+            self._surfaces.move_to_end(key)
+        return surface
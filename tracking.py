@@ -0,0 +1,223 @@
+"""
+Carries the frames of an image over to the next one for image sequences
+taken from a video.
+
+Consecutive video frames show the same objects moved a little. Every frame
+of the annotated image is cut out of a small grayscale version of it and
+searched for around its old place in the next image by normalized cross
+correlation, computed for all positions at once with FFTs and integral
+images. The frames are moved to where they match best, or left where they
+were if nothing matches well. It runs on a worker thread while the current
+image is annotated, so the next image usually starts with the moved frames.
+"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from dedupe import gray_thumbnail
+from image_header import image_size
+
+TRACK_SIZE = 320    # Longer side in pixels of the grayscale images the frames are tracked in
+SEARCH_MARGIN = 0.5 # A frame is searched for this many of its widths and heights around where it was
+MIN_SCORE = 0.5 # A frame which matches worse than this is not moved
+MIN_TEMPLATE = 4    # Frames narrower or lower than this many pixels of the tracking image are not moved
+
+
+def gray_image(path, size=TRACK_SIZE):
+    """
+    Decodes an image into grayscale with its longer side reduced to size,
+    keeping its aspect ratio.
+    """
+    w, h = image_size(path)
+    scale = min(1.0, size / max(w, h))
+    return gray_thumbnail(path, (max(1, round(w * scale)), max(1, round(h * scale))))
+
+
+def _box_sums(image, h, w):
+    # Sums of every h x w window of the image, from its integral image
+    integral = np.zeros((image.shape[0] + 1, image.shape[1] + 1))
+    integral[1:, 1:] = image.cumsum(0).cumsum(1)
+    return integral[h:, w:] - integral[:-h, w:] - integral[h:, :-w] + integral[:-h, :-w]
+
+
+def match_template(window, template):
+    """
+    Finds where a template matches a window best by normalized cross
+    correlation.
+
+    Parameters
+    ----------
+    window : numpy array
+        Grayscale pixels searched in, at least as big as the template.
+    template : numpy array
+        Grayscale pixels searched for.
+
+    Returns
+    -------
+    int, int
+        Row and column of the top-left corner of the best match in the
+        window.
+    float
+        Its correlation, from -1 to 1, 0 if the template has no contrast.
+
+    """
+    th, tw = template.shape
+    centered = template - template.mean()
+    norm = np.sqrt((centered ** 2).sum())
+    if norm < 1e-6: return 0, 0, 0.0
+    shape = (window.shape[0] + th - 1, window.shape[1] + tw - 1)
+    # The template has zero mean, so correlating it with the window does not
+    # need the mean of every window position
+    products = np.fft.irfft2(np.fft.rfft2(window, shape) * np.fft.rfft2(centered[::-1, ::-1], shape), shape)
+    products = products[th - 1:window.shape[0], tw - 1:window.shape[1]]
+    sums = _box_sums(window, th, tw)
+    variances = np.maximum(_box_sums(window ** 2, th, tw) - sums ** 2 / (th * tw), 0)
+    scores = np.where(variances > 1e-6, products / (np.sqrt(variances) * norm + 1e-12), 0)
+    row, column = np.unravel_index(np.argmax(scores), scores.shape)
+    return int(row), int(column), float(scores[row, column])
+
+
+def track_frames(previous_path, path, entries):
+    """
+    Moves the frames of an image to where their contents are in the next
+    image. Only their positions change, not their sizes.
+
+    Parameters
+    ----------
+    previous_path : string
+        Path of the annotated image.
+    path : string
+        Path of the image the frames are carried to.
+    entries : List
+        The jsonified frames of the annotated image.
+
+    Returns
+    -------
+    List
+        The jsonified frames moved into the next image.
+
+    """
+    previous, current = gray_image(previous_path), gray_image(path)
+    ph, pw = previous.shape
+    ch, cw = current.shape
+    tracked = []
+    for x, y, w, h, label in entries:
+        x0, y0 = int(round(x * pw)), int(round(y * ph))
+        x1, y1 = min(pw, int(round((x + w) * pw))), min(ph, int(round((y + h) * ph)))
+        if x1 - x0 < MIN_TEMPLATE or y1 - y0 < MIN_TEMPLATE:
+            tracked.append([x, y, w, h, label])
+            continue
+        # The same place in the next image, grown by the search margin
+        margin_x, margin_y = max(2, int((x1 - x0) * SEARCH_MARGIN)), max(2, int((y1 - y0) * SEARCH_MARGIN))
+        sx0, sy0 = max(0, int(round(x * cw)) - margin_x), max(0, int(round(y * ch)) - margin_y)
+        sx1, sy1 = min(cw, int(round(x * cw)) + (x1 - x0) + margin_x), min(ch, int(round(y * ch)) + (y1 - y0) + margin_y)
+        if sx1 - sx0 < x1 - x0 or sy1 - sy0 < y1 - y0:
+            tracked.append([x, y, w, h, label])
+            continue
+        row, column, score = match_template(current[sy0:sy1, sx0:sx1], previous[y0:y1, x0:x1])
+        if score < MIN_SCORE:
+            tracked.append([x, y, w, h, label])
+            continue
+        new_x = min(max(0.0, (sx0 + column) / cw), max(0.0, 1 - w))
+        new_y = min(max(0.0, (sy0 + row) / ch), max(0.0, 1 - h))
+        tracked.append([new_x, new_y, w, h, label])
+    return tracked
+
+
+class FrameTracker:
+    """
+    Tracks frames into the next image on a worker thread. Decoding with
+    Pillow or PyGame and the FFTs release the GIL, so it runs in parallel
+    with the main loop.
+
+    Attributes
+    ----------
+    self.pending : dict
+        Futures of the tracking that is scheduled or running, keyed by the
+        paths of both images and the frames.
+
+    """
+    def __init__(self):
+        self.pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tracking")
+
+    @staticmethod
+    def _key(previous_path, path, entries):
+        return previous_path, path, tuple(tuple(entry) for entry in entries)
+
+    def schedule(self, previous_path, path, entries):
+        """
+        Starts tracking frames into the next image unless it is already
+        scheduled with the same frames. Older tracking is cancelled if it has
+        not started yet, and dropped once it is done.
+
+        Parameters
+        ----------
+        previous_path : string
+            Path of the annotated image.
+        path : string
+            Path of the image the frames are carried to.
+        entries : List
+            The jsonified frames of the annotated image.
+
+        Returns
+        -------
+        None
+
+        """
+        key = self._key(previous_path, path, entries)
+        if key in self.pending: return
+        for other in list(self.pending):
+            if self.pending[other].done() or self.pending[other].cancel(): del self.pending[other]
+        self.pending[key] = self._executor.submit(track_frames, previous_path, path, [list(entry) for entry in entries])
+
+    def get(self, previous_path, path, entries):
+        """
+        Returns the tracked frames if they are ready, never waits. Schedules
+        the tracking if it is not scheduled yet.
+
+        Parameters
+        ----------
+        previous_path : string
+            Path of the annotated image.
+        path : string
+            Path of the image the frames are carried to.
+        entries : List
+            The jsonified frames of the annotated image.
+
+        Returns
+        -------
+        List
+            The tracked frames, None if they are still being tracked. If the
+            tracking failed the frames are returned unmoved.
+
+        """
+        self.schedule(previous_path, path, entries)
+        key = self._key(previous_path, path, entries)
+        future = self.pending[key]
+        if not future.done(): return None
+        del self.pending[key]
+        try:
+            return future.result()
+        except Exception as e:
+            print("Tracking the frames into %s failed: %r" % (path, e), file=sys.stderr)
+            return [list(entry) for entry in entries]
+
+    def shutdown(self):
+        """
+        Cancels the scheduled tracking and stops the worker without waiting.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,247 @@
+"""
+Mapping between the pixels of the image and the pixels of the window.
+
+Frames are stored in the coordinates of the full resolution image, so what is
+saved does not depend on the size of the window or on the zoom. The viewport
+decides which part of the image is shown in the window and converts between
+the two. Without zooming the image is fitted into the window and centered,
+zooming keeps the point under the cursor where it is.
+"""
+import math
+
+import numpy as np
+
+
+class Viewport:
+    """
+    The part of the image that is shown and its scale.
+
+    Attributes
+    ----------
+    self.width : int
+        Width of the area of the window the image is shown in.
+    self.height : int
+        Height of the area of the window the image is shown in.
+    self.max_zoom : float
+        Window pixels per image pixel at most.
+    self.image_width : int
+        Width of the full resolution image.
+    self.image_height : int
+        Height of the full resolution image.
+    self.zoom : float
+        Window pixels per image pixel.
+    self.x : float
+        x of the image pixel shown at the left edge of the area, negative if
+        there is a margin.
+    self.y : float
+        y of the image pixel shown at the top edge of the area, negative if
+        there is a margin.
+
+    """
+    def __init__(self, width, height, max_zoom=8.0):
+        self.width = width
+        self.height = height
+        self.max_zoom = max_zoom
+        self.image_width = width
+        self.image_height = height
+        self.zoom = 1.0
+        self.x = 0.0
+        self.y = 0.0
+
+    def set_image(self, image_width, image_height):
+        """
+        Shows a new image, fitted into the area.
+
+        Parameters
+        ----------
+        image_width : int
+            Width of the full resolution image.
+        image_height : int
+            Height of the full resolution image.
+
+        Returns
+        -------
+        None
+
+        """
+        self.image_width = image_width
+        self.image_height = image_height
+        self.fit()
+
+    def fit_zoom(self):
+        """
+        Returns the zoom which fits the whole image into the area, images
+        which already fit are not enlarged.
+        """
+        return min(self.width / self.image_width, self.height / self.image_height, 1.0)
+
+    def fit(self):
+        """
+        Zooms out so the whole image is shown, centered.
+        """
+        self.zoom = self.fit_zoom()
+        self._clamp()
+
+    def fitted(self):
+        """
+        Returns whether the whole image is shown.
+        """
+        return self.zoom <= self.fit_zoom()
+
+    def state(self):
+        """
+        Returns a hashable value which changes whenever the view changes.
+        """
+        return self.zoom, self.x, self.y, self.image_width, self.image_height
+
+    def zoom_at(self, factor, sx, sy):
+        """
+        Multiplies the zoom by the given factor, keeping the image pixel at
+        the given window position in place. The zoom is kept between fitting
+        the image and max_zoom.
+
+        Parameters
+        ----------
+        factor : float
+            Bigger than 1 to zoom in, smaller to zoom out.
+        sx, sy : int
+            Window position to zoom around.
+
+        Returns
+        -------
+        bool
+            Whether the view changed.
+
+        """
+        before = self.state()
+        ix, iy = self.x + sx / self.zoom, self.y + sy / self.zoom
+        self.zoom = min(max(self.zoom * factor, self.fit_zoom()), max(self.max_zoom, self.fit_zoom()))
+        self.x, self.y = ix - sx / self.zoom, iy - sy / self.zoom
+        self._clamp()
+        return self.state() != before
+
+    def pan(self, dx, dy):
+        """
+        Moves the image by the given number of window pixels.
+
+        Parameters
+        ----------
+        dx, dy : int
+            Distance to move, positive moves the image right and down.
+
+        Returns
+        -------
+        bool
+            Whether the view changed.
+
+        """
+        before = self.state()
+        self.x -= dx / self.zoom
+        self.y -= dy / self.zoom
+        self._clamp()
+        return self.state() != before
+
+    def _clamp(self):
+        # An image smaller than the area is centered, a bigger one can not be
+        # moved further than its edges
+        span = self.width / self.zoom
+        if span >= self.image_width: self.x = (self.image_width - span) / 2
+        else: self.x = min(max(self.x, 0.0), self.image_width - span)
+        span = self.height / self.zoom
+        if span >= self.image_height: self.y = (self.image_height - span) / 2
+        else: self.y = min(max(self.y, 0.0), self.image_height - span)
+
+    def to_screen(self, x, y):
+        """
+        Converts a point of the image to window pixels.
+
+        Parameters
+        ----------
+        x, y : float
+            Point in image pixels.
+
+        Returns
+        -------
+        int, int
+            The point in window pixels.
+
+        """
+        return int(math.floor((x - self.x) * self.zoom + 0.5)), int(math.floor((y - self.y) * self.zoom + 0.5))
+
+    def to_screen_rect(self, x, y, w, h):
+        """
+        Converts a rectangle of the image to window pixels, neighbouring
+        rectangles stay neighbours without gaps.
+
+        Parameters
+        ----------
+        x, y, w, h : float
+            The rectangle in image pixels.
+
+        Returns
+        -------
+        tuple of ints
+            x, y, width and height in window pixels.
+
+        """
+        left, top = self.to_screen(x, y)
+        right, bottom = self.to_screen(x + w, y + h)
+        return left, top, right - left, bottom - top
+
+    def to_screen_rects(self, rects):
+        """
+        Converts many rectangles at once, the vectorized version of
+        to_screen_rect.
+
+        Parameters
+        ----------
+        rects : NumPy array
+            Rows of x, y, width and height, one column per rectangle.
+
+        Returns
+        -------
+        NumPy array
+            Rows of x, y, width and height in window pixels.
+
+        """
+        rects = rects.astype(np.float64)
+        left = np.floor((rects[0] - self.x) * self.zoom + 0.5)
+        top = np.floor((rects[1] - self.y) * self.zoom + 0.5)
+        right = np.floor((rects[0] + rects[2] - self.x) * self.zoom + 0.5)
+        bottom = np.floor((rects[1] + rects[3] - self.y) * self.zoom + 0.5)
+        return np.array([left, top, right - left, bottom - top], dtype=np.int64)
+
+    def to_image(self, sx, sy):
+        """
+        Converts a window position to the image pixel under it.
+
+        Parameters
+        ----------
+        sx, sy : int
+            Position in window pixels.
+
+        Returns
+        -------
+        int, int
+            The image pixel, it may be outside of the image.
+
+        """
+        return int(math.floor(self.x + sx / self.zoom)), int(math.floor(self.y + sy / self.zoom))
+
+    def image_rect(self):
+        """
+        Returns where the whole image is in the window, as x, y, width and
+        height. It may be bigger than the area when zoomed in.
+        """
+        return self.to_screen_rect(0, 0, self.image_width, self.image_height)
+
+    def visible(self):
+        """
+        Returns the part of the image which is shown, in image pixels, as the
+        left, top, right and bottom edges.
+        """
+        left = max(0, int(math.floor(self.x)))
+        top = max(0, int(math.floor(self.y)))
+        right = min(self.image_width, int(math.ceil(self.x + self.width / self.zoom)))
+        bottom = min(self.image_height, int(math.ceil(self.y + self.height / self.zoom)))
+        return left, top, right, bottom
@@ -0,0 +1,289 @@
+"""
+Sharing the images between several annotators.
+
+When many instances of the tool work on the same images, each of them leases
+a batch of images from a claim table in a SQLite database, annotates them and
+marks them as done. A leased image is not given to anyone else until its
+lease times out, which only happens if the instance holding it died, so no
+image is annotated twice and the images of a crashed instance are picked up
+by the others. SQLite locks the database file, the instances only have to
+run on the same machine or share a file system with working locks.
+"""
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+
+class ClaimQueue:
+    """
+    The claim table. Every image is open, leased to an annotator until its
+    lease expires, or done by an annotator.
+
+    Attributes
+    ----------
+    self.path : string
+        Path of the database.
+    self.owner : string
+        Name of this annotator.
+    self.lease_seconds : float
+        How long a lease lasts unless it is renewed.
+    self.batch : int
+        Number of images leased at a time.
+
+    A queue opened with read_only set only reads the table of an existing
+    database, it neither creates nor changes the file.
+
+    """
+    def __init__(self, path, owner, lease_seconds=900, batch=10, read_only=False):
+        self.path = path
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.batch = batch
+        if read_only:
+            self._db = sqlite3.connect("file:%s?mode=ro" % pathname2url(os.path.abspath(path)), timeout=60, isolation_level=None, uri=True)
+            return
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")  # Readers do not block the writer
+        self._db.execute("CREATE TABLE IF NOT EXISTS images (name TEXT PRIMARY KEY, state TEXT NOT NULL DEFAULT 'open', owner TEXT, expires REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS images_state ON images (state, expires)")
+
+    @contextmanager
+    def _transaction(self):
+        # Takes the write lock at the start, so reading and then writing in
+        # the transaction can not be interleaved with another instance
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def add(self, names):
+        """
+        Adds images to the table, the ones which are in it already are left
+        as they are.
+
+        Parameters
+        ----------
+        names : iterable of strings
+            Image names.
+
+        Returns
+        -------
+        None
+
+        """
+        with self._transaction():
+            self._db.executemany("INSERT OR IGNORE INTO images (name) VALUES (?)", ((name,) for name in names))
+
+    def held(self):
+        """
+        Returns the images leased to this annotator which are not done yet,
+        in the order they were added.
+        """
+        rows = self._db.execute("SELECT name FROM images WHERE owner = ? AND state = 'leased' ORDER BY rowid", (self.owner,))
+        return [name for name, in rows]
+
+    def lease(self, count=None):
+        """
+        Leases open images, and images whose lease expired, to this
+        annotator.
+
+        Parameters
+        ----------
+        count : int
+            Number of images to lease at least, batch images are leased if
+            it is smaller or None.
+
+        Returns
+        -------
+        List of strings
+            The newly leased images in the order they were added, empty if
+            there are none left.
+
+        """
+        count = max(count or 0, self.batch)
+        now = time.time()
+        with self._transaction():  # Nobody else can lease in between
+            rows = self._db.execute("SELECT rowid, name FROM images WHERE state = 'open' OR (state = 'leased' AND expires < ?) ORDER BY rowid LIMIT ?", (now, count)).fetchall()
+            self._db.executemany("UPDATE images SET state = 'leased', owner = ?, expires = ? WHERE rowid = ?", ((self.owner, now + self.lease_seconds, rowid) for rowid, _ in rows))
+        return [name for _, name in rows]
+
+    def renew(self):
+        """
+        Extends the leases of this annotator, has to be called more often
+        than lease_seconds while it is working.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        with self._transaction():
+            self._db.execute("UPDATE images SET expires = ? WHERE owner = ? AND state = 'leased'", (time.time() + self.lease_seconds, self.owner))
+
+    def complete(self, name):
+        """
+        Marks an image as done by this annotator. It can be done again by the
+        same annotator, for example after going back to it.
+
+        Parameters
+        ----------
+        name : string
+            Image name.
+
+        Returns
+        -------
+        string
+            None if the image is done by this annotator, otherwise the name of
+            the annotator who did it first because the lease had expired.
+
+        """
+        with self._transaction():
+            updated = self._db.execute("UPDATE images SET state = 'done', owner = ?, expires = NULL WHERE name = ? AND (owner = ? OR state != 'done')", (self.owner, name, self.owner)).rowcount
+        if updated: return None
+        row = self._db.execute("SELECT owner FROM images WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, data):
+        """
+        Makes the table agree with the annotations of this annotator after a
+        crash between saving an image and marking it as done. Held images
+        which are annotated are marked as done, done images which are not
+        annotated are opened again.
+
+        Parameters
+        ----------
+        data : dict
+            The annotations of this annotator, image names to frame lists.
+
+        Returns
+        -------
+        None
+
+        """
+        rows = self._db.execute("SELECT name, state FROM images WHERE owner = ? AND state != 'open'", (self.owner,)).fetchall()
+        finished = [(name,) for name, state in rows if state == "leased" and name in data]
+        lost = [(name, self.owner) for name, state in rows if state == "done" and name not in data]
+        with self._transaction():
+            self._db.executemany("UPDATE images SET state = 'done', expires = NULL WHERE name = ?", finished)
+            self._db.executemany("UPDATE images SET state = 'open', owner = NULL, expires = NULL WHERE name = ? AND owner = ?", lost)
+
+    def release(self):
+        """
+        Gives the images leased to this annotator which are not done back, so
+        the others do not have to wait for the leases to expire.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+
+        """
+        with self._transaction():
+            self._db.execute("UPDATE images SET state = 'open', owner = NULL, expires = NULL WHERE owner = ? AND state = 'leased'", (self.owner,))
+
+    def owners(self):
+        """
+        Returns who did every done image, as a dict of image names to
+        annotator names.
+        """
+        return dict(self._db.execute("SELECT name, owner FROM images WHERE state = 'done'"))
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self._db.close()
+
+
+class LeasedImages:
+    """
+    The images leased to this annotator in the order they were leased. It can
+    be used in place of an ImageIndex: it is indexed like a list which grows,
+    wait_for leases more images when they are needed.
+
+    Attributes
+    ----------
+    self.queue : ClaimQueue
+        The claim table.
+    self.index : ImageIndex
+        All images, they are added to the table while they are listed.
+
+    """
+    def __init__(self, queue, index):
+        self.queue = queue
+        self.index = index
+        self._added = 0 # Images of the index added to the table so far
+        self._names = queue.held()  # Left over from the last session
+        self._known = set(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, index):
+        return self._names[index]
+
+    def __iter__(self):
+        index = 0
+        while self.wait_for(index + 1):
+            yield self._names[index]
+            index += 1
+
+    def wait_for(self, count):
+        """
+        Leases images until there are at least the given number of them, or
+        no image is left.
+
+        Parameters
+        ----------
+        count : int
+            Number of images needed.
+
+        Returns
+        -------
+        bool
+            True if there are at least count images.
+
+        """
+        while len(self._names) < count:
+            listed = len(self.index)
+            if listed > self._added:
+                self.queue.add(self.index[self._added:listed])
+                self._added = listed
+            for name in self.queue.lease(count - len(self._names)):
+                if name not in self._known:
+                    self._names.append(name)
+                    self._known.add(name)
+            if len(self._names) >= count: break
+            if self.index.complete and self._added == len(self.index): return False
+            self.index.wait_for(self._added + 1)    # Until more images are listed
+        return True
+
+    def complete(self, name):
+        """
+        Marks an image as done, warns if another annotator did it first.
+
+        Parameters
+        ----------
+        name : string
+            Image name.
+
+        Returns
+        -------
+        None
+
+        """
+        other = self.queue.complete(name)
+        if other is not None:
+            print("%s was annotated by %s as well, its lease had expired" % (name, other))